@@ -53,6 +53,12 @@ setup(
     include_package_data=True,
     zip_safe=False,
 
+    entry_points={
+        "console_scripts": [
+            "bds = BalancedDiscStorage.cli:main",
+        ],
+    },
+
     extras_require={
         "test": [
             "pytest",
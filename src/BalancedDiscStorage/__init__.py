@@ -7,3 +7,17 @@
 from BalancedDiscStorage.path_and_hash import PathAndHash
 from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
 from BalancedDiscStorage.balanced_disc_storage_z import BalancedDiscStorageZ
+from BalancedDiscStorage.sharded_balanced_disc_storage import ShardedBalancedDiscStorage
+from BalancedDiscStorage.rebalancer import Rebalancer
+from BalancedDiscStorage.fd_cache import FDCache
+from BalancedDiscStorage.object_reader import ObjectReader
+from BalancedDiscStorage.packed_balanced_disc_storage import PackedBalancedDiscStorage
+from BalancedDiscStorage.ref_counter import RefCounter
+from BalancedDiscStorage.instrumentation import Instrumentation
+from BalancedDiscStorage.instrumentation import StatsdExporter
+from BalancedDiscStorage.tiered_storage import TieredBalancedDiscStorage
+from BalancedDiscStorage.journal import ChangeJournal
+from BalancedDiscStorage.journal import JournalReader
+from BalancedDiscStorage.mirror import Mirror
+from BalancedDiscStorage.http_server import BlobHTTPServer
+from BalancedDiscStorage.space_budget import SpaceBudget
@@ -5,10 +5,26 @@
 #
 # Imports =====================================================================
 import os
+import re
+import errno
 import shutil
 import hashlib
-
+import threading
+from multiprocessing.pool import ThreadPool
+
+from BalancedDiscStorage.fd_cache import FDCache
+from BalancedDiscStorage.compression import SUFFIXES
+from BalancedDiscStorage.compression import get_codec
+from BalancedDiscStorage.compression import codec_for_name
+from BalancedDiscStorage.compression import DecompressingReader
 from BalancedDiscStorage.path_and_hash import PathAndHash
+from BalancedDiscStorage.object_reader import ObjectReader
+from BalancedDiscStorage.space_budget import NULL_RESERVATION
+from BalancedDiscStorage.instrumentation import NULL_TIMER
+
+
+# Variables ===================================================================
+_OBJECT_NAME_RE = re.compile(r"^([0-9a-f]+_[0-9a-f]+)(\.gz|\.zst|\.lz4)?$")
 
 
 # Functions & classes =========================================================
@@ -17,7 +33,7 @@ class BalancedDiscStorage(object):
     Store files, make sure, that there are never more files in one directory
     than :attr:`_dir_limit`.
     """
-    def __init__(self, path, dir_limit=32000):
+    def __init__(self, path, dir_limit=32000, fd_budget=64):
         self.path = path  #: Path on which the storage operates.
         self._assert_path_is_rw()
 
@@ -25,6 +41,34 @@ class BalancedDiscStorage(object):
         self.read_bs = 2**16  #: File read blocksize.
         self.hash_builder = hashlib.sha256  #: Hashing function used for FN.
 
+        #: Cache of the descriptors used by :meth:`open_by_hash` and others.
+        self.fd_cache = FDCache(max_fds=fd_budget)
+
+        #: Name of the codec (see :mod:`.compression`) used to compress the
+        #: added files. None means no compression.
+        self.compression = None
+
+        #: Compress only files, which first block shrinks at least this much.
+        self.compression_ratio = 0.8
+
+        #: Don't compress files smaller than this.
+        self.compression_min_size = 512
+
+        #: Optional :class:`.RefCounter`. When set, the file is removed only
+        #: after it was deleted as many times, as it was added.
+        self.ref_counter = None
+
+        #: Optional :class:`.Instrumentation` measuring the hot paths.
+        self.instrumentation = None
+
+        #: Optional :class:`.ChangeJournal`, to which the added and removed
+        #: objects are recorded.
+        self.journal = None
+
+        #: Optional :class:`.SpaceBudget`. When set, writes, which wouldn't
+        #: fit to the filesystem, are rejected before the file is hashed.
+        self.space_budget = None
+
     def _assert_path_is_rw(self):
         """
         Make sure, that `self.path` exists, is directory a readable/writeable.
@@ -47,6 +91,67 @@ class BalancedDiscStorage(object):
                 "Can't access `%s`, please check permissions." % self.path
             )
 
+    def _timed(self, name):
+        """
+        Return context manager measuring the operation `name` by
+        :attr:`instrumentation`, or no-op context manager if it is not set.
+        """
+        if self.instrumentation is None:
+            return NULL_TIMER
+
+        return self.instrumentation.timed(name)
+
+    def _reserve_space(self, size, inodes):
+        """
+        Reserve space for the write in :attr:`space_budget`, if it is set.
+
+        Args:
+            size (int): Number of bytes.
+            inodes (int): Number of created files.
+
+        Returns:
+            obj: Context manager, which holds the reservation.
+
+        Raises:
+            IOError: With ``errno.ENOSPC``, if the write wouldn't fit.
+        """
+        if self.space_budget is None:
+            return NULL_RESERVATION
+
+        # new directory may be created for the file
+        return self.space_budget.reserve(size, inodes + 1)
+
+    @staticmethod
+    def _file_size(file_obj):
+        """
+        Return size of the `file_obj`, without reading it.
+        """
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+
+        return size
+
+    def _record_change(self, op, path, file_hash=None):
+        """
+        Record change of the object in `path` to the :attr:`journal`, if it
+        is set.
+
+        Args:
+            op (str): ``"add"`` or ``"del"``.
+            path (str): Path of the object in storage.
+            file_hash (str, default None): Hash of the object. Taken from the
+                      name of the object, if not set.
+        """
+        if self.journal is None:
+            return
+
+        path = path.rstrip("/")
+        if file_hash is None:
+            file_hash = os.path.basename(path).split(".")[0]
+
+        self.journal.append(op, file_hash, os.path.relpath(path, self.path))
+
     def _get_file_iterator(self, file_obj):
         """
         For given `file_obj` return iterator, which will read the file in
@@ -60,7 +165,14 @@ class BalancedDiscStorage(object):
         """
         file_obj.seek(0)
 
-        return iter(lambda: file_obj.read(self.read_bs), '')
+        while True:
+            piece = file_obj.read(self.read_bs)
+
+            # both '' and b'' mark the end of the file (py2 / py3)
+            if not piece:
+                return
+
+            yield piece
 
     def _get_hash(self, file_obj):
         """
@@ -74,12 +186,17 @@ class BalancedDiscStorage(object):
         """
         size = 0
         hash_buider = self.hash_builder()
-        for piece in self._get_file_iterator(file_obj):
-            hash_buider.update(piece)
-            size += len(piece)
+
+        with self._timed("get_hash"):
+            for piece in self._get_file_iterator(file_obj):
+                hash_buider.update(piece)
+                size += len(piece)
 
         file_obj.seek(0)
 
+        if self.instrumentation is not None:
+            self.instrumentation.count("bytes_hashed", size)
+
         return "%s_%x" % (hash_buider.hexdigest(), size)
 
     @staticmethod
@@ -97,6 +214,28 @@ class BalancedDiscStorage(object):
         assert hasattr(file_obj, "read"), ERR
         assert hasattr(file_obj, "seek"), ERR
 
+    @staticmethod
+    def _stored_name(file_hash, files):
+        """
+        Find name of the file / directory for `file_hash` in `files` listing.
+        Compressed files are stored with suffix of their codec.
+
+        Args:
+            file_hash (str): Hash of the file.
+            files (set): Names in the directory.
+
+        Returns:
+            str: Name of the object, or None if it is not in `files`.
+        """
+        if file_hash in files:
+            return file_hash
+
+        for suffix in SUFFIXES:
+            if file_hash + suffix in files:
+                return file_hash + suffix
+
+        return None
+
     def _create_dir_path(self, file_hash, path=None, hash_list=None):
         """
         Create proper filesystem paths for given `file_hash`.
@@ -112,7 +251,8 @@ class BalancedDiscStorage(object):
         """
         # first, non-recursive call - parse `file_hash`
         if hash_list is None:
-            hash_list = list(file_hash)
+            with self._timed("create_dir_path"):
+                return self._create_dir_path(file_hash, path, list(file_hash))
 
         if not hash_list:
             raise IOError("Directory structure is too full!")
@@ -126,17 +266,27 @@ class BalancedDiscStorage(object):
 
         # if the path not yet exists, create it and work on it
         if not os.path.exists(path):
-            os.mkdir(path)
+            try:
+                os.mkdir(path)
+            except OSError as e:
+                # directory may be created by concurrent writer
+                if e.errno != errno.EEXIST:
+                    raise
+
             return self._create_dir_path(
                 file_hash=file_hash,
                 path=path,
                 hash_list=hash_list
             )
 
-        files = os.listdir(path)
+        files = set(os.listdir(path))
+
+        if self.instrumentation is not None:
+            self.instrumentation.count("listdir_calls")
+            self.instrumentation.count("listdir_entries", len(files))
 
         # file is already in storage
-        if file_hash in files:
+        if self._stored_name(file_hash, files):
             return path
 
         # if the directory is not yet full, use it
@@ -182,11 +332,16 @@ class BalancedDiscStorage(object):
                 hash_list.pop(0)
             )
 
-        files = os.listdir(path)
+        files = set(os.listdir(path))
+
+        if self.instrumentation is not None:
+            self.instrumentation.count("listdir_calls")
+            self.instrumentation.count("listdir_entries", len(files))
 
         # is the file/unpacked archive in this `path`?
-        if file_hash in files:
-            full_path = os.path.join(path, file_hash)
+        stored_name = self._stored_name(file_hash, files)
+        if stored_name:
+            full_path = os.path.join(path, stored_name)
 
             if os.path.isfile(full_path):
                 return PathAndHash(path=full_path, hash=file_hash)
@@ -205,6 +360,206 @@ class BalancedDiscStorage(object):
             hash_list=hash_list
         )
 
+    def stat_by_hash(self, file_hash):
+        """
+        Return size and type of the object identified by `file_hash`, without
+        opening it.
+
+        Args:
+            file_hash (str): Hash of the object.
+
+        Returns:
+            tuple: ``(size, is_archive)``. Size of the object in bytes and \
+                   True for unpacked archives.
+
+        Raises:
+            IOError: If the object is not in storage.
+        """
+        path = self.file_path_from_hash(file_hash)
+        size = int(file_hash.rsplit("_", 1)[1], 16)
+
+        return size, path.endswith("/")
+
+    def _open_for_reading(self, file_hash):
+        """
+        Open file identified by `file_hash` for reading.
+
+        Args:
+            file_hash (str): Hash of the file.
+
+        Returns:
+            tuple: ``(fd, codec)``, read-only file descriptor and \
+                   :class:`.Codec` of the compressed file, or None.
+
+        Raises:
+            IOError: If the file is not in storage, or it is an archive.
+        """
+        path = self.file_path_from_hash(file_hash)
+
+        if not os.path.isfile(path):
+            raise IOError("`%s` is not a file!" % file_hash)
+
+        return os.open(path, os.O_RDONLY), codec_for_name(path)
+
+    def open_by_hash(self, file_hash):
+        """
+        Open file identified by `file_hash` for reading. Descriptors of the
+        recently used files are cached, so the hot files skip both the
+        :meth:`file_path_from_hash` and ``open()``. Compressed files are
+        transparently decompressed.
+
+        Note:
+            Close the returned object, or use it as context manager.
+
+        Args:
+            file_hash (str): Hash of the file.
+
+        Returns:
+            obj: Read-only file-like :class:`.ObjectReader` \
+                 (:class:`.DecompressingReader` for compressed files).
+
+        Raises:
+            IOError: If the file is not in storage, or it is an archive.
+        """
+        entry = self.fd_cache.acquire(file_hash, self._open_for_reading)
+
+        reader = ObjectReader(
+            fd=entry.fd,
+            start=0,
+            length=entry.size,
+            lock=entry.lock,
+            on_close=lambda: self.fd_cache.release(entry),
+        )
+
+        if entry.info:
+            return DecompressingReader(reader, entry.info, self.read_bs)
+
+        return reader
+
+    def read_range(self, file_hash, offset, length):
+        """
+        Read part of the file identified by `file_hash`.
+
+        Args:
+            file_hash (str): Hash of the file.
+            offset (int): Where to start reading.
+            length (int): How many bytes to read.
+
+        Returns:
+            str: Read data. May be shorter than `length` at the end of file.
+        """
+        entry = self.fd_cache.acquire(file_hash, self._open_for_reading)
+
+        try:
+            reader = ObjectReader(entry.fd, 0, entry.size, lock=entry.lock)
+            if entry.info:
+                reader = DecompressingReader(reader, entry.info, self.read_bs)
+
+            reader.seek(offset)
+
+            return reader.read(length)
+        finally:
+            self.fd_cache.release(entry)
+
+    def send_to_socket(self, file_hash, sock, offset=0, length=None):
+        """
+        Send the file identified by `file_hash` to the `sock`. ``sendfile()``
+        is used if the platform supports it and the file is not compressed.
+
+        Args:
+            file_hash (str): Hash of the file.
+            sock (obj): Connected blocking socket.
+            offset (int, default 0): Where to start.
+            length (int, default None): How many bytes to send. None means to
+                   the end of file.
+
+        Returns:
+            int: Number of bytes sent.
+        """
+        entry = self.fd_cache.acquire(file_hash, self._open_for_reading)
+
+        try:
+            if entry.info:
+                return self._send_stream(
+                    self.open_by_hash(file_hash),
+                    sock,
+                    offset,
+                    length
+                )
+
+            return self._send_fd(entry, 0, entry.size, sock, offset, length)
+        finally:
+            self.fd_cache.release(entry)
+
+    def _send_fd(self, entry, start, size, sock, offset, length):
+        """
+        Send part of the object stored at `start` of the cached descriptor
+        `entry` to the `sock`, using ``sendfile()`` where available.
+
+        Args:
+            entry (obj): Cached descriptor from :attr:`fd_cache`.
+            start (int): Offset of the object in the file.
+            size (int): Size of the object.
+            sock (obj): Connected blocking socket.
+            offset (int): Where to start, relative to the object.
+            length (int): How many bytes to send. None means to the end.
+
+        Returns:
+            int: Number of bytes sent.
+        """
+        if length is None:
+            length = size - offset
+        length = max(min(length, size - offset), 0)
+
+        if not hasattr(os, "sendfile"):
+            return self._send_stream(
+                ObjectReader(entry.fd, start, size, lock=entry.lock),
+                sock,
+                offset,
+                length
+            )
+
+        sent = 0
+        while sent < length:
+            sent_now = os.sendfile(
+                sock.fileno(),
+                entry.fd,
+                start + offset + sent,
+                length - sent
+            )
+            if not sent_now:
+                break
+
+            sent += sent_now
+
+        return sent
+
+    def _send_stream(self, reader, sock, offset, length):
+        """
+        Send `length` bytes from `offset` of the `reader` to the `sock`,
+        using plain ``read()`` and ``sendall()``. The `reader` is closed.
+
+        Returns:
+            int: Number of bytes sent.
+        """
+        with reader:
+            reader.seek(offset)
+
+            sent = 0
+            while length is None or sent < length:
+                size = self.read_bs
+                if length is not None:
+                    size = min(size, length - sent)
+
+                piece = reader.read(size)
+                if not piece:
+                    break
+
+                sock.sendall(piece)
+                sent += len(piece)
+
+        return sent
+
     def add_file(self, file_obj):
         """
         Add new file into the storage.
@@ -218,28 +573,194 @@ class BalancedDiscStorage(object):
 
         Raises:
             AssertionError: If the `file_obj` is not file-like object.
-            IOError: If the file couldn't be added to storage.
+            IOError: If the file couldn't be added to storage, or there is \
+                     not enough space (see :attr:`space_budget`).
         """
         BalancedDiscStorage._check_interface(file_obj)
 
+        # reject early, the space is reserved by _write_file()
+        if self.space_budget is not None:
+            self.space_budget.check(self._file_size(file_obj), 2)
+
         file_hash = self._get_hash(file_obj)
+
+        return self._add_hashed_file(file_obj, file_hash)
+
+    def _add_hashed_file(self, file_obj, file_hash):
+        """
+        Add new file, which was already hashed, into the storage and add
+        reference to it (see :attr:`ref_counter`).
+
+        Args:
+            file_obj (file): Opened file-like object.
+            file_hash (str): Hash of the `file_obj` (see :meth:`_get_hash`).
+
+        Returns:
+            obj: Path where the file-like object is stored contained with hash\
+                 in :class:`.PathAndHash` object.
+        """
+        if self.ref_counter is None:
+            return self._write_file(file_obj, file_hash)
+
+        with self.ref_counter.lock_for(file_hash):
+            path = self._write_file(file_obj, file_hash)
+            self.ref_counter.increment(file_hash)
+
+        return path
+
+    def _write_file(self, file_obj, file_hash):
+        """
+        Write the `file_obj` with known `file_hash` into the storage and
+        record it to the :attr:`journal`. Space for the write is reserved in
+        the :attr:`space_budget` first. All writes of the files (also the
+        copies made by :class:`.ShardedBalancedDiscStorage` and
+        :class:`.TieredBalancedDiscStorage`) go through this method.
+
+        Args:
+            file_obj (file): Opened file-like object.
+            file_hash (str): Hash of the `file_obj` (see :meth:`_get_hash`).
+
+        Returns:
+            obj: Path where the file-like object is stored contained with hash\
+                 in :class:`.PathAndHash` object.
+
+        Raises:
+            IOError: With ``errno.ENOSPC``, if the file wouldn't fit (see \
+                     :attr:`space_budget`).
+        """
+        # size of the content is a part of the hash
+        size = int(file_hash.rsplit("_", 1)[1], 16)
+
+        with self._reserve_space(size, 1):
+            return self._store_file(file_obj, file_hash)
+
+    def _store_file(self, file_obj, file_hash):
+        """
+        Write the `file_obj` into the storage, see :meth:`_write_file`.
+        """
+        codec = self._pick_codec(file_obj)
         dir_path = self._create_dir_path(file_hash)
 
         final_path = os.path.join(dir_path, file_hash)
+        if codec:
+            final_path += codec.suffix
 
         def copy_to_file(from_file, to_path):
+            compressor = codec.compressor() if codec else None
+
             with open(to_path, "wb") as out_file:
                 for part in self._get_file_iterator(from_file):
+                    if compressor:
+                        part = compressor.compress(part)
+
                     out_file.write(part)
 
+                if compressor:
+                    out_file.write(compressor.flush())
+
+        # never write into the existing object - it may be hard linked from
+        # the archives (see BalancedDiscStorageZ.dedup_members), or read /
+        # written by concurrent thread
+        tmp_path = "%s.%d.%d.bds_tmp" % (
+            final_path,
+            os.getpid(),
+            threading.current_thread().ident
+        )
         try:
-            copy_to_file(from_file=file_obj, to_path=final_path)
+            with self._timed("copy"):
+                copy_to_file(from_file=file_obj, to_path=tmp_path)
+
+            os.rename(tmp_path, final_path)
         except Exception:
-            os.unlink(final_path)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
             raise
 
+        if self.instrumentation is not None:
+            self.instrumentation.count(
+                "bytes_written",
+                os.path.getsize(final_path)
+            )
+
+        # file may be already stored in different format
+        for stored_name in [file_hash] + [file_hash + s for s in SUFFIXES]:
+            stored_path = os.path.join(dir_path, stored_name)
+
+            if stored_path != final_path and os.path.isfile(stored_path):
+                os.unlink(stored_path)
+
+        self._record_change("add", final_path, file_hash)
+
         return PathAndHash(path=final_path, hash=file_hash)
 
+    def _pick_codec(self, file_obj):
+        """
+        Decide, whether the `file_obj` should be compressed. Trial compression
+        of the first :attr:`read_bs` block have to shrink it at least to
+        :attr:`compression_ratio`.
+
+        Args:
+            file_obj (file): Opened file-like object.
+
+        Returns:
+            obj: :class:`.Codec`, or None if the file shouldn't be compressed.
+        """
+        if not self.compression:
+            return None
+
+        codec = get_codec(self.compression)
+
+        file_obj.seek(0)
+        block = file_obj.read(self.read_bs)
+        file_obj.seek(0)
+
+        if len(block) < self.compression_min_size:
+            return None
+
+        if len(codec.compress(block)) > len(block) * self.compression_ratio:
+            return None
+
+        return codec
+
+    def _sidecar_paths(self, path):
+        """
+        Return paths of the auxiliary files, which belong to the object stored
+        in `path` and have to be moved / removed together with it.
+
+        Args:
+            path (str): Path of the object in storage.
+
+        Returns:
+            list: List of paths. Blank in this class.
+        """
+        return []
+
+    def iter_paths(self):
+        """
+        Iterate over all objects in the storage.
+
+        Yields:
+            obj: Path of each stored file / unpacked archive contained with \
+                 hash in :class:`.PathAndHash` object.
+        """
+        for dir_path, dir_names, file_names in os.walk(self.path):
+            for file_name in file_names:
+                match = _OBJECT_NAME_RE.match(file_name)
+                if match:
+                    yield PathAndHash(
+                        path=os.path.join(dir_path, file_name),
+                        hash=match.group(1),
+                    )
+
+            # unpacked archives are objects too, but don't look inside them
+            for dir_name in list(dir_names):
+                if _OBJECT_NAME_RE.match(dir_name):
+                    dir_names.remove(dir_name)
+                    yield PathAndHash(
+                        path=os.path.join(dir_path, dir_name) + "/",
+                        hash=dir_name,
+                    )
+
     def delete_by_file(self, file_obj):
         """
         Remove file from the storage. File is identified by opened `file_obj`,
@@ -260,7 +781,9 @@ class BalancedDiscStorage(object):
 
     def delete_by_hash(self, file_hash):
         """
-        Remove file/archive by it's `file_hash`.
+        Remove file/archive by it's `file_hash`. If the :attr:`ref_counter`
+        is set, only one reference is removed and the file itself is removed
+        with the last one.
 
         Args:
             file_hash (str): Hash, which is used to find the file in storage.
@@ -269,8 +792,29 @@ class BalancedDiscStorage(object):
             IOError: If the file for given `file_hash` was not found in \
                      storage.
         """
+        if self.ref_counter is None:
+            return self._delete_hash(file_hash)
+
+        with self.ref_counter.lock_for(file_hash):
+            if self.ref_counter.decrement(file_hash) > 0:
+                return
+
+            return self._delete_hash(file_hash)
+
+    def _delete_hash(self, file_hash):
+        """
+        Remove file/archive by it's `file_hash`, regardless of references.
+        Copies of the file stored in other formats are removed too.
+        """
         full_path = self.file_path_from_hash(file_hash)
 
+        dir_path = os.path.dirname(full_path.rstrip("/"))
+        for stored_name in [file_hash] + [file_hash + s for s in SUFFIXES]:
+            stored_path = os.path.join(dir_path, stored_name)
+
+            if stored_path != full_path and os.path.isfile(stored_path):
+                self._remove_object(stored_path)
+
         return self.delete_by_path(full_path)
 
     def _recursive_remove_blank_dirs(self, path):
@@ -329,13 +873,174 @@ class BalancedDiscStorage(object):
                 )
             )
 
-        if os.path.isfile(path):
-            os.unlink(path)
-            return self._recursive_remove_blank_dirs(path)
-
-        shutil.rmtree(path)
+        self._remove_object(path)
         self._recursive_remove_blank_dirs(path)
 
+    def _remove_object(self, path):
+        """
+        Remove file / unpacked archive in `path` together with its sidecar
+        files. Blank directories are not removed.
+
+        Args:
+            path (str): Path of the object in storage.
+        """
+        self.fd_cache.invalidate(
+            os.path.basename(path.rstrip("/")).split(".")[0]
+        )
+
+        sidecar_paths = self._sidecar_paths(path)
+
+        with self._timed("delete"):
+            if os.path.isfile(path):
+                os.unlink(path)
+            else:
+                shutil.rmtree(path)
+
+        for sidecar_path in sidecar_paths:
+            os.unlink(sidecar_path)
+
+        self._record_change("del", path)
+
+    def _remove_blank_dirs(self, paths):
+        """
+        Remove blank directories from `paths` and their parents. Each
+        directory is checked only once, from the deepest ones up, using plain
+        ``rmdir()``, which fails for non-blank directories.
+
+        Args:
+            paths (iterable): Paths, which you suspect that are blank.
+        """
+        root = os.path.abspath(self.path)
+
+        candidates = set()
+        for path in paths:
+            path = os.path.abspath(path)
+
+            while path.startswith(root) and len(path) > len(root):
+                if path in candidates:
+                    break
+
+                candidates.add(path)
+                path = os.path.dirname(path)
+
+        for path in sorted(candidates, key=len, reverse=True):
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+    def delete_many(self, file_hashes, processes=4):
+        """
+        Remove multiple files/archives by their hashes. Files are removed in
+        parallel and the blank directories are cleaned only once, at the end.
+
+        If the :attr:`ref_counter` is set, one reference is removed from each
+        hash and only files without references are removed.
+
+        Args:
+            file_hashes (iterable): Hashes of the files.
+            processes (int, default 4): Number of threads.
+
+        Returns:
+            int: Number of removed files. Hashes, which are not in storage, \
+                 are ignored.
+        """
+        file_hashes = list(file_hashes)
+        if self.ref_counter is not None:
+            file_hashes = self.ref_counter.release_many(file_hashes)
+
+        return self._delete_many(file_hashes, processes)
+
+    def _delete_many(self, file_hashes, processes):
+        """
+        Remove files/archives by their hashes. Files, which were referenced
+        again in the meantime, are skipped.
+
+        Returns:
+            int: Number of removed files.
+        """
+        def remove(file_hash):
+            """
+            Returns:
+                tuple: ``(removed, dir_path)`` or None if not in storage.
+            """
+            try:
+                path = self.file_path_from_hash(file_hash)
+            except (IOError, OSError):
+                return None
+
+            dir_path = os.path.dirname(path.rstrip("/"))
+            try:
+                self._remove_object(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+                return False, dir_path  # removed by concurrent delete
+
+            return True, dir_path
+
+        def delete(file_hash):
+            if self.ref_counter is None:
+                return remove(file_hash)
+
+            with self.ref_counter.lock_for(file_hash):
+                if self.ref_counter.get(file_hash) > 0:
+                    return None
+
+                return remove(file_hash)
+
+        pool = ThreadPool(processes)
+        try:
+            results = [
+                result
+                for result in pool.map(delete, list(set(file_hashes)))
+                if result
+            ]
+        finally:
+            pool.close()
+            pool.join()
+
+        self._remove_blank_dirs(dir_path for _, dir_path in results)
+
+        return len([removed for removed, _ in results if removed])
+
+    def gc(self, keep_set, processes=4, batch_size=10000):
+        """
+        Remove all files/archives, which hashes are not in `keep_set`,
+        regardless of their references.
+
+        Args:
+            keep_set (set): Hashes of the files, which should be kept.
+            processes (int, default 4): Number of threads.
+            batch_size (int, default 10000): How many files to remove at once.
+
+        Returns:
+            int: Number of removed files.
+        """
+        removed = 0
+
+        batch = []
+        for path in self.iter_paths():
+            if path.hash in keep_set:
+                continue
+
+            batch.append(path.hash)
+            if len(batch) >= batch_size:
+                removed += self._gc_batch(batch, processes)
+                batch = []
+
+        if batch:
+            removed += self._gc_batch(batch, processes)
+
+        return removed
+
+    def _gc_batch(self, file_hashes, processes):
+        if self.ref_counter is not None:
+            self.ref_counter.discard(file_hashes)
+
+        return self._delete_many(file_hashes, processes)
+
     def __repr__(self):
         return "%s(path=%s, dir_limit=%d)" % (
             self.__class__.__name__,
@@ -5,8 +5,12 @@
 #
 # Imports =====================================================================
 import os
+import json
+import zlib
+import errno
 import shutil
 import zipfile
+import threading
 
 from BalancedDiscStorage.path_and_hash import PathAndHash
 from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
@@ -18,12 +22,367 @@ class BalancedDiscStorageZ(BalancedDiscStorage):
     This class is the same as :class:`.BalancedDiscStorage`, but it also allows
     adding the ``.zip`` files, which are unpacked to proper path in storage.
     """
-    def __init__(self, path):
-        super(BalancedDiscStorageZ, self).__init__(path)
+    def __init__(self, path, dir_limit=32000, fd_budget=64):
+        super(BalancedDiscStorageZ, self).__init__(path, dir_limit, fd_budget)
 
         self.max_zipfiles = self.dir_limit  #: How many files may be in .zip
 
-    def _unpack_zip(self, file_obj, path):
+        #: Store content of the archive members only once, in the blob tree.
+        self.dedup_members = False
+
+        #: Compare CRC of the members when the archive is added again.
+        self.verify_crc = False
+
+        # concurrent adds of the same archive are unpacked one by one
+        self._unpack_locks = [threading.Lock() for _ in range(64)]
+
+    def _link_member_to_blob(self, member_path):
+        """
+        Store the content of the unpacked `member_path` into the blob tree
+        and replace the member with hard link to the blob. Same content is
+        thus stored on the disc only once, no matter how many archives
+        contain it.
+
+        Member is left untouched as regular file, if the hard link couldn't
+        be created (filesystem without hard links, link count limit, ..), or
+        if the same content was added by :meth:`add_file` and is not owned by
+        the archives (see :meth:`_is_archive_blob`).
+
+        Args:
+            member_path (str): Path to the file extracted from archive.
+
+        Returns:
+            str: Hash of the blob, or None if the member was not linked.
+        """
+        with open(member_path, "rb") as member_file:
+            file_hash = self._get_hash(member_file)
+
+        dir_path = self._create_dir_path(file_hash)
+        blob_path = os.path.join(dir_path, file_hash)
+        tmp_path = member_path + ".bds_tmp"
+
+        try:
+            stored_name = self._stored_name(
+                file_hash,
+                set(os.listdir(dir_path))
+            )
+            if stored_name is None:
+                os.link(member_path, blob_path)
+                self._record_change("add", blob_path, file_hash)
+                return file_hash
+
+            # compressed by add_file(), can't be shared with the member
+            if stored_name != file_hash:
+                return None
+
+            if not self._is_archive_blob(file_hash, os.stat(blob_path)):
+                return None
+
+            os.link(blob_path, tmp_path)
+            os.rename(tmp_path, member_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+            self._recursive_remove_blank_dirs(dir_path)
+            return None
+
+        return file_hash
+
+    def _is_archive_blob(self, file_hash, stat):
+        """
+        Decide, whether the file `file_hash` with `stat` is blob owned by the
+        archives. Blobs are linked from at least one member, files added by
+        :meth:`add_file` are counted by :attr:`ref_counter` (if it is set)
+        and are not linked, unless the archives linked them first.
+
+        Args:
+            file_hash (str): Hash of the file.
+            stat (obj): Result of ``os.stat()`` of the file.
+
+        Returns:
+            bool: True if the file may be shared by the members.
+        """
+        if self.ref_counter is not None and self.ref_counter.get(file_hash):
+            return True
+
+        return stat.st_nlink > 1
+
+    def _archive_blobs(self, path):
+        """
+        Return blobs linked from the members of archive unpacked in `path`.
+
+        Args:
+            path (str): Path of the unpacked archive.
+
+        Returns:
+            list: Tuples ``(blob_hash, (st_dev, st_ino))`` of the members.
+        """
+        linked = []
+        for name, blob_hash in self._read_blobs(path).items():
+            member_path = self._member_path(path, zipfile.ZipInfo(name))
+
+            try:
+                stat = os.lstat(member_path)
+            except OSError:
+                continue
+
+            linked.append((blob_hash, (stat.st_dev, stat.st_ino)))
+
+        return linked
+
+    def _remove_orphaned_blob(self, blob_hash, inode):
+        """
+        Remove blob `blob_hash`, if it is still the same `inode` as the
+        removed member, no other member links to it and it has no references.
+
+        Returns:
+            str: Directory of the removed blob, or None.
+        """
+        try:
+            blob_path = self.file_path_from_hash(blob_hash)
+            stat = os.stat(blob_path)
+        except (IOError, OSError):
+            return None
+
+        if (stat.st_dev, stat.st_ino) != inode or stat.st_nlink > 1:
+            return None
+
+        if self.ref_counter is not None and self.ref_counter.get(blob_hash):
+            return None
+
+        try:
+            self._remove_object(blob_path)
+        except OSError:  # removed by concurrent delete of other archive
+            return None
+
+        return os.path.dirname(blob_path)
+
+    def _remove_object(self, path):
+        """
+        Remove file / unpacked archive in `path` together with its sidecar
+        files. Blobs, which were used only by the members of the removed
+        archive, are removed too.
+
+        Args:
+            path (str): Path of the object in storage.
+        """
+        blobs = self._archive_blobs(path) if os.path.isdir(path) else []
+
+        super(BalancedDiscStorageZ, self)._remove_object(path)
+
+        dir_paths = [
+            self._remove_orphaned_blob(blob_hash, inode)
+            for blob_hash, inode in blobs
+        ]
+        self._remove_blank_dirs(dir_path for dir_path in dir_paths if dir_path)
+
+    @staticmethod
+    def _manifest_path(path):
+        """
+        Return path of the manifest for archive unpacked in `path`.
+
+        Args:
+            path (str): Path of the unpacked archive.
+
+        Returns:
+            str: Path of the manifest, stored next to the unpacked directory.
+        """
+        return path.rstrip("/") + ".manifest"
+
+    def _write_manifest(self, path, zip_infos, complete, blobs=None):
+        """
+        Atomically (re)write manifest of the archive unpacked in `path`.
+
+        Args:
+            path (str): Path of the unpacked archive, named by its hash.
+            zip_infos (list): List of :class:`zipfile.ZipInfo` records.
+            complete (bool): Whether all members were already unpacked.
+            blobs (dict, default None): Hashes of the blobs, to which the
+                  members are linked, by member names.
+        """
+        manifest = {
+            "hash": os.path.basename(path.rstrip("/")),
+            "complete": complete,
+            "members": [
+                [zip_info.filename, zip_info.file_size, zip_info.CRC]
+                for zip_info in zip_infos
+            ],
+            "blobs": blobs or {},
+        }
+
+        manifest_path = self._manifest_path(path)
+        tmp_path = "%s.%d.%d.bds_tmp" % (
+            manifest_path,
+            os.getpid(),
+            threading.current_thread().ident
+        )
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, separators=(",", ":"))
+
+        os.rename(tmp_path, manifest_path)
+
+    def _sidecar_paths(self, path):
+        """
+        Return paths of the auxiliary files, which belong to the object stored
+        in `path` - manifest in case of unpacked archive.
+
+        Args:
+            path (str): Path of the object in storage.
+
+        Returns:
+            list: List of paths.
+        """
+        manifest_path = self._manifest_path(path)
+        if os.path.exists(manifest_path):
+            return [manifest_path]
+
+        return []
+
+    def read_manifest(self, file_hash):
+        """
+        Read manifest of the unpacked archive.
+
+        Args:
+            file_hash (str): Hash of the archive.
+
+        Returns:
+            dict: Manifest with ``hash``, ``complete``, ``members`` and \
+                  ``blobs`` keys. Members are stored as \
+                  ``[path, size, crc]`` lists, ``blobs`` maps member paths \
+                  to hashes of the linked blobs.
+
+        Raises:
+            IOError: If the archive or its manifest is not in storage.
+        """
+        path = self.file_path_from_hash(file_hash)
+        manifest_path = self._manifest_path(path)
+
+        if not os.path.exists(manifest_path):
+            raise IOError("Manifest for `%s` not found." % file_hash)
+
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+
+    def list_archive(self, file_hash):
+        """
+        List members of the unpacked archive, without walking the directory.
+
+        Args:
+            file_hash (str): Hash of the archive.
+
+        Returns:
+            list: Paths of the members, relative to the unpacked directory.
+        """
+        return [
+            member[0]
+            for member in self.read_manifest(file_hash)["members"]
+        ]
+
+    def is_archive_complete(self, file_hash):
+        """
+        Check whether the archive was completely unpacked. Archives, which
+        were only partially unpacked (crash in the middle of the
+        :meth:`add_archive_as_dir`), are reported as incomplete.
+
+        Args:
+            file_hash (str): Hash of the archive.
+
+        Returns:
+            bool: True if the unpacking was finished.
+        """
+        try:
+            return bool(self.read_manifest(file_hash)["complete"])
+        except (IOError, OSError, ValueError):
+            return False
+
+    def verify_archive(self, file_hash, check_crc=False):
+        """
+        Compare the unpacked archive with its manifest.
+
+        Args:
+            file_hash (str): Hash of the archive.
+            check_crc (bool, default False): Compare also CRC of the content,
+                      not just the size.
+
+        Returns:
+            list: Paths of the members, which are missing or damaged. Blank \
+                  list means that the archive is intact.
+        """
+        path = self.file_path_from_hash(file_hash)
+
+        damaged = []
+        for name, size, crc in self.read_manifest(file_hash)["members"]:
+            zip_info = zipfile.ZipInfo(name)
+            zip_info.file_size = size
+            zip_info.CRC = crc
+
+            member_path = self._member_path(path, zip_info)
+            if not self._member_is_intact(zip_info, member_path, check_crc):
+                damaged.append(name)
+
+        return damaged
+
+    @staticmethod
+    def _member_path(path, zip_info):
+        """
+        Compute the path, to which the `zip_info` is unpacked in `path`.
+
+        Note:
+            Unsafe components of the member name (``..``, ``.``, drive
+            letters) are dropped the same way as :mod:`zipfile` does.
+
+        Args:
+            path (str): Path into which the .zip is unpacked.
+            zip_info (obj): :class:`zipfile.ZipInfo` of the member.
+
+        Returns:
+            str: Path of the member.
+        """
+        arcname = zip_info.filename.replace("\\", "/")
+        arcname = os.path.splitdrive(arcname)[1]
+        components = [
+            component
+            for component in arcname.split("/")
+            if component not in ("", ".", "..")
+        ]
+
+        return os.path.join(path, *components)
+
+    def _member_is_intact(self, zip_info, member_path, check_crc=False):
+        """
+        Check whether the already unpacked `member_path` matches the
+        `zip_info` record.
+
+        Args:
+            zip_info (obj): :class:`zipfile.ZipInfo` of the member.
+            member_path (str): Path of the unpacked member.
+            check_crc (bool, default False): Compare also CRC of the content,
+                      not just the size.
+
+        Returns:
+            bool: True if the member doesn't need to be unpacked again.
+        """
+        if zip_info.filename.endswith("/"):
+            return os.path.isdir(member_path)
+
+        if not os.path.isfile(member_path):
+            return False
+
+        if os.path.getsize(member_path) != zip_info.file_size:
+            return False
+
+        if not check_crc:
+            return True
+
+        crc = 0
+        with open(member_path, "rb") as member_file:
+            for piece in self._get_file_iterator(member_file):
+                crc = zlib.crc32(piece, crc)
+
+        return (crc & 0xffffffff) == zip_info.CRC
+
+    def _unpack_zip(self, file_obj, path, only_changed=False, check_crc=False):
         """
         Unpack .zip archive in `file_obj` to given `path`. Make sure, that it
         fits into limits (see :attr:`._max_zipfiles` for details).
@@ -31,35 +390,80 @@ class BalancedDiscStorageZ(BalancedDiscStorage):
         Args:
             file_obj (file): Opened file-like object.
             path (str): Path into which the .zip will be unpacked.
+            only_changed (bool, default False): Unpack only members, which
+                         are missing in `path`, or differ from the archive.
+            check_crc (bool, default False): Compare also CRC of the already
+                      unpacked members. Used only with `only_changed`.
 
         Raises:
             ValueError: If there is too many files in .zip archive.
         """
-        old_cwd = os.getcwd()
-        os.chdir(path)
-
         zip_obj = zipfile.ZipFile(file_obj)
-        for cnt, zip_info in enumerate(zip_obj.infolist()):
-            zip_obj.extract(zip_info)
+        zip_infos = zip_obj.infolist()
 
-            if cnt + 1 > self.max_zipfiles:
-                os.chdir(old_cwd)
+        if len(zip_infos) > self.max_zipfiles:
+            msg = "Too many files in .zip "
+            msg += "(self.max_zipfiles == {}, but {} given).".format(
+                self.max_zipfiles,
+                len(zip_infos),
+            )
+            raise ValueError(msg)
 
-                msg = "Too many files in .zip "
-                msg += "(self.max_zipfiles == {}, but {} given).".format(
-                    self.max_zipfiles,
-                    cnt + 1,
-                )
-                raise ValueError(msg)
+        blobs = {}
+        if only_changed:
+            names = set(zip_info.filename for zip_info in zip_infos)
+            blobs = dict(
+                (name, blob_hash)
+                for name, blob_hash in self._read_blobs(path).items()
+                if name in names
+            )
+
+        self._write_manifest(path, zip_infos, complete=False, blobs=blobs)
+
+        for zip_info in zip_infos:
+            if only_changed:
+                member_path = self._member_path(path, zip_info)
+                if self._member_is_intact(zip_info, member_path, check_crc):
+                    continue
 
-        os.chdir(old_cwd)
+                # member may be hard link to blob, don't write through it
+                if os.path.isfile(member_path):
+                    os.unlink(member_path)
 
-    def add_archive_as_dir(self, zip_file_obj):
+            blobs.pop(zip_info.filename, None)
+            member_path = zip_obj.extract(zip_info, path)
+
+            if self.dedup_members and os.path.isfile(member_path):
+                blob_hash = self._link_member_to_blob(member_path)
+                if blob_hash:
+                    blobs[zip_info.filename] = blob_hash
+
+        self._write_manifest(path, zip_infos, complete=True, blobs=blobs)
+
+    def _read_blobs(self, path):
+        """
+        Return blob hashes of the members of archive unpacked in `path` by
+        member names, as recorded in the manifest.
+        """
+        try:
+            with open(self._manifest_path(path)) as manifest_file:
+                return json.load(manifest_file).get("blobs", {})
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def add_archive_as_dir(self, zip_file_obj, check_crc=None):
         """
-        Add archive to the storage and unpack it.
+        Add archive to the storage and unpack it. Manifest of the archive is
+        stored next to the unpacked directory, see :meth:`read_manifest`.
+
+        If the archive is already in the storage, only the members, which are
+        missing or differ from the archive, are unpacked again.
 
         Args:
             zip_file_obj (file): Opened file-like object.
+            check_crc (bool, default None): Compare also CRC of already
+                      unpacked members, not only sizes. Default is taken from
+                      :attr:`verify_crc`.
 
         Returns:
             obj: Path where the `zip_file_obj` was unpacked wrapped in \
@@ -69,22 +473,128 @@ class BalancedDiscStorageZ(BalancedDiscStorage):
             ValueError: If there is too many files in .zip archive. \
                         See :attr:`._max_zipfiles` for details.
             AssertionError: If the `zip_file_obj` is not file-like object.
+            IOError: If there is not enough space for the unpacked archive \
+                     (see :attr:`.space_budget`).
         """
         BalancedDiscStorage._check_interface(zip_file_obj)
 
-        file_hash = self._get_hash(zip_file_obj)
+        if check_crc is None:
+            check_crc = self.verify_crc
+
+        with self._reserve_archive_space(zip_file_obj):
+            file_hash = self._get_hash(zip_file_obj)
+
+            if self.ref_counter is None:
+                path = self._unpack_archive(
+                    zip_file_obj,
+                    file_hash,
+                    check_crc
+                )
+            else:
+                with self.ref_counter.lock_for(file_hash):
+                    path = self._unpack_archive(
+                        zip_file_obj,
+                        file_hash,
+                        check_crc
+                    )
+                    self.ref_counter.increment(file_hash)
+
+        self._record_change("add", path, file_hash)
+
+        return path
+
+    def _reserve_archive_space(self, zip_file_obj):
+        """
+        Reserve space for the unpacked archive and its manifest in
+        :attr:`.space_budget`. Only the central directory of the archive is
+        read.
+
+        Returns:
+            obj: Context manager, which holds the reservation.
+        """
+        if self.space_budget is None:
+            return self._reserve_space(0, 0)
+
+        zip_file_obj.seek(0)
+        zip_infos = zipfile.ZipFile(zip_file_obj).infolist()
+        zip_file_obj.seek(0)
+
+        return self._reserve_space(
+            sum(zip_info.file_size for zip_info in zip_infos),
+            len(zip_infos) + 2  # + directory of the archive and manifest
+        )
+
+    def _unpack_archive(self, zip_file_obj, file_hash, check_crc):
+        """
+        Unpack the archive with known `file_hash` into the storage. See
+        :meth:`add_archive_as_dir` for details.
+        """
+        unpack_lock = self._unpack_locks[
+            hash(file_hash) % len(self._unpack_locks)
+        ]
+        with unpack_lock:
+            return self._unpack_archive_locked(
+                zip_file_obj,
+                file_hash,
+                check_crc
+            )
+
+    def _unpack_archive_locked(self, zip_file_obj, file_hash, check_crc):
         dir_path = self._create_dir_path(file_hash)
         full_path = os.path.join(dir_path, file_hash)
 
-        if os.path.exists(full_path):
-            shutil.rmtree(full_path)
+        # other process may create it in the meantime
+        try:
+            os.mkdir(full_path)
+            already_unpacked = False
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
 
-        os.mkdir(full_path)
+            already_unpacked = True
 
         try:
-            self._unpack_zip(zip_file_obj, full_path)
+            with self._timed("unpack_zip"):
+                self._unpack_zip(
+                    zip_file_obj,
+                    full_path,
+                    only_changed=already_unpacked,
+                    check_crc=check_crc,
+                )
         except Exception:
+            # failed re-add / repair keeps the unpacked members, manifest
+            # stays marked incomplete
+            if already_unpacked:
+                raise
+
             shutil.rmtree(full_path)
+
+            manifest_path = self._manifest_path(full_path)
+            if os.path.exists(manifest_path):
+                os.unlink(manifest_path)
+
             raise
 
         return PathAndHash(path=full_path, hash=file_hash)
+
+    def repair_archive(self, zip_file_obj):
+        """
+        Make sure, that the archive is completely unpacked in the storage.
+        Members, which are missing, or differ in size or CRC from the
+        `zip_file_obj` are unpacked again.
+
+        Args:
+            zip_file_obj (file): Opened file-like object.
+
+        Returns:
+            obj: Path where the `zip_file_obj` was unpacked wrapped in \
+                 :class:`.PathAndHash` structure.
+        """
+        BalancedDiscStorage._check_interface(zip_file_obj)
+
+        file_hash = self._get_hash(zip_file_obj)
+        path = self._unpack_archive(zip_file_obj, file_hash, check_crc=True)
+
+        self._record_change("add", path, file_hash)
+
+        return path
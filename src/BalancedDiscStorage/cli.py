@@ -0,0 +1,396 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+``bds`` command-line tool for bulk operations with the storage.
+
+Examples::
+
+    bds -r /storage add -j 8 /data/incoming
+    bds -r /storage ls | cut -f 1 | bds -r /storage verify -j 8 -
+    bds -r /storage cat 6e8c..._4 > file
+"""
+# Imports =====================================================================
+import os
+import sys
+import argparse
+from multiprocessing.pool import ThreadPool
+
+from BalancedDiscStorage.http_server import BlobHTTPServer
+from BalancedDiscStorage.balanced_disc_storage_z import BalancedDiscStorageZ
+
+
+# Functions & classes =========================================================
+class _Progress(object):
+    """
+    Print progress of the operation to stderr, if it is terminal.
+    """
+    def __init__(self, label, total=None, stream=None):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.stream = stream or sys.stderr
+        self.enabled = hasattr(self.stream, "isatty") and self.stream.isatty()
+
+    def update(self, value=1):
+        self.done += value
+
+        if not self.enabled:
+            return
+
+        if self.total is None:
+            self.stream.write("\r%s: %d" % (self.label, self.done))
+        else:
+            self.stream.write(
+                "\r%s: %d/%d" % (self.label, self.done, self.total)
+            )
+
+        self.stream.flush()
+
+    def finish(self):
+        if self.enabled and self.done:
+            self.stream.write("\n")
+
+
+def _error(message):
+    sys.stderr.write("bds: %s\n" % message)
+
+
+def _read_values(values):
+    """
+    Return `values`, or lines from the stdin, if `values` are blank or
+    ``-``.
+    """
+    if values and values != ["-"]:
+        return values
+
+    return [line.strip() for line in sys.stdin if line.strip()]
+
+
+def _walk_files(paths):
+    """
+    Yield all files in `paths`, directories are walked recursively.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                yield os.path.join(dir_path, file_name)
+
+
+def _parallel(function, items, jobs, label):
+    """
+    Call `function` for each of the `items` in `jobs` threads, report the
+    progress.
+
+    Returns:
+        list: Results of the `function` in the order of `items`.
+    """
+    items = list(items)
+    progress = _Progress(label, len(items))
+
+    def run(item):
+        try:
+            return function(item)
+        finally:
+            progress.update()
+
+    pool = ThreadPool(jobs)
+    try:
+        return pool.map(run, items)
+    finally:
+        pool.close()
+        pool.join()
+        progress.finish()
+
+
+def cmd_add(storage, args):
+    def add(path):
+        try:
+            with open(path, "rb") as file_obj:
+                if args.archives and path.lower().endswith(".zip"):
+                    return storage.add_archive_as_dir(file_obj), path
+
+                return storage.add_file(file_obj), path
+        except Exception as e:
+            _error("can't add '%s': %s" % (path, e))
+            return None, path
+
+    paths = _walk_files(_read_values(args.paths))
+
+    failed = 0
+    for stored, path in _parallel(add, paths, args.jobs, "added"):
+        if stored is None:
+            failed += 1
+        else:
+            print("%s\t%s" % (stored.hash, path))
+
+    return 1 if failed else 0
+
+
+def cmd_get(storage, args):
+    failed = 0
+    for file_hash in _read_values(args.hashes):
+        try:
+            print(storage.file_path_from_hash(file_hash))
+        except (IOError, OSError) as e:
+            _error("%s: %s" % (file_hash, e))
+            failed += 1
+
+    return 1 if failed else 0
+
+
+def cmd_cat(storage, args):
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+
+    failed = 0
+    for file_hash in _read_values(args.hashes):
+        try:
+            with storage.open_by_hash(file_hash) as reader:
+                for part in storage._get_file_iterator(reader):
+                    out.write(part)
+        except (IOError, OSError) as e:
+            _error("%s: %s" % (file_hash, e))
+            failed += 1
+
+    out.flush()
+
+    return 1 if failed else 0
+
+
+def cmd_rm(storage, args):
+    file_hashes = _read_values(args.hashes)
+
+    removed = storage.delete_many(file_hashes, processes=args.jobs)
+    sys.stderr.write("removed: %d\n" % removed)
+
+    return 0
+
+
+def cmd_ls(storage, args):
+    for path in storage.iter_paths():
+        print("%s\t%s" % (path.hash, path))
+
+    return 0
+
+
+def _verify_hash(storage, file_hash):
+    """
+    Returns:
+        str: Description of the problem, or None if the object is intact.
+    """
+    try:
+        path = storage.file_path_from_hash(file_hash)
+
+        if os.path.isdir(path):
+            damaged = storage.verify_archive(file_hash, check_crc=True)
+            if damaged:
+                return "damaged members: %s" % ", ".join(damaged)
+
+            return None
+
+        with storage.open_by_hash(file_hash) as reader:
+            real_hash = storage._get_hash(reader)
+    except (IOError, OSError, ValueError) as e:
+        return str(e)
+
+    if real_hash != file_hash:
+        return "content hash is %s" % real_hash
+
+    return None
+
+
+def cmd_verify(storage, args):
+    if args.hashes:
+        file_hashes = _read_values(args.hashes)
+    else:
+        file_hashes = [path.hash for path in storage.iter_paths()]
+
+    results = _parallel(
+        lambda file_hash: (file_hash, _verify_hash(storage, file_hash)),
+        file_hashes,
+        args.jobs,
+        "verified"
+    )
+
+    failed = 0
+    for file_hash, problem in results:
+        if problem:
+            print("%s\t%s" % (file_hash, problem))
+            failed += 1
+
+    return 1 if failed else 0
+
+
+def cmd_stats(storage, args):
+    files = 0
+    archives = 0
+    size = 0
+    disc_size = 0
+
+    progress = _Progress("scanned")
+    for path in storage.iter_paths():
+        size += int(path.hash.rsplit("_", 1)[1], 16)
+
+        if path.endswith("/"):
+            archives += 1
+            for dir_path, dir_names, file_names in os.walk(path):
+                disc_size += sum(
+                    os.path.getsize(os.path.join(dir_path, file_name))
+                    for file_name in file_names
+                )
+        else:
+            files += 1
+            disc_size += os.path.getsize(path)
+
+        progress.update()
+
+    progress.finish()
+
+    print("files: %d" % files)
+    print("archives: %d" % archives)
+    print("size: %d" % size)
+    print("disc_size: %d" % disc_size)
+
+    return 0
+
+
+def cmd_serve(storage, args):
+    server = BlobHTTPServer(storage, (args.host, args.port))
+    server.log_requests = args.verbose
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="bds",
+        description="Bulk operations with the BalancedDiscStorage.",
+    )
+    parser.add_argument(
+        "-r",
+        "--root",
+        default=os.environ.get("BDS_ROOT", "."),
+        help="Path to the storage. Default $BDS_ROOT or current directory."
+    )
+    parser.add_argument(
+        "-l",
+        "--dir-limit",
+        type=int,
+        default=32000,
+        help="Maximal number of files in directory. Default %(default)s."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    hashes_help = "Hashes of the objects. Read from stdin, if blank or `-`."
+
+    add = subparsers.add_parser(
+        "add",
+        help="Add files, directories are added recursively."
+    )
+    add.add_argument(
+        "paths",
+        nargs="*",
+        help="Files / directories. Read from stdin, if blank or `-`."
+    )
+    add.add_argument(
+        "-z",
+        "--archives",
+        action="store_true",
+        help="Unpack .zip files as archives."
+    )
+    add.set_defaults(function=cmd_add)
+
+    for name, function, help in [("get", cmd_get, "Print paths of objects."),
+                                 ("cat", cmd_cat, "Print content of files."),
+                                 ("rm", cmd_rm, "Remove objects.")]:
+        sub = subparsers.add_parser(name, help=help)
+        sub.add_argument("hashes", nargs="*", help=hashes_help)
+        sub.set_defaults(function=function)
+
+    ls = subparsers.add_parser("ls", help="Stream all objects.")
+    ls.set_defaults(function=cmd_ls)
+
+    verify = subparsers.add_parser(
+        "verify",
+        help="Check the content of objects (all, if no hash is given)."
+    )
+    verify.add_argument("hashes", nargs="*", help="Hashes of the objects.")
+    verify.set_defaults(function=cmd_verify)
+
+    stats = subparsers.add_parser("stats", help="Print statistics.")
+    stats.set_defaults(function=cmd_stats)
+
+    serve = subparsers.add_parser("serve", help="Run the HTTP server.")
+    serve.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on. Default %(default)s."
+    )
+    serve.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=8080,
+        help="Port to listen on. Default %(default)s."
+    )
+    serve.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log the requests."
+    )
+    serve.set_defaults(function=cmd_serve)
+
+    for sub in (add, verify, subparsers.choices["rm"]):
+        sub.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=4,
+            help="Number of parallel workers. Default %(default)s."
+        )
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the ``bds`` command.
+
+    Args:
+        argv (list, default None): Arguments. Default is ``sys.argv[1:]``.
+
+    Returns:
+        int: Exit code.
+    """
+    args = _parser().parse_args(argv)
+
+    try:
+        storage = BalancedDiscStorageZ(
+            os.path.abspath(args.root),
+            dir_limit=args.dir_limit
+        )
+    except (IOError, ValueError) as e:
+        _error(str(e))
+        return 2
+
+    return args.function(storage, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
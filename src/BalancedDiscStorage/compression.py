@@ -0,0 +1,252 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# Functions & classes =========================================================
+class Codec(object):
+    """
+    Compression format used for the objects in storage.
+
+    Attributes:
+        name (str): Name of the codec, used in
+             :attr:`.BalancedDiscStorage.compression`.
+        suffix (str): Suffix of the compressed files.
+    """
+    def __init__(self, name, suffix, compressor, decompressor):
+        self.name = name
+        self.suffix = suffix
+        self._compressor = compressor
+        self._decompressor = decompressor
+
+    def compressor(self):
+        """
+        Returns:
+            obj: Object with ``.compress(data)`` and ``.flush()`` methods.
+        """
+        return self._compressor()
+
+    def decompressor(self):
+        """
+        Returns:
+            obj: Object with ``.decompress(data)`` method.
+        """
+        return self._decompressor()
+
+    def compress(self, data):
+        """
+        Compress whole `data` at once.
+        """
+        compressor = self.compressor()
+
+        return compressor.compress(data) + compressor.flush()
+
+    def __repr__(self):
+        return "Codec(%r)" % self.name
+
+
+class _LZ4Compressor(object):
+    """
+    Adapter of :class:`lz4.frame.LZ4FrameCompressor` to the
+    ``compress()`` / ``flush()`` interface.
+    """
+    def __init__(self):
+        self._compressor = lz4_frame.LZ4FrameCompressor()
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b""
+
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        return self._header + self._compressor.flush()
+
+
+class DecompressingReader(object):
+    """
+    Read-only file-like object, which transparently decompresses `file_obj`.
+
+    Seeking forward is done by decompressing and throwing away the data,
+    seeking backward restarts the decompression.
+
+    Args:
+        file_obj (obj): Compressed file-like object. It is closed together
+                 with the reader.
+        codec (obj): :class:`Codec` of the `file_obj`.
+        read_bs (int, default 2**16): Size of the compressed blocks.
+    """
+    def __init__(self, file_obj, codec, read_bs=2**16):
+        self.file_obj = file_obj
+        self.codec = codec
+        self.read_bs = read_bs
+        self.closed = False
+
+        self._restart()
+
+    def _restart(self):
+        self.file_obj.seek(0)
+        self._decompressor = self.codec.decompressor()
+        self._buffer = b""
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            piece = self.file_obj.read(self.read_bs)
+            if not piece:
+                self._eof = True
+                break
+
+            self._buffer += self._decompressor.decompress(piece)
+
+    def read(self, size=-1):
+        """
+        Read `size` decompressed bytes.
+
+        Args:
+            size (int, default -1): Number of bytes. Negative number reads
+                 everything up to the end of the object.
+
+        Returns:
+            str: Decompressed data.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+        if size is None:
+            size = -1
+
+        self._fill(size)
+
+        if size < 0:
+            size = len(self._buffer)
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence != os.SEEK_SET:
+            raise IOError("Compressed objects can't be seeked from the end.")
+
+        if offset < self._position:
+            self._restart()
+
+        while self._position < offset:
+            if not self.read(min(offset - self._position, self.read_bs)):
+                break
+
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.file_obj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _available_codecs():
+    codecs = [
+        Codec(
+            name="gzip",
+            suffix=".gz",
+            compressor=lambda: zlib.compressobj(
+                6,
+                zlib.DEFLATED,
+                16 + zlib.MAX_WBITS
+            ),
+            decompressor=lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+        ),
+    ]
+
+    if zstandard is not None:
+        codecs.append(Codec(
+            name="zstd",
+            suffix=".zst",
+            compressor=lambda: zstandard.ZstdCompressor().compressobj(),
+            decompressor=lambda: zstandard.ZstdDecompressor().decompressobj(),
+        ))
+
+    if lz4_frame is not None:
+        codecs.append(Codec(
+            name="lz4",
+            suffix=".lz4",
+            compressor=_LZ4Compressor,
+            decompressor=lz4_frame.LZ4FrameDecompressor,
+        ))
+
+    return codecs
+
+
+#: Available codecs by their names. ``zstd`` and ``lz4`` require optional
+#: ``zstandard`` and ``lz4`` packages.
+CODECS = dict((codec.name, codec) for codec in _available_codecs())
+
+#: Suffixes of all known compressed formats (also those, which are not
+#: available), used to recognize the stored objects.
+SUFFIXES = (".gz", ".zst", ".lz4")
+
+
+def get_codec(name):
+    """
+    Return :class:`Codec` for `name`.
+
+    Raises:
+        ValueError: If the codec is not known or its package not installed.
+    """
+    if name not in CODECS:
+        raise ValueError(
+            "Unknown or unavailable compression `%s` (available: %s)." % (
+                name,
+                ", ".join(sorted(CODECS))
+            )
+        )
+
+    return CODECS[name]
+
+
+def codec_for_name(file_name):
+    """
+    Return :class:`Codec` for the stored `file_name`, or None if the file is
+    not compressed.
+
+    Raises:
+        ValueError: If the file is compressed using unavailable codec.
+    """
+    for codec in CODECS.values():
+        if file_name.endswith(codec.suffix):
+            return codec
+
+    if file_name.endswith(SUFFIXES):
+        raise ValueError("Codec for `%s` is not available." % file_name)
+
+    return None
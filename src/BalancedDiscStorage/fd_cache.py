@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import threading
+from collections import OrderedDict
+
+
+# Functions & classes =========================================================
+class _CachedFD(object):
+    """
+    Open read-only file descriptor with reference counter.
+
+    Attributes:
+        fd (int): File descriptor.
+        info (obj): Additional information returned by the opener.
+        size (int): Size of the file.
+        refs (int): Number of users, which currently hold the descriptor.
+        evicted (bool): Descriptor was removed from cache and will be closed
+                once there are no users.
+        lock (obj): Lock used to serialize ``lseek()`` + ``read()`` on
+             platforms without ``pread()``.
+    """
+    def __init__(self, fd, info=None):
+        self.fd = fd
+        self.info = info
+        self.size = os.fstat(fd).st_size
+        self.refs = 0
+        self.evicted = False
+        self.lock = threading.Lock()
+
+
+class FDCache(object):
+    """
+    Bounded LRU cache of open read-only file descriptors.
+
+    Descriptors are reference counted, so the descriptor evicted from the cache
+    is closed only after the last user releases it.
+
+    Args:
+        max_fds (int, default 64): Maximal number of cached descriptors.
+    """
+    def __init__(self, max_fds=64):
+        self.max_fds = max_fds  #: Maximal number of cached descriptors.
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, opener):
+        """
+        Return cached descriptor for `key`, or open it using `opener`.
+
+        Note:
+            Each call have to be paired with :meth:`release`.
+
+        Args:
+            key (str): Key of the descriptor (hash of the file).
+            opener (fn): Function, which takes `key` and returns tuple
+                   ``(fd, info)`` - opened file descriptor and additional
+                   information stored with it.
+
+        Returns:
+            obj: Cached descriptor with ``.fd``, ``.info`` and ``.size`` \
+                 attributes.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                entry.refs += 1
+                return entry
+
+        entry = _CachedFD(*opener(key))
+
+        with self._lock:
+            # other thread may have opened the same file in the meantime
+            cached = self._entries.pop(key, None)
+            if cached is not None:
+                self._entries[key] = cached
+                cached.refs += 1
+                os.close(entry.fd)
+                return cached
+
+            entry.refs += 1
+            self._entries[key] = entry
+
+            while len(self._entries) > self.max_fds:
+                self._evict(self._entries.popitem(last=False)[1])
+
+        return entry
+
+    def release(self, entry):
+        """
+        Release the `entry` returned from :meth:`acquire`.
+
+        Args:
+            entry (obj): Cached descriptor.
+        """
+        with self._lock:
+            entry.refs -= 1
+
+            if entry.evicted and entry.refs <= 0:
+                os.close(entry.fd)
+
+    def invalidate(self, key):
+        """
+        Remove descriptor for `key` from the cache (file was deleted). Users,
+        which already hold the descriptor, may finish reading.
+
+        Args:
+            key (str): Key of the descriptor.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None:
+                self._evict(entry)
+
+    def _evict(self, entry):
+        """
+        Close the `entry`, or mark it for closing, if it is used. Call only
+        with :attr:`_lock` held.
+        """
+        entry.evicted = True
+
+        if entry.refs <= 0:
+            os.close(entry.fd)
+
+    def close(self):
+        """
+        Close all cached descriptors.
+        """
+        with self._lock:
+            while self._entries:
+                self._evict(self._entries.popitem()[1])
+
+    def __len__(self):
+        return len(self._entries)
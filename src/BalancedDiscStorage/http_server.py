@@ -0,0 +1,327 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+"""
+Self-contained HTTP server exposing the storage:
+
+- ``PUT /`` adds the request body, responds with ``201`` and the hash, or
+  ``507``, if there is not enough space.
+- ``GET /<hash>`` / ``HEAD /<hash>`` return the file, with ``Range`` and
+  ``If-None-Match`` support.
+- ``DELETE /<hash>`` removes the file.
+
+Objects are named by their content, so the hash is used as strong ``ETag``
+and the responses are cacheable forever.
+
+Example::
+
+    server = BlobHTTPServer(BalancedDiscStorage("/storage"), ("", 8080))
+    server.serve_forever()
+"""
+# Imports =====================================================================
+import re
+import errno
+import tempfile
+
+try:
+    from http.server import HTTPServer
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+
+# Variables ===================================================================
+_HASH_PATH_RE = re.compile(r"^/([0-9a-f]+_[0-9a-f]+)$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+#: Value of the ``Cache-Control`` header of the served files.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# Functions & classes =========================================================
+def parse_range(header, size):
+    """
+    Parse single-range ``Range`` `header` for object of `size` bytes.
+
+    Args:
+        header (str): Value of the header, for example ``bytes=0-99``.
+        size (int): Size of the object.
+
+    Returns:
+        tuple: ``(offset, length)``, or None if the header should be \
+               ignored (multiple ranges, unknown unit).
+
+    Raises:
+        ValueError: If the range is not satisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:  # suffix range - last `n` bytes
+        length = min(int(last), size)
+        if not length:
+            raise ValueError("Blank suffix range.")
+
+        return size - length, length
+
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+
+    if first >= size or last < first:
+        raise ValueError("Range %s is not satisfiable." % header)
+
+    return first, last - first + 1
+
+
+class BlobRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests for :class:`BlobHTTPServer`. Connections are kept
+    alive (HTTP/1.1) and closed after :attr:`timeout` seconds of inactivity.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = 60  #: Idle timeout of the keep-alive connections.
+
+    @property
+    def storage(self):
+        return self.server.storage
+
+    def log_message(self, format, *args):
+        if self.server.log_requests:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send_status(self, code, headers=(), body=b""):
+        """
+        Send complete response without the file.
+        """
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+
+        if code != 304:
+            self.send_header("Content-Length", str(len(body)))
+
+        self.end_headers()
+
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _hash_from_path(self):
+        """
+        Return the hash from the request path, or send ``404`` and return
+        None.
+        """
+        match = _HASH_PATH_RE.match(self.path.split("?", 1)[0])
+        if match:
+            return match.group(1)
+
+        self._send_status(404, body=b"Unknown object.\n")
+
+        return None
+
+    def _etag_matches(self, header, etag):
+        if header is None:
+            return False
+
+        tags = [tag.strip() for tag in header.split(",")]
+
+        return "*" in tags or etag in tags or "W/" + etag in tags
+
+    def do_GET(self):
+        file_hash = self._hash_from_path()
+        if file_hash is None:
+            return
+
+        # the object is read only once, by send_to_socket()
+        try:
+            size, is_archive = self.storage.stat_by_hash(file_hash)
+        except (IOError, OSError):
+            size, is_archive = None, None
+
+        # unpacked archives are not served
+        if size is None or is_archive:
+            return self._send_status(404, body=b"Unknown object.\n")
+
+        etag = '"%s"' % file_hash
+        headers = [
+            ("ETag", etag),
+            ("Cache-Control", CACHE_CONTROL),
+            ("Accept-Ranges", "bytes"),
+        ]
+
+        if self._etag_matches(self.headers.get("If-None-Match"), etag):
+            return self._send_status(304, headers)
+
+        offset, length = 0, size
+        partial = False
+
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                return self._send_status(
+                    416,
+                    headers + [("Content-Range", "bytes */%d" % size)]
+                )
+
+            if byte_range is not None:
+                offset, length = byte_range
+                partial = True
+                headers.append((
+                    "Content-Range",
+                    "bytes %d-%d/%d" % (offset, offset + length - 1, size)
+                ))
+
+        self.send_response(206 if partial else 200)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+        if self.command == "HEAD" or not length:
+            return
+
+        self.wfile.flush()
+
+        # sendfile() requires blocking socket
+        self.connection.settimeout(None)
+        try:
+            sent = self.storage.send_to_socket(
+                file_hash,
+                self.connection,
+                offset,
+                length
+            )
+        except (IOError, OSError):
+            sent = None
+        finally:
+            self.connection.settimeout(self.timeout)
+
+        # object disappeared / is damaged, client has to notice incomplete body
+        if sent != length:
+            self.close_connection = True
+
+    def do_HEAD(self):
+        return self.do_GET()
+
+    def do_PUT(self):
+        if self.path.split("?", 1)[0] != "/":
+            return self._send_status(405, [("Allow", "GET, HEAD, DELETE")])
+
+        content_length = self.headers.get("Content-Length")
+        if content_length is None or not content_length.isdigit():
+            self.close_connection = True
+            return self._send_status(411)
+
+        content_length = int(content_length)
+        max_size = self.server.max_upload_size
+        if max_size is not None and content_length > max_size:
+            self.close_connection = True
+            return self._send_status(413)
+
+        # reject before the body is received
+        space_budget = getattr(self.storage, "space_budget", None)
+        try:
+            if space_budget is not None:
+                space_budget.check(content_length, 2)
+
+            path = self._add_body(content_length)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOSPC:
+                raise
+
+            self.close_connection = True
+            return self._send_status(507, body=b"Insufficient storage.\n")
+
+        if path is None:
+            self.close_connection = True
+            return self._send_status(400, body=b"Incomplete body.\n")
+
+        self._send_status(
+            201,
+            [("Location", "/" + path.hash), ("ETag", '"%s"' % path.hash)],
+            (path.hash + "\n").encode("ascii")
+        )
+
+    def _add_body(self, content_length):
+        """
+        Spool the request body and add it to the storage.
+
+        Returns:
+            obj: :class:`.PathAndHash`, or None if the body is incomplete.
+        """
+        spool = tempfile.SpooledTemporaryFile(
+            max_size=self.server.spool_size,
+            dir=self.server.spool_dir
+        )
+        with spool:
+            remaining = content_length
+            while remaining:
+                piece = self.rfile.read(min(remaining, 2**16))
+                if not piece:
+                    return None
+
+                spool.write(piece)
+                remaining -= len(piece)
+
+            spool.seek(0)
+
+            return self.storage.add_file(spool)
+
+    def do_DELETE(self):
+        file_hash = self._hash_from_path()
+        if file_hash is None:
+            return
+
+        try:
+            self.storage.delete_by_hash(file_hash)
+        except (IOError, OSError):
+            return self._send_status(404, body=b"Unknown object.\n")
+
+        self._send_status(204)
+
+
+class BlobHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server of the `storage`. Each connection is handled by its own
+    thread, so the slow clients / idle keep-alive connections don't block the
+    others.
+
+    Args:
+        storage (obj): :class:`.BalancedDiscStorage` (or compatible) instance.
+        address (tuple, default ("", 8080)): Address to listen on.
+        handler (class, default BlobRequestHandler): Request handler.
+
+    Attributes:
+        spool_size (int): Uploads larger than this are spooled to disc.
+        spool_dir (str): Directory of the spooled uploads. Use directory on
+                  the same volume as the storage. Default is system temp.
+        max_upload_size (int): Reject larger uploads. None means no limit.
+        log_requests (bool): Log the requests to stderr.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+    allow_reuse_address = True
+
+    def __init__(self, storage, address=("", 8080),
+                 handler=BlobRequestHandler):
+        HTTPServer.__init__(self, address, handler)
+
+        self.storage = storage
+        self.spool_size = 2**20
+        self.spool_dir = None
+        self.max_upload_size = None
+        self.log_requests = False
+
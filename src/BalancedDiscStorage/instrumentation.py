@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import time
+import socket
+import threading
+
+
+# Functions & classes =========================================================
+class _NullTimer(object):
+    """
+    Shared no-op context manager used, when the instrumentation is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_TIMER = _NullTimer()  #: Context manager, which doesn't measure anything.
+
+
+class _Timer(object):
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.instrumentation.record(self.name, time.time() - self.start)
+        return False
+
+
+class Instrumentation(object):
+    """
+    Collect number of calls and time spent in the hot paths of the storage,
+    together with the counters (bytes hashed / written, ``os.listdir()``
+    calls, ..).
+
+    Set it as :attr:`.BalancedDiscStorage.instrumentation` to enable it.
+
+    Attributes:
+        calls (dict): Number of calls of each operation.
+        seconds (dict): Total time spent in each operation.
+        counters (dict): Values of the counters.
+        callbacks (list): Functions called as ``callback(kind, name, value)``
+                  for each measurement. `kind` is ``"timing"`` (`value` in
+                  seconds) or ``"count"``.
+    """
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks or [])
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Set all measurements to zero.
+        """
+        with self._lock:
+            self.calls = {}
+            self.seconds = {}
+            self.counters = {}
+
+    def timed(self, name):
+        """
+        Returns:
+            obj: Context manager, which measures the time of the operation \
+                 `name`.
+        """
+        return _Timer(self, name)
+
+    def record(self, name, seconds):
+        """
+        Record call of operation `name`, which took `seconds`.
+        """
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+        for callback in self.callbacks:
+            callback("timing", name, seconds)
+
+    def count(self, name, value=1):
+        """
+        Add `value` to the counter `name`.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        for callback in self.callbacks:
+            callback("count", name, value)
+
+    def to_prometheus(self, prefix="bds"):
+        """
+        Export the measurements in Prometheus text format.
+
+        Args:
+            prefix (str, default "bds"): Prefix of the metric names.
+
+        Returns:
+            str: Metrics.
+        """
+        with self._lock:
+            calls = sorted(self.calls.items())
+            seconds = sorted(self.seconds.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        if calls:
+            lines.append("# TYPE %s_calls_total counter" % prefix)
+            lines.extend(
+                '%s_calls_total{op="%s"} %d' % (prefix, name, value)
+                for name, value in calls
+            )
+
+            lines.append("# TYPE %s_call_seconds_total counter" % prefix)
+            lines.extend(
+                '%s_call_seconds_total{op="%s"} %r' % (prefix, name, value)
+                for name, value in seconds
+            )
+
+        for name, value in counters:
+            metric = "%s_%s_total" % (prefix, name)
+            lines.append("# TYPE %s counter" % metric)
+            lines.append("%s %d" % (metric, value))
+
+        return "\n".join(lines) + "\n"
+
+
+class StatsdExporter(object):
+    """
+    Callback for :class:`Instrumentation`, which sends the measurements to
+    statsd over UDP.
+
+    Args:
+        host (str, default "localhost"): Host of the statsd.
+        port (int, default 8125): Port of the statsd.
+        prefix (str, default "bds"): Prefix of the metric names.
+    """
+    def __init__(self, host="localhost", port=8125, prefix="bds"):
+        self.address = (host, port)
+        self.prefix = prefix
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, kind, name, value):
+        if kind == "timing":
+            line = "%s.%s:%d|ms" % (self.prefix, name, value * 1000)
+        else:
+            line = "%s.%s:%d|c" % (self.prefix, name, value)
+
+        try:
+            self._socket.sendto(line.encode("ascii"), self.address)
+        except (IOError, OSError):
+            pass
+
+    def close(self):
+        self._socket.close()
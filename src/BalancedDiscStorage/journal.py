@@ -0,0 +1,301 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import glob
+import threading
+from collections import namedtuple
+
+
+# Variables ===================================================================
+ADD = "add"  #: Object was added / changed.
+DELETE = "del"  #: Object was removed.
+
+#: One record of the journal. `size` is the size of the added file / archive,
+#: `path` is relative to the root of the storage.
+JournalRecord = namedtuple("JournalRecord", "op hash size path")
+
+#: Position in the journal - number of the segment and offset in it.
+JournalCursor = namedtuple("JournalCursor", "segment offset")
+
+
+# Functions & classes =========================================================
+class ChangeJournal(object):
+    """
+    Durable append-only log of the changes of the storage. Set it as
+    :attr:`.BalancedDiscStorage.journal` and each added / removed object is
+    recorded as line ``op hash size path``.
+
+    Journal is split into segments ``<path>.000001``, ``<path>.000002``, ..
+    New segment is started, when the current one grows over
+    `max_segment_size`. Segments, which were processed by all consumers, can
+    be removed by :meth:`purge`.
+
+    Consumers (see :class:`JournalReader`) read the records from given cursor
+    by :meth:`read`.
+
+    Args:
+        path (str): Path prefix of the journal segments. It should be outside
+             of the storage tree.
+        fsync (bool, default True): Call ``fsync()`` after each record, so
+              the record survives also crash of the machine.
+        max_segment_size (int, default 64MiB): Rotate the segment after this
+                         many bytes.
+    """
+    def __init__(self, path, fsync=True, max_segment_size=64 * 2**20):
+        self.path = path
+        self.fsync = fsync
+        self.max_segment_size = max_segment_size
+
+        self._lock = threading.Lock()
+
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+
+        self._cut_incomplete_record(self._segment_path(self._segment))
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _segment_path(self, segment):
+        return "%s.%06d" % (self.path, segment)
+
+    def _cut_incomplete_record(self, segment_path):
+        """
+        Truncate the segment in `segment_path` behind its last complete
+        record. Crash in the middle of :meth:`append` leaves incomplete line
+        at the end, which would be glued to the next record otherwise.
+        """
+        if not os.path.exists(segment_path):
+            return
+
+        with open(segment_path, "rb+") as segment_file:
+            segment_file.seek(0, os.SEEK_END)
+            size = segment_file.tell()
+
+            end = size
+            while end > 0:
+                start = max(end - 2**16, 0)
+                segment_file.seek(start)
+                newline = segment_file.read(end - start).rfind(b"\n")
+
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+
+                end = start
+
+            if end != size:
+                segment_file.truncate(end)
+                segment_file.flush()
+                os.fsync(segment_file.fileno())
+
+    def segments(self):
+        """
+        Returns:
+            list: Sorted numbers of the existing segments.
+        """
+        return sorted(
+            int(segment_path.rsplit(".", 1)[1])
+            for segment_path in glob.glob(self.path + ".[0-9]*")
+            if segment_path.rsplit(".", 1)[1].isdigit()
+        )
+
+    def _rotate(self):
+        """
+        Start new segment. Call only with :attr:`_lock` held.
+        """
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def append(self, op, file_hash, path):
+        """
+        Record the change.
+
+        Args:
+            op (str): :attr:`ADD` or :attr:`DELETE`.
+            file_hash (str): Hash of the object.
+            path (str): Path of the object relative to the storage root.
+        """
+        size = int(file_hash.rsplit("_", 1)[1], 16)
+        line = "%s %s %d %s\n" % (op, file_hash, size, path)
+        line = line.encode("utf-8")
+
+        with self._lock:
+            if self._file.tell() >= self.max_segment_size:
+                self._rotate()
+
+            self._file.write(line)
+            self._file.flush()
+
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def start(self):
+        """
+        Returns:
+            obj: :class:`JournalCursor` pointing to the oldest record.
+        """
+        segments = self.segments()
+
+        return JournalCursor(segments[0] if segments else 1, 0)
+
+    def end(self):
+        """
+        Returns:
+            obj: :class:`JournalCursor` pointing behind the newest record.
+        """
+        with self._lock:
+            return JournalCursor(self._segment, self._file.tell())
+
+    def read(self, cursor=None, limit=1000):
+        """
+        Read at most `limit` records, starting at `cursor`.
+
+        Args:
+            cursor (obj, default None): :class:`JournalCursor`. None means
+                   :meth:`start`.
+            limit (int, default 1000): Maximal number of records.
+
+        Returns:
+            tuple: ``(records, next_cursor)``. List of \
+                   :class:`JournalRecord` and cursor of the first unread \
+                   record.
+        """
+        cursor = cursor or self.start()
+        segment, offset = cursor
+
+        # segments may be purged in the meantime
+        segments = [item for item in self.segments() if item >= segment]
+        if segments and segments[0] != segment:
+            segment, offset = segments[0], 0
+
+        records = []
+        while segments and len(records) < limit:
+            with open(self._segment_path(segment), "rb") as segment_file:
+                segment_file.seek(offset)
+
+                while len(records) < limit:
+                    line = segment_file.readline()
+
+                    # last line may be incomplete after crash / still written
+                    if not line.endswith(b"\n"):
+                        break
+
+                    offset += len(line)
+
+                    # skip malformed records, so they don't block the readers
+                    try:
+                        record = line.decode("utf-8").rstrip("\n")
+                        record = record.split(" ", 3)
+                        if len(record) == 4:
+                            records.append(JournalRecord(
+                                op=record[0],
+                                hash=record[1],
+                                size=int(record[2]),
+                                path=record[3],
+                            ))
+                    except ValueError:
+                        continue
+
+            # rest of the segment is still being written
+            newer = [item for item in segments if item > segment]
+            if len(records) >= limit or not newer:
+                break
+
+            segment, offset = newer[0], 0
+
+        return records, JournalCursor(segment, offset)
+
+    def purge(self, cursor):
+        """
+        Remove segments, which are completely before the `cursor`.
+
+        Args:
+            cursor (obj): :class:`JournalCursor` of the slowest consumer.
+
+        Returns:
+            int: Number of removed segments.
+        """
+        removed = 0
+        for segment in self.segments():
+            if segment >= min(cursor.segment, self._segment):
+                break
+
+            os.unlink(self._segment_path(segment))
+            removed += 1
+
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JournalReader(object):
+    """
+    Consumer of the :class:`ChangeJournal`, which remembers its position.
+
+    Records returned by :meth:`read` are read again after restart, until their
+    processing is confirmed by :meth:`commit`. Position is persisted in
+    `cursor_path`, so each consumer (indexer, backup, :class:`.Mirror`, ..)
+    needs its own.
+
+    Args:
+        journal (obj): :class:`ChangeJournal` instance.
+        cursor_path (str): Path to the file with the position.
+    """
+    def __init__(self, journal, cursor_path):
+        self.journal = journal
+        self.cursor_path = cursor_path
+
+        self.cursor = None  #: Position of the first uncommitted record.
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path) as cursor_file:
+                segment, offset = cursor_file.read().split()
+                self.cursor = JournalCursor(int(segment), int(offset))
+
+        self._next_cursor = self.cursor
+
+    def read(self, limit=1000):
+        """
+        Read next at most `limit` records after the last :meth:`read`.
+
+        Returns:
+            list: :class:`JournalRecord` instances.
+        """
+        records, self._next_cursor = self.journal.read(
+            self._next_cursor,
+            limit
+        )
+
+        return records
+
+    def commit(self):
+        """
+        Confirm, that all records returned by :meth:`read` were processed.
+        """
+        if self._next_cursor is None or self._next_cursor == self.cursor:
+            return
+
+        tmp_path = self.cursor_path + ".bds_tmp"
+        with open(tmp_path, "w") as cursor_file:
+            cursor_file.write("%d %d\n" % self._next_cursor)
+
+        os.rename(tmp_path, self.cursor_path)
+
+        self.cursor = self._next_cursor
+
+    def rewind(self):
+        """
+        Forget the uncommitted :meth:`read`, so the records are read again.
+        """
+        self._next_cursor = self.cursor
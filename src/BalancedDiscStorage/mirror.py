@@ -0,0 +1,420 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from BalancedDiscStorage.journal import ADD
+from BalancedDiscStorage.journal import DELETE
+from BalancedDiscStorage.journal import JournalReader
+from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+_log = logging.getLogger(__name__)
+
+
+# Functions & classes =========================================================
+class Mirror(object):
+    """
+    Keep copy of the `storage` in the `target` directory (other volume, or
+    directory synchronized further by rsync), by applying the changes
+    recorded in the `journal` of the storage.
+
+    Changes are applied in batches by :meth:`sync`, either called directly or
+    periodically from background thread started by :meth:`start`. Failed
+    syncs of the background thread are logged and retried with exponential
+    back-off up to :attr:`max_retry_interval`. Position in
+    the journal is persisted by :class:`.JournalReader` in `state_path`, so
+    the mirror continues, where it stopped. Divergence of the target (changes
+    made before the journal was set, lost target, ..) is repaired by
+    :meth:`catch_up`.
+
+    Note:
+        Files packed by :class:`.PackedBalancedDiscStorage` are copied out of
+        the pack (never linked) and stored in the target as ordinary files,
+        so the target can be read by :class:`.BalancedDiscStorage`.
+
+    Args:
+        storage (obj): :class:`.BalancedDiscStorage` (or subclass) instance
+                with the :attr:`.BalancedDiscStorage.journal` set.
+        target (str): Path to the directory of the mirror.
+        state_path (str, default None): Where to store the position in the
+                   journal. Default is journal path with ``.mirror`` suffix.
+        link (bool, default False): Hard link the files to the target instead
+             of copying, if possible. Useful only with target on the same
+             volume, for example to protect against accidental deletes.
+        batch_size (int, default 1000): How many records to apply at once.
+        interval (float, default 1.0): How often is the journal checked by
+                 the background thread, in seconds.
+    """
+    def __init__(self, storage, target, state_path=None, link=False,
+                 batch_size=1000, interval=1.0):
+        if storage.journal is None:
+            raise ValueError("`storage` doesn't have the `journal` set!")
+
+        self.storage = storage
+        self.target = os.path.abspath(target)
+        self.state_path = state_path or storage.journal.path + ".mirror"
+        self.link = link
+        self.batch_size = batch_size
+        self.interval = interval
+
+        #: Longest wait between the retries of failed sync, in seconds.
+        self.max_retry_interval = 60.0
+
+        #: Exception from the last failed sync of the background thread, or
+        #: None if it succeeded.
+        self.last_error = None
+
+        if not os.path.exists(self.target):
+            os.makedirs(self.target)
+
+        #: :class:`.BalancedDiscStorage` over the `target`, which stores the
+        #: packed files.
+        self.target_storage = BalancedDiscStorage(self.target)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        #: :class:`.JournalReader` with position of the first unapplied
+        #: record.
+        self.reader = JournalReader(storage.journal, self.state_path)
+
+    def _copy_file(self, src, dst):
+        """
+        Atomically replace `dst` with hard link to / copy of the `src`.
+        """
+        dir_path = os.path.dirname(dst)
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        tmp_path = dst + ".bds_tmp"
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+        try:
+            if not self.link:
+                raise OSError("Linking disabled.")
+
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+
+        os.rename(tmp_path, dst)
+
+    def _copy_object(self, src, dst):
+        """
+        Copy file / unpacked archive `src` to `dst`. Members of the archive,
+        which are not in the `src` anymore, are removed from `dst`.
+        """
+        if os.path.isfile(src):
+            return self._copy_file(src, dst)
+
+        if os.path.isfile(dst):
+            os.unlink(dst)
+
+        for dir_path, dir_names, file_names in os.walk(dst, topdown=False):
+            rel_dir = os.path.relpath(dir_path, dst)
+            for file_name in file_names:
+                if not os.path.isfile(os.path.join(src, rel_dir, file_name)):
+                    os.unlink(os.path.join(dir_path, file_name))
+
+            if not os.path.isdir(os.path.join(src, rel_dir)):
+                os.rmdir(dir_path)
+
+        for dir_path, dir_names, file_names in os.walk(src):
+            rel_dir = os.path.relpath(dir_path, src)
+            if not os.path.isdir(os.path.join(dst, rel_dir)):
+                os.makedirs(os.path.join(dst, rel_dir))
+
+            for file_name in file_names:
+                self._copy_file(
+                    os.path.join(dir_path, file_name),
+                    os.path.join(dst, rel_dir, file_name)
+                )
+
+    def _remove_object(self, dst):
+        """
+        Remove file / unpacked archive `dst` from target, together with its
+        sidecars and blank parent directories.
+        """
+        for sidecar_path in self.storage._sidecar_paths(dst):
+            os.unlink(sidecar_path)
+
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.exists(dst):
+            os.unlink(dst)
+
+        path = os.path.dirname(dst)
+        while len(path) > len(self.target):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+
+            path = os.path.dirname(path)
+
+    def _packed_hash(self, rel_path):
+        """
+        Return hash of the packed file recorded as `rel_path` (see
+        :class:`.PackedBalancedDiscStorage`), or None for other objects.
+        """
+        pack_path = getattr(self.storage, "pack_path", None)
+        if pack_path is None:
+            return None
+
+        path = os.path.join(self.storage.path, rel_path)
+        if os.path.dirname(path) != pack_path:
+            return None
+
+        return os.path.basename(path)
+
+    def _apply_packed(self, file_hash, op):
+        """
+        Apply the last change `op` of the packed file `file_hash` to the
+        :attr:`target_storage`.
+        """
+        if op == ADD:
+            try:
+                reader = self.storage.open_by_hash(file_hash)
+            except (IOError, OSError):
+                reader = None  # already removed from storage
+
+            if reader is not None:
+                with reader:
+                    self.target_storage._add_hashed_file(reader, file_hash)
+                return
+
+        try:
+            self.target_storage.delete_by_hash(file_hash)
+        except (IOError, OSError):
+            pass  # not mirrored yet
+
+    def _apply(self, rel_path, op):
+        """
+        Apply the last change `op` of the object in `rel_path` to the target.
+        """
+        packed_hash = self._packed_hash(rel_path)
+        if packed_hash is not None:
+            return self._apply_packed(packed_hash, op)
+
+        src = os.path.join(self.storage.path, rel_path)
+        dst = os.path.join(self.target, rel_path)
+
+        # object may be already removed from storage, deletion is also in log
+        if op == DELETE or not os.path.exists(src):
+            return self._remove_object(dst)
+
+        self._copy_object(src, dst)
+
+        for sidecar_path in self.storage._sidecar_paths(src):
+            self._copy_file(
+                sidecar_path,
+                os.path.join(
+                    self.target,
+                    os.path.relpath(sidecar_path, self.storage.path)
+                )
+            )
+
+    def sync(self):
+        """
+        Apply all changes from the journal, which were not yet applied.
+
+        Returns:
+            int: Number of applied journal records.
+        """
+        applied = 0
+
+        with self._lock:
+            while True:
+                records = self.reader.read(self.batch_size)
+                if not records:
+                    break
+
+                # only the last change of each object in the batch matters
+                changes = OrderedDict()
+                for record in records:
+                    changes.pop(record.path, None)
+                    changes[record.path] = record.op
+
+                try:
+                    for rel_path, op in changes.items():
+                        self._apply(rel_path, op)
+                except Exception:
+                    self.reader.rewind()
+                    raise
+
+                self.reader.commit()
+                applied += len(records)
+
+        return applied
+
+    def _differs(self, src, dst, checksum):
+        """
+        Compare file / unpacked archive `src` with its copy `dst`.
+        """
+        if os.path.isfile(src) != os.path.isfile(dst) or \
+           os.path.isdir(src) != os.path.isdir(dst):
+            return True
+
+        if os.path.isfile(src):
+            if os.path.getsize(src) != os.path.getsize(dst):
+                return True
+
+            if not checksum:
+                return False
+
+            return self._checksum(src) != self._checksum(dst)
+
+        src_names = set(os.listdir(src))
+        if src_names != set(os.listdir(dst)):
+            return True
+
+        return any(
+            self._differs(
+                os.path.join(src, name),
+                os.path.join(dst, name),
+                checksum
+            )
+            for name in src_names
+        )
+
+    def _checksum(self, path):
+        with open(path, "rb") as file_obj:
+            return self._checksum_file(file_obj)
+
+    def _checksum_file(self, file_obj):
+        hash_obj = self.storage.hash_builder()
+        for part in self.storage._get_file_iterator(file_obj):
+            hash_obj.update(part)
+
+        return hash_obj.hexdigest()
+
+    def _packed_differs(self, path, checksum):
+        """
+        Compare packed file `path` with its copy in the
+        :attr:`target_storage`.
+        """
+        try:
+            dst = self.target_storage.file_path_from_hash(path.hash)
+        except (IOError, OSError):
+            return True
+
+        if not os.path.isfile(dst) or os.path.getsize(dst) != path.length:
+            return True
+
+        if not checksum:
+            return False
+
+        with self.storage.open_by_hash(path.hash) as reader:
+            return self._checksum_file(reader) != self._checksum(dst)
+
+    def catch_up(self, checksum=False):
+        """
+        Compare whole storage with the target and repair the differences:
+        copy missing / different objects and remove objects, which are not in
+        the storage.
+
+        Args:
+            checksum (bool, default False): Compare also content of the files,
+                     not only sizes.
+
+        Returns:
+            int: Number of repaired objects.
+        """
+        repaired = 0
+
+        with self._lock:
+            rel_paths = set()
+            packed_hashes = set()
+            for path in self.storage.iter_paths():
+                if path.offset is not None:
+                    packed_hashes.add(path.hash)
+                    if self._packed_differs(path, checksum):
+                        self._apply_packed(path.hash, ADD)
+                        repaired += 1
+
+                    continue
+
+                rel_path = os.path.relpath(path.rstrip("/"), self.storage.path)
+                rel_paths.add(rel_path)
+
+                dst = os.path.join(self.target, rel_path)
+                sidecars_differ = any(
+                    self._differs(
+                        sidecar_path,
+                        os.path.join(
+                            self.target,
+                            os.path.relpath(sidecar_path, self.storage.path)
+                        ),
+                        checksum
+                    )
+                    for sidecar_path in self.storage._sidecar_paths(path)
+                )
+                if sidecars_differ or self._differs(path, dst, checksum):
+                    self._apply(rel_path, ADD)
+                    repaired += 1
+
+            for path in list(self.target_storage.iter_paths()):
+                rel_path = os.path.relpath(path.rstrip("/"), self.target)
+                if rel_path not in rel_paths and \
+                   path.hash not in packed_hashes:
+                    self._remove_object(os.path.join(self.target, rel_path))
+                    repaired += 1
+
+        return repaired
+
+    def _run(self):
+        wait = self.interval
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                _log.exception("Mirror sync to '%s' failed.", self.target)
+                self.last_error = e
+                wait = min(wait * 2, self.max_retry_interval)
+            else:
+                self.last_error = None
+                wait = self.interval
+
+            self._stop.wait(wait)
+
+    def start(self):
+        """
+        Start the background thread, which calls :meth:`sync` each
+        :attr:`interval` seconds.
+        """
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and apply the remaining changes.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        self.sync()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
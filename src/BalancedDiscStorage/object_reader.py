@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import threading
+
+
+# Functions & classes =========================================================
+class ObjectReader(object):
+    """
+    Read-only file-like object over the part of the open file descriptor.
+
+    Reader doesn't own the descriptor. Each reader keeps its own position and
+    reads using ``pread()``, so multiple readers (also from different threads)
+    may share the same descriptor.
+
+    Args:
+        fd (int): Open file descriptor.
+        start (int): Offset of the object in the file.
+        length (int): Length of the object.
+        lock (obj, default None): Lock serializing ``lseek()`` + ``read()`` on
+             the shared descriptor, on platforms without ``pread()``.
+        on_close (fn, default None): Called once, when the reader is closed.
+    """
+    def __init__(self, fd, start, length, lock=None, on_close=None):
+        self.fd = fd
+        self.start = start
+        self.length = length
+
+        self._lock = lock or threading.Lock()
+        self._on_close = on_close
+        self._position = 0
+        self.closed = False
+
+    def _pread(self, size, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, size, offset)
+
+        with self._lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+    def read(self, size=-1):
+        """
+        Read `size` bytes from the current position.
+
+        Args:
+            size (int, default -1): Number of bytes. Negative number reads
+                 everything up to the end of the object.
+
+        Returns:
+            str: Read data.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+
+        remaining = max(self.length - self._position, 0)
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        pieces = []
+        while size > 0:
+            piece = self._pread(size, self.start + self._position)
+            if not piece:
+                break
+
+            pieces.append(piece)
+            self._position += len(piece)
+            size -= len(piece)
+
+        return b"".join(pieces)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.length
+
+        if offset < 0:
+            raise IOError("Negative seek position %d." % offset)
+
+        self._position = offset
+
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._on_close:
+            self._on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,512 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import re
+import threading
+
+from BalancedDiscStorage.path_and_hash import PathAndHash
+from BalancedDiscStorage.object_reader import ObjectReader
+from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+_SEGMENT_NAME_RE = re.compile(r"^segment-(\d+)\.pack$")
+
+
+# Functions & classes =========================================================
+class _Segment(object):
+    """
+    Bookkeeping of one pack segment.
+
+    Attributes:
+        id (int): Number of the segment.
+        path (str): Path of the segment file.
+        size (int): Size of the segment file.
+        dead (int): Number of bytes used by deleted objects.
+    """
+    def __init__(self, id, path):
+        self.id = id
+        self.path = path
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.dead = 0
+
+
+class PackedBalancedDiscStorage(BalancedDiscStorage):
+    """
+    This class is the same as :class:`.BalancedDiscStorage`, but files smaller
+    than :attr:`pack_threshold` are not stored as separate files. They are
+    appended to large segment files in ``packs/`` subdirectory of the storage,
+    and an index maps their hashes to ``(segment, offset, length)``.
+
+    Index is kept in memory and persisted in append-only ``packs/index.log``.
+    Space of the deleted objects is reclaimed by :meth:`compact`.
+
+    Note:
+        Packed files are never compressed. They are recorded to the
+        :attr:`journal` with ``packs/<hash>`` path.
+    """
+    def __init__(self, path, dir_limit=32000, fd_budget=64):
+        super(PackedBalancedDiscStorage, self).__init__(
+            path,
+            dir_limit,
+            fd_budget
+        )
+
+        self.pack_threshold = 4096  #: Files smaller than this are packed.
+        self.segment_size = 2**30  #: Size after which new segment is started.
+
+        #: Directory with the segments and the index.
+        self.pack_path = os.path.join(self.path, "packs")
+        if not os.path.exists(self.pack_path):
+            os.mkdir(self.pack_path)
+
+        self._pack_lock = threading.RLock()
+        self._index = {}
+        self._segments = {}
+        self._load_index()
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.pack_path, "segment-%06d.pack" % segment_id)
+
+    def _index_path(self):
+        return os.path.join(self.pack_path, "index.log")
+
+    def _get_segment(self, segment_id):
+        segment = self._segments.get(segment_id)
+
+        if segment is None:
+            segment = _Segment(segment_id, self._segment_path(segment_id))
+            self._segments[segment_id] = segment
+
+        return segment
+
+    def _load_index(self):
+        """
+        Read the index log into memory.
+
+        Dead space of the segments is computed as the segment size minus the
+        size of the live files, because :meth:`_rewrite_index` drops the
+        records of the deleted files.
+        """
+        for file_name in os.listdir(self.pack_path):
+            match = _SEGMENT_NAME_RE.match(file_name)
+            if match:
+                self._get_segment(int(match.group(1)))
+
+        if os.path.exists(self._index_path()):
+            self._read_index_log()
+
+        live = dict((segment_id, 0) for segment_id in self._segments)
+        for segment_id, offset, length in self._index.values():
+            live[segment_id] = live.get(segment_id, 0) + length
+
+        for segment_id, segment in self._segments.items():
+            segment.dead = max(segment.size - live[segment_id], 0)
+
+    def _read_index_log(self):
+        """
+        Replay the records of the index log.
+        """
+        with open(self._index_path()) as index_file:
+            for line in index_file:
+                record = line.split()
+
+                # last line may be incomplete after crash
+                if record[:1] == ["add"] and len(record) == 5:
+                    file_hash = record[1]
+                    location = tuple(int(item) for item in record[2:])
+
+                    self._forget(file_hash)
+                    self._index[file_hash] = location
+                    self._get_segment(location[0])
+
+                elif record[:1] == ["del"] and len(record) == 2:
+                    self._forget(record[1])
+
+    def _forget(self, file_hash):
+        """
+        Remove `file_hash` from the index and count its space as dead.
+        """
+        location = self._index.pop(file_hash, None)
+        if location is None:
+            return None
+
+        segment_id, offset, length = location
+        self._get_segment(segment_id).dead += length
+
+        return location
+
+    def _log(self, *records):
+        """
+        Append `records` (tuples) to the index log.
+        """
+        lines = "".join(
+            " ".join(str(item) for item in record) + "\n"
+            for record in records
+        )
+
+        with open(self._index_path(), "a") as index_file:
+            index_file.write(lines)
+
+    def _active_segment(self):
+        """
+        Return segment, to which the new objects are appended.
+        """
+        if not self._segments:
+            return self._get_segment(1)
+
+        segment = self._segments[max(self._segments)]
+        if segment.size >= self.segment_size:
+            return self._get_segment(segment.id + 1)
+
+        return segment
+
+    def _append(self, file_hash, data):
+        """
+        Append `data` to the active segment and index it. Call only with
+        :attr:`_pack_lock` held.
+
+        Returns:
+            tuple: ``(segment_id, offset, length)``.
+        """
+        segment = self._active_segment()
+
+        fd = os.open(segment.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+        finally:
+            os.close(fd)
+
+        location = (segment.id, segment.size, len(data))
+        segment.size += len(data)
+
+        if self.instrumentation is not None:
+            self.instrumentation.count("bytes_written", len(data))
+
+        self._index[file_hash] = location
+        self._log(("add", file_hash) + location)
+
+        return location
+
+    def _packed_path(self, file_hash, location):
+        segment_id, offset, length = location
+
+        return PathAndHash(
+            path=self._segment_path(segment_id),
+            hash=file_hash,
+            offset=offset,
+            length=length,
+        )
+
+    def _record_change(self, op, path, file_hash=None):
+        """
+        Record change of the object in `path` to the :attr:`journal`. Packed
+        files are recorded as ``packs/<hash>``, because their path is the
+        whole segment.
+
+        See :meth:`.BalancedDiscStorage._record_change` for details.
+        """
+        if getattr(path, "offset", None) is not None:
+            file_hash = path.hash
+            path = os.path.join(self.pack_path, path.hash)
+
+        return super(PackedBalancedDiscStorage, self)._record_change(
+            op,
+            path,
+            file_hash
+        )
+
+    def _write_file(self, file_obj, file_hash):
+        """
+        Write the `file_obj` with known `file_hash` into the storage. Files
+        smaller than :attr:`pack_threshold` are appended to the pack.
+
+        Args:
+            file_obj (file): Opened file-like object.
+            file_hash (str): Hash of the `file_obj` (see :meth:`_get_hash`).
+
+        Returns:
+            obj: Path where the file-like object is stored contained with hash\
+                 in :class:`.PathAndHash` object. Packed files have also \
+                 ``.offset`` and ``.length`` set.
+        """
+        size = int(file_hash.rsplit("_", 1)[1], 16)
+        if size >= self.pack_threshold:
+            return super(PackedBalancedDiscStorage, self)._write_file(
+                file_obj,
+                file_hash
+            )
+
+        with self._reserve_space(size, 0), self._pack_lock:
+            location = self._index.get(file_hash)
+            if location is None:
+                file_obj.seek(0)
+                location = self._append(file_hash, file_obj.read())
+                self._record_change(
+                    "add",
+                    self._packed_path(file_hash, location)
+                )
+
+        return self._packed_path(file_hash, location)
+
+    def file_path_from_hash(self, file_hash, path=None, hash_list=None):
+        """
+        For given `file_hash`, return path on filesystem. Packed files are
+        returned as path to the segment, with ``.offset`` and ``.length`` of
+        the file in it.
+
+        See :meth:`.BalancedDiscStorage.file_path_from_hash` for details.
+        """
+        location = self._index.get(file_hash)
+        if location is not None:
+            return self._packed_path(file_hash, location)
+
+        return super(PackedBalancedDiscStorage, self).file_path_from_hash(
+            file_hash,
+            path,
+            hash_list
+        )
+
+    def _acquire_segment(self, segment_id):
+        """
+        Return cached descriptor of the segment from :attr:`fd_cache`.
+        """
+        return self.fd_cache.acquire(
+            "segment-%06d" % segment_id,
+            lambda key: (
+                os.open(self._segment_path(segment_id), os.O_RDONLY),
+                None
+            )
+        )
+
+    def open_by_hash(self, file_hash):
+        """
+        Open file identified by `file_hash` for reading. See
+        :meth:`.BalancedDiscStorage.open_by_hash` for details.
+        """
+        location = self._index.get(file_hash)
+        if location is None:
+            return super(PackedBalancedDiscStorage, self).open_by_hash(
+                file_hash
+            )
+
+        segment_id, offset, length = location
+        entry = self._acquire_segment(segment_id)
+
+        return ObjectReader(
+            fd=entry.fd,
+            start=offset,
+            length=length,
+            lock=entry.lock,
+            on_close=lambda: self.fd_cache.release(entry),
+        )
+
+    def read_range(self, file_hash, offset, length):
+        """
+        Read part of the file identified by `file_hash`. See
+        :meth:`.BalancedDiscStorage.read_range` for details.
+        """
+        if file_hash not in self._index:
+            return super(PackedBalancedDiscStorage, self).read_range(
+                file_hash,
+                offset,
+                length
+            )
+
+        with self.open_by_hash(file_hash) as reader:
+            reader.seek(offset)
+            return reader.read(length)
+
+    def send_to_socket(self, file_hash, sock, offset=0, length=None):
+        """
+        Send the file identified by `file_hash` to the `sock`. See
+        :meth:`.BalancedDiscStorage.send_to_socket` for details.
+        """
+        location = self._index.get(file_hash)
+        if location is None:
+            return super(PackedBalancedDiscStorage, self).send_to_socket(
+                file_hash,
+                sock,
+                offset,
+                length
+            )
+
+        segment_id, start, size = location
+        entry = self._acquire_segment(segment_id)
+
+        try:
+            return self._send_fd(entry, start, size, sock, offset, length)
+        finally:
+            self.fd_cache.release(entry)
+
+    def iter_paths(self):
+        """
+        Iterate over all objects in the storage, packed files included.
+
+        Yields:
+            obj: :class:`.PathAndHash` of each stored object.
+        """
+        for path in super(PackedBalancedDiscStorage, self).iter_paths():
+            yield path
+
+        with self._pack_lock:
+            index = list(self._index.items())
+
+        for file_hash, location in index:
+            yield self._packed_path(file_hash, location)
+
+    def _delete_hash(self, file_hash):
+        """
+        Remove file/archive by it's `file_hash`, regardless of references.
+        Space of the packed files is reclaimed by :meth:`compact`.
+        """
+        with self._pack_lock:
+            location = self._forget(file_hash)
+            if location is not None:
+                self._log(("del", file_hash))
+                self._record_change(
+                    "del",
+                    self._packed_path(file_hash, location)
+                )
+                return
+
+        return super(PackedBalancedDiscStorage, self)._delete_hash(file_hash)
+
+    def _delete_many(self, file_hashes, processes):
+        """
+        Remove files/archives by their hashes. Packed files are removed from
+        the index at once, with single write to the index log.
+
+        Returns:
+            int: Number of removed files.
+        """
+        file_hashes = list(file_hashes)
+        unpacked_hashes = []
+
+        # stripe locks of all hashes, so nobody references them again before
+        # the index is updated; always taken in the same order, before the
+        # pack lock, as in _add_hashed_file()
+        stripes = []
+        if self.ref_counter is not None:
+            stripes = sorted(
+                set(self.ref_counter.lock_for(h) for h in file_hashes),
+                key=id
+            )
+
+        for stripe in stripes:
+            stripe.acquire()
+
+        try:
+            with self._pack_lock:
+                records = []
+                deleted = []
+                for file_hash in file_hashes:
+                    if self.ref_counter and self.ref_counter.get(file_hash):
+                        continue
+
+                    location = self._forget(file_hash)
+                    if location is None:
+                        unpacked_hashes.append(file_hash)
+                    else:
+                        records.append(("del", file_hash))
+                        deleted.append(self._packed_path(file_hash, location))
+
+                if records:
+                    self._log(*records)
+
+                for path in deleted:
+                    self._record_change("del", path)
+        finally:
+            for stripe in stripes:
+                stripe.release()
+
+        return len(records) + super(
+            PackedBalancedDiscStorage,
+            self
+        )._delete_many(unpacked_hashes, processes)
+
+    def delete_by_path(self, path):
+        """
+        Delete file/directory identified by `path` argument. Packed files
+        (paths with ``.offset``) are deleted from the pack.
+
+        Raises:
+            IOError: If the file / directory doesn't exists, is not in \
+                     :attr:`path`, or is the pack itself.
+        """
+        if getattr(path, "offset", None) is not None:
+            return self._delete_hash(path.hash)
+
+        if path.startswith(os.path.join(self.pack_path, "")):
+            raise IOError("Can't delete pack '%s' by path!" % path)
+
+        return super(PackedBalancedDiscStorage, self).delete_by_path(path)
+
+    def compact(self, min_dead_ratio=0.5):
+        """
+        Reclaim space of the deleted packed files. Live files from segments,
+        where at least `min_dead_ratio` of the space is dead, are appended to
+        the active segment and the old segments are removed. Index log is
+        rewritten to contain only live files.
+
+        Args:
+            min_dead_ratio (float, default 0.5): Which segments to compact.
+
+        Returns:
+            int: Number of reclaimed bytes.
+        """
+        with self._pack_lock:
+            active = self._active_segment()
+            victims = [
+                segment for segment in self._segments.values()
+                if segment is not active and (
+                    segment.size == 0 or
+                    float(segment.dead) / segment.size >= min_dead_ratio
+                )
+            ]
+            victim_ids = set(segment.id for segment in victims)
+
+            for file_hash, location in list(self._index.items()):
+                segment_id, offset, length = location
+                if segment_id not in victim_ids:
+                    continue
+
+                with open(self._segment_path(segment_id), "rb") as segment:
+                    segment.seek(offset)
+                    self._append(file_hash, segment.read(length))
+
+            reclaimed = 0
+            for segment in victims:
+                reclaimed += segment.dead
+                del self._segments[segment.id]
+
+                self.fd_cache.invalidate("segment-%06d" % segment.id)
+                if os.path.exists(segment.path):
+                    os.unlink(segment.path)
+
+            self._rewrite_index()
+
+        return reclaimed
+
+    def _rewrite_index(self):
+        """
+        Atomically replace the index log with records of the live files.
+        """
+        tmp_path = self._index_path() + ".bds_tmp"
+
+        with open(tmp_path, "w") as index_file:
+            for file_hash, (segment_id, offset, length) in self._index.items():
+                index_file.write("add %s %d %d %d\n" % (
+                    file_hash,
+                    segment_id,
+                    offset,
+                    length
+                ))
+
+        os.rename(tmp_path, self._index_path())
@@ -19,15 +19,23 @@ class PathAndHash(str):
     Attributes:
         path (str): Path to the file.
         hash (str): Hash of the file.
+        offset (int): Offset of the file in `path`, if the file is stored in
+               pack (see :class:`.PackedBalancedDiscStorage`). None otherwise.
+        length (int): Length of the packed file. None for other files.
+        tier (str): Tier, which served the file (``"fast"`` / ``"slow"``),
+             see :class:`.TieredBalancedDiscStorage`. None otherwise.
     """
-    def __new__(self, path, hash=None):
+    def __new__(self, path, hash=None, offset=None, length=None, tier=None):
         return super(PathAndHash, self).__new__(self, path)
 
-    def __init__(self, path, hash=None):
-        super(PathAndHash, self).__init__(path)
+    def __init__(self, path, hash=None, offset=None, length=None, tier=None):
+        super(PathAndHash, self).__init__()
 
         self.path = path
         self.hash = hash
+        self.offset = offset
+        self.length = length
+        self.tier = tier
 
     def __repr__(self):
         return self.path
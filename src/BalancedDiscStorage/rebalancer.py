@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import time
+import errno
+import threading
+from multiprocessing.pool import ThreadPool
+
+from BalancedDiscStorage.balanced_disc_storage import _OBJECT_NAME_RE
+
+
+# Functions & classes =========================================================
+class Rebalancer(object):
+    """
+    Move the objects from directories, which have more entries than
+    :attr:`.BalancedDiscStorage.dir_limit` (typically because the limit was
+    lowered), one level deeper into the tree, where the
+    :meth:`.BalancedDiscStorage.file_path_from_hash` looks for them.
+
+    Storage stays readable during the rebalancing. Files are first hard linked
+    to the new place and then unlinked from the old one, so they are always
+    visible at least at one place. Unpacked archives are moved using atomic
+    rename.
+
+    Note:
+        Only overfull directories are changed. Raising the limit doesn't move
+        anything back up.
+
+    Args:
+        storage (obj): :class:`.BalancedDiscStorage` (or subclass) instance.
+        processes (int, default 4): Number of threads. Each of them processes
+                  different top-level directory.
+        max_moves_per_second (float, default None): Throttle the moves. None
+                             means no throttling.
+    """
+    def __init__(self, storage, processes=4, max_moves_per_second=None):
+        self.storage = storage
+        self.processes = processes
+        self.max_moves_per_second = max_moves_per_second
+
+        self._lock = threading.Lock()
+        self._next_move = 0
+        self._moved = 0
+
+    def _throttle(self):
+        """
+        Block the calling thread, so the moves don't exceed
+        :attr:`max_moves_per_second`.
+        """
+        with self._lock:
+            self._moved += 1
+
+            if not self.max_moves_per_second:
+                return
+
+            now = time.time()
+            wait = self._next_move - now
+            self._next_move = max(now, self._next_move)
+            self._next_move += 1.0 / self.max_moves_per_second
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def _move(self, path, name, sub_path):
+        """
+        Move object `name` (and its sidecar files) from `path` to `sub_path`.
+        The move is recorded to the journal of the :attr:`storage` as addition
+        of the new path and deletion of the old one.
+
+        Args:
+            path (str): Directory in which the object is stored.
+            name (str): Name of the object (it's hash).
+            sub_path (str): Subdirectory, to which the object is moved.
+
+        Returns:
+            int: Number of entries, which were removed from `path`.
+        """
+        self._throttle()
+
+        try:
+            os.mkdir(sub_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        old_path = os.path.join(path, name)
+        new_path = os.path.join(sub_path, name)
+        sidecar_paths = self.storage._sidecar_paths(old_path)
+
+        if os.path.isdir(old_path):
+            os.rename(old_path, new_path)
+        else:
+            try:
+                os.link(old_path, new_path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            os.unlink(old_path)
+
+        for sidecar_path in sidecar_paths:
+            os.rename(
+                sidecar_path,
+                os.path.join(sub_path, os.path.basename(sidecar_path))
+            )
+
+        self.storage._record_change("add", new_path)
+        self.storage._record_change("del", old_path)
+
+        return 1 + len(sidecar_paths)
+
+    def _rebalance_dir(self, path, depth):
+        """
+        Rebalance `path` and all its subdirectories.
+
+        Args:
+            path (str): Path of the directory in the tree.
+            depth (int): Depth of the `path` in the tree (first level is 1).
+                  It is also index of the character of the hash, which names
+                  the subdirectories.
+        """
+        entries = os.listdir(path)
+
+        objects = sorted(
+            entry for entry in entries
+            if _OBJECT_NAME_RE.match(entry) and len(entry) > depth
+        )
+        sub_dirs = set(
+            entry for entry in entries
+            if not _OBJECT_NAME_RE.match(entry) and
+            os.path.isdir(os.path.join(path, entry))
+        )
+
+        count = len(entries)
+        while count > self.storage.dir_limit and objects:
+            name = objects.pop()
+            sub_dir = name[depth]
+
+            if sub_dir not in sub_dirs:
+                sub_dirs.add(sub_dir)
+                count += 1
+
+            count -= self._move(path, name, os.path.join(path, sub_dir))
+
+        for sub_dir in sub_dirs:
+            self._rebalance_dir(os.path.join(path, sub_dir), depth + 1)
+
+    def run(self):
+        """
+        Rebalance the whole storage.
+
+        Returns:
+            int: Number of moved objects.
+        """
+        self._moved = 0
+
+        top_dirs = [
+            os.path.join(self.storage.path, entry)
+            for entry in os.listdir(self.storage.path)
+            if len(entry) == 1 and
+            os.path.isdir(os.path.join(self.storage.path, entry))
+        ]
+
+        pool = ThreadPool(self.processes)
+        try:
+            pool.map(lambda path: self._rebalance_dir(path, 1), top_dirs)
+        finally:
+            pool.close()
+            pool.join()
+
+        return self._moved
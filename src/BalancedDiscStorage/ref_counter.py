@@ -0,0 +1,286 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import json
+import time
+import threading
+
+
+# Functions & classes =========================================================
+class RefCounter(object):
+    """
+    Count references (number of producers, which added the same content) for
+    each hash, so the shared file is removed only when nobody uses it.
+
+    Counts are kept in memory. Changed counts are appended to the delta log
+    (``<path>.log.<n>``), when `flush_interval` seconds or `flush_every`
+    changes passed since the last flush, and on :meth:`close`. Once the log
+    is longer than the number of counted hashes, snapshot of all counts is
+    written to `path` as JSON and new log is started, so the cost of the
+    flushes is proportional to the number of changes, not to the size of the
+    storage.
+
+    Warning:
+        Changes made since the last flush are lost in case of crash.
+
+    Args:
+        path (str): Path to the file with the counts. It should be outside of
+             the storage tree.
+        flush_interval (float, default 5.0): Flush at most after this many
+                       seconds.
+        flush_every (int, default 1000): Flush at most after this many
+                    changes.
+        stripes (int, default 64): Number of locks used by :meth:`lock_for`.
+    """
+    def __init__(self, path, flush_interval=5.0, flush_every=1000,
+                 stripes=64):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+
+        self._counts = {}
+        self._pending = {}  # changed counts, which are not in the log yet
+        self._changes = 0
+        self._last_flush = time.time()
+
+        self._log_id = 0  # number of the log, which follows the snapshot
+        self._logged = 0  # number of records in the log
+
+        self._load()
+
+    def _log_path(self, log_id):
+        return "%s.log.%d" % (self.path, log_id)
+
+    def _log_ids(self):
+        """
+        Returns:
+            list: Sorted numbers of the existing delta logs.
+        """
+        dir_path, prefix = os.path.split(self.path + ".log.")
+
+        return sorted(
+            int(file_name[len(prefix):])
+            for file_name in os.listdir(dir_path or ".")
+            if file_name.startswith(prefix) and
+            file_name[len(prefix):].isdigit()
+        )
+
+    def _load(self):
+        """
+        Read the snapshot and replay the logs written after it.
+        """
+        if os.path.exists(self.path):
+            with open(self.path) as counts_file:
+                snapshot = json.load(counts_file)
+
+            self._counts = snapshot["counts"]
+            self._log_id = snapshot["log"]
+
+        for log_id in self._log_ids():
+            # already in the snapshot, crash before the log was removed
+            if log_id < self._log_id:
+                os.unlink(self._log_path(log_id))
+                continue
+
+            with open(self._log_path(log_id)) as log_file:
+                for line in log_file:
+                    record = line.split()
+
+                    # last line may be incomplete after crash
+                    if len(record) != 2 or not record[1].isdigit():
+                        continue
+
+                    self._logged += 1
+                    if int(record[1]):
+                        self._counts[record[0]] = int(record[1])
+                    else:
+                        self._counts.pop(record[0], None)
+
+            self._log_id = log_id
+
+    def lock_for(self, file_hash):
+        """
+        Return lock for `file_hash`. Hold it while the file is written /
+        removed together with the change of its count, so concurrent add
+        and delete of the same content don't race.
+
+        Args:
+            file_hash (str): Hash of the file.
+
+        Returns:
+            obj: :class:`threading.Lock` shared by a stripe of hashes.
+        """
+        return self._stripes[hash(file_hash) % len(self._stripes)]
+
+    def get(self, file_hash):
+        """
+        Returns:
+            int: Number of references of the `file_hash`.
+        """
+        return self._counts.get(file_hash, 0)
+
+    def _change(self, file_hash, delta):
+        with self._lock:
+            count = max(self._counts.get(file_hash, 0) + delta, 0)
+
+            if count:
+                self._counts[file_hash] = count
+            else:
+                self._counts.pop(file_hash, None)
+
+            self._pending[file_hash] = count
+            self._changes += 1
+            flush = self._flush_is_due()
+
+        if flush:
+            self._flush(wait=False)
+
+        return count
+
+    def increment(self, file_hash):
+        """
+        Add reference to the `file_hash`.
+
+        Returns:
+            int: New number of references.
+        """
+        return self._change(file_hash, 1)
+
+    def decrement(self, file_hash):
+        """
+        Remove reference to the `file_hash`. Hashes without references are
+        counted as zero.
+
+        Returns:
+            int: New number of references.
+        """
+        return self._change(file_hash, -1)
+
+    def release_many(self, file_hashes):
+        """
+        Remove one reference from each of `file_hashes`.
+
+        Returns:
+            list: Hashes, which have no references left.
+        """
+        return [
+            file_hash
+            for file_hash in file_hashes
+            if self.decrement(file_hash) == 0
+        ]
+
+    def discard(self, file_hashes):
+        """
+        Forget all references of the `file_hashes`.
+        """
+        with self._lock:
+            for file_hash in file_hashes:
+                if self._counts.pop(file_hash, None) is not None:
+                    self._pending[file_hash] = 0
+                    self._changes += 1
+
+            flush = self._flush_is_due()
+
+        if flush:
+            self._flush(wait=False)
+
+    def _flush_is_due(self):
+        """
+        Check, whether it is the time to flush. Call only with :attr:`_lock`
+        held.
+        """
+        if not self._changes:
+            return False
+
+        elapsed = time.time() - self._last_flush
+
+        return self._changes >= self.flush_every or \
+            elapsed >= self.flush_interval
+
+    def _flush(self, wait=True):
+        """
+        Append the pending changes to the log, or write the snapshot, if the
+        log is too long. Only the swap of the pending changes is done under
+        :attr:`_lock`, the writes happen outside of it.
+
+        Args:
+            wait (bool, default True): Wait for the concurrent flush. If
+                 False, the flush is left to it.
+        """
+        if not self._flush_lock.acquire(wait):
+            return
+
+        try:
+            with self._lock:
+                snapshot = not os.path.exists(self.path) or \
+                    self._logged + len(self._pending) >= max(
+                        len(self._counts),
+                        self.flush_every
+                    )
+
+                if snapshot:
+                    counts = dict(self._counts)
+                    self._log_id += 1
+                    self._logged = 0
+                else:
+                    self._logged += len(self._pending)
+
+                pending, self._pending = self._pending, {}
+                self._changes = 0
+                self._last_flush = time.time()
+
+            if snapshot:
+                self._write_snapshot(counts)
+            else:
+                self._append_log(pending)
+        finally:
+            self._flush_lock.release()
+
+    def _append_log(self, pending):
+        with open(self._log_path(self._log_id), "a") as log_file:
+            log_file.write("".join(
+                "%s %d\n" % (file_hash, count)
+                for file_hash, count in pending.items()
+            ))
+
+    def _write_snapshot(self, counts):
+        tmp_path = self.path + ".bds_tmp"
+        with open(tmp_path, "w") as counts_file:
+            json.dump(
+                {"log": self._log_id, "counts": counts},
+                counts_file,
+                separators=(",", ":")
+            )
+
+        os.rename(tmp_path, self.path)
+
+        for log_id in self._log_ids():
+            if log_id < self._log_id:
+                os.unlink(self._log_path(log_id))
+
+    def flush(self):
+        """
+        Write the pending changes to :attr:`path`.
+        """
+        self._flush()
+
+    def close(self):
+        """
+        Flush the pending changes.
+        """
+        if self._changes:
+            self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
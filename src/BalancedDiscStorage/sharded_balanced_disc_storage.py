@@ -0,0 +1,423 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import bisect
+import shutil
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+
+from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
+
+
+# Functions & classes =========================================================
+def _ring_point(key):
+    """
+    Compute position of the `key` on the consistent hashing ring.
+
+    Args:
+        key (str): Shard identifier or hash of the file.
+
+    Returns:
+        int: Position on the ring.
+    """
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def _copy_atomically(from_path, to_path):
+    """
+    Copy file / directory tree `from_path` to `to_path`, which may be on
+    different disc. Data is copied under temporary name, flushed to the disc
+    and then renamed, so the `to_path` is never visible half-copied.
+
+    Args:
+        from_path (str): Path of the file / directory.
+        to_path (str): New path.
+    """
+    tmp_path = "%s.%d.%d.bds_tmp" % (
+        to_path,
+        os.getpid(),
+        threading.current_thread().ident
+    )
+
+    try:
+        if os.path.isdir(from_path):
+            shutil.copytree(from_path, tmp_path)
+            copied = [
+                os.path.join(dir_path, file_name)
+                for dir_path, dir_names, file_names in os.walk(tmp_path)
+                for file_name in file_names
+            ]
+        else:
+            shutil.copy2(from_path, tmp_path)
+            copied = [tmp_path]
+
+        for copied_path in copied:
+            with open(copied_path, "rb+") as f:
+                os.fsync(f.fileno())
+
+        os.rename(tmp_path, to_path)
+    except Exception:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        elif os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class ShardedBalancedDiscStorage(object):
+    """
+    Spread the files over multiple storage roots (typically one per physical
+    disc). Each root is handled by its own :class:`.BalancedDiscStorage` and
+    files are assigned to roots using consistent hashing of their hash, so
+    adding new root moves only ~``1 / len(shards)`` of the files.
+
+    Note:
+        Position of the root on the hashing ring is derived from its path, so
+        the roots should be always given using the same paths.
+    """
+    def __init__(self, paths, dir_limit=32000, storage_class=None,
+                 replicas=64):
+        if not paths:
+            raise ValueError("At least one path is required!")
+
+        self.dir_limit = dir_limit  #: Maximal number of files in directory.
+        self.replicas = replicas  #: Number of ring points for each shard.
+
+        #: Class used for the shards.
+        self.storage_class = storage_class or BalancedDiscStorage
+
+        self.shards = []  #: List of the shard storages.
+        self._ring_points = []
+        self._ring_shards = []
+
+        for path in paths:
+            self._add_shard(path)
+
+    def _add_shard(self, path):
+        """
+        Create storage for `path` and put it on the hashing ring.
+
+        Args:
+            path (str): Root of the new shard.
+
+        Returns:
+            obj: Storage for the new shard.
+        """
+        shard = self.storage_class(path)
+        shard.dir_limit = self.dir_limit
+
+        for replica in range(self.replicas):
+            point = _ring_point("%s-%d" % (path, replica))
+            index = bisect.bisect(self._ring_points, point)
+
+            self._ring_points.insert(index, point)
+            self._ring_shards.insert(index, shard)
+
+        self.shards.append(shard)
+
+        return shard
+
+    def shard_for_hash(self, file_hash):
+        """
+        Return the shard, which owns the `file_hash`.
+
+        Args:
+            file_hash (str): Hash of the file.
+
+        Returns:
+            obj: Storage of the shard.
+        """
+        index = bisect.bisect(self._ring_points, _ring_point(file_hash))
+
+        return self._ring_shards[index % len(self._ring_shards)]
+
+    def _shard_for_path(self, path):
+        """
+        Return the shard, in which the `path` is stored.
+
+        Args:
+            path (str): Path of the file / directory.
+
+        Raises:
+            IOError: If the `path` is not in any of the shards.
+        """
+        for shard in self.shards:
+            if path.startswith(os.path.join(shard.path, "")):
+                return shard
+
+        raise IOError("Path '%s' is not in any of the shards!" % path)
+
+    def _get_hash(self, file_obj):
+        """
+        Compute hash for the `file_obj`, see
+        :meth:`.BalancedDiscStorage._get_hash`.
+        """
+        return self.shards[0]._get_hash(file_obj)
+
+    def add_file(self, file_obj):
+        """
+        Add new file into the shard, which owns its hash.
+
+        Args:
+            file_obj (file): Opened file-like object.
+
+        Returns:
+            obj: Path where the file-like object is stored contained with hash\
+                 in :class:`.PathAndHash` object.
+
+        Raises:
+            AssertionError: If the `file_obj` is not file-like object.
+            IOError: If the file couldn't be added to storage.
+        """
+        BalancedDiscStorage._check_interface(file_obj)
+
+        file_hash = self._get_hash(file_obj)
+        shard = self.shard_for_hash(file_hash)
+
+        return shard._add_hashed_file(file_obj, file_hash)
+
+    def add_files(self, file_objs):
+        """
+        Add multiple files at once. Files for different shards are written in
+        parallel, one thread for each shard.
+
+        Args:
+            file_objs (list): List of opened file-like objects.
+
+        Returns:
+            list: :class:`.PathAndHash` objects in the order of `file_objs`.
+        """
+        groups = {}
+        for index, file_obj in enumerate(file_objs):
+            BalancedDiscStorage._check_interface(file_obj)
+
+            file_hash = self._get_hash(file_obj)
+            shard = self.shard_for_hash(file_hash)
+
+            groups.setdefault(shard.path, (shard, []))[1].append(
+                (index, file_obj, file_hash)
+            )
+
+        def add_group(group):
+            shard, items = group
+            return [
+                (index, shard._add_hashed_file(file_obj, file_hash))
+                for index, file_obj, file_hash in items
+            ]
+
+        results = [None] * len(file_objs)
+        if not groups:
+            return results
+
+        pool = ThreadPool(len(groups))
+        try:
+            for group_results in pool.map(add_group, list(groups.values())):
+                for index, path in group_results:
+                    results[index] = path
+        finally:
+            pool.close()
+            pool.join()
+
+        return results
+
+    def _locate(self, file_hash):
+        """
+        Find the shard and path of the `file_hash`. Owner of the hash is
+        checked first, other shards are checked for files, which were not yet
+        moved after :meth:`add_root`.
+
+        Args:
+            file_hash (str): Hash of the file.
+
+        Returns:
+            tuple: ``(shard, path)``.
+
+        Raises:
+            IOError: If the file is not in any of the shards.
+        """
+        owner = self.shard_for_hash(file_hash)
+        others = [shard for shard in self.shards if shard is not owner]
+
+        for shard in [owner] + others:
+            try:
+                return shard, shard.file_path_from_hash(file_hash)
+            except (IOError, OSError):
+                continue
+
+        raise IOError("File not found in the structure.")
+
+    def file_path_from_hash(self, file_hash):
+        """
+        For given `file_hash`, return path on filesystem.
+
+        Args:
+            file_hash (str): Hash of the file, for which you wish to know the
+                      path.
+
+        Returns:
+            str: Path for given `file_hash` contained in :class:`.PathAndHash`\
+                 object.
+
+        Raises:
+            IOError: If the file with corresponding `file_hash` is not in \
+                     storage.
+        """
+        return self._locate(file_hash)[1]
+
+    def delete_by_file(self, file_obj):
+        """
+        Remove file from the storage. File is identified by opened `file_obj`,
+        from which the hashes / path are computed.
+
+        Args:
+            file_obj (file): Opened file-like object, which is used to compute
+                     hashes.
+
+        Raises:
+            IOError: If the `file_obj` is not in storage.
+        """
+        BalancedDiscStorage._check_interface(file_obj)
+
+        return self.delete_by_hash(self._get_hash(file_obj))
+
+    def delete_by_hash(self, file_hash):
+        """
+        Remove file/archive by it's `file_hash`.
+
+        Args:
+            file_hash (str): Hash, which is used to find the file in storage.
+
+        Raises:
+            IOError: If the file for given `file_hash` was not found in \
+                     storage.
+        """
+        shard = self._locate(file_hash)[0]
+
+        return shard.delete_by_hash(file_hash)
+
+    def delete_by_path(self, path):
+        """
+        Delete file/directory identified by `path` argument.
+
+        Args:
+            path (str): Path of the file / directory you want to remove.
+
+        Raises:
+            IOError: If the file / directory doesn't exists, or is not in \
+                     any of the shards.
+        """
+        return self._shard_for_path(path).delete_by_path(path)
+
+    def delete_many(self, file_hashes, processes=4):
+        """
+        Remove multiple files/archives by their hashes. Each shard removes
+        files it owns, shards work in parallel.
+
+        Note:
+            Files, which were not yet moved to their owner after
+            :meth:`add_root`, are not removed.
+
+        Args:
+            file_hashes (iterable): Hashes of the files.
+            processes (int, default 4): Number of threads for each shard.
+
+        Returns:
+            int: Number of removed files.
+        """
+        groups = {}
+        for file_hash in file_hashes:
+            shard = self.shard_for_hash(file_hash)
+            groups.setdefault(shard.path, (shard, []))[1].append(file_hash)
+
+        if not groups:
+            return 0
+
+        pool = ThreadPool(len(groups))
+        try:
+            return sum(pool.map(
+                lambda group: group[0].delete_many(group[1], processes),
+                list(groups.values())
+            ))
+        finally:
+            pool.close()
+            pool.join()
+
+    def iter_paths(self):
+        """
+        Iterate over all objects in all shards.
+
+        Yields:
+            obj: :class:`.PathAndHash` of each stored object.
+        """
+        for shard in self.shards:
+            for path in shard.iter_paths():
+                yield path
+
+    def _move_object(self, path, from_shard, to_shard):
+        """
+        Move object stored in `path` from `from_shard` to `to_shard`.
+
+        The object is first completely copied to the `to_shard` (see
+        :func:`_copy_atomically`) and only then removed from the
+        `from_shard`, so :meth:`_locate` always finds complete copy.
+
+        Args:
+            path (obj): :class:`.PathAndHash` of the object.
+            from_shard (obj): Storage, in which the object is stored.
+            to_shard (obj): Storage, to which the object should be moved.
+        """
+        dir_path = to_shard._create_dir_path(path.hash)
+        new_path = os.path.join(dir_path, os.path.basename(path.rstrip("/")))
+
+        if not os.path.exists(new_path):
+            # sidecars first, so they are there when the object appears
+            for sidecar_path in from_shard._sidecar_paths(path):
+                _copy_atomically(
+                    sidecar_path,
+                    os.path.join(dir_path, os.path.basename(sidecar_path))
+                )
+
+            _copy_atomically(path.rstrip("/"), new_path)
+            to_shard._record_change("add", new_path, path.hash)
+
+        # also drops the descriptors cached by the `from_shard`
+        from_shard.delete_by_path(path)
+
+    def add_root(self, path):
+        """
+        Add new root (shard) and move to it the files, which it now owns.
+
+        Only ~``1 / len(shards)`` of the files is moved. Files are still
+        reachable using :meth:`file_path_from_hash` while they are moved.
+
+        Args:
+            path (str): Path of the new root.
+
+        Returns:
+            int: Number of moved objects.
+        """
+        new_shard = self._add_shard(path)
+
+        moved = 0
+        for shard in self.shards:
+            if shard is new_shard:
+                continue
+
+            for object_path in shard.iter_paths():
+                if self.shard_for_hash(object_path.hash) is new_shard:
+                    self._move_object(object_path, shard, new_shard)
+                    moved += 1
+
+        return moved
+
+    def __repr__(self):
+        return "%s(paths=%s, dir_limit=%d)" % (
+            self.__class__.__name__,
+            repr([shard.path for shard in self.shards]),
+            self.dir_limit
+        )
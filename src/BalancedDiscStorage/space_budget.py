@@ -0,0 +1,212 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import time
+import errno
+import threading
+
+
+# Functions & classes =========================================================
+class _NullReservation(object):
+    """
+    Shared no-op reservation used, when the space budget is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_RESERVATION = _NullReservation()  #: Reservation, which doesn't reserve.
+
+
+class Reservation(object):
+    """
+    Space reserved by :meth:`SpaceBudget.reserve`. Use it as context manager
+    around the write - the space is returned to the budget, if the write
+    fails.
+
+    Attributes:
+        size (int): Reserved bytes.
+        inodes (int): Reserved inodes.
+    """
+    def __init__(self, budget, size, inodes):
+        self.budget = budget
+        self.size = size
+        self.inodes = inodes
+        self.released = False
+
+    def release(self, used=True):
+        """
+        Remove the reservation.
+
+        Args:
+            used (bool, default True): The space was consumed by the write,
+                 count it as used until the next refresh.
+        """
+        if self.released:
+            return
+
+        self.released = True
+        self.budget._release(self, used)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.release(used=exc_type is None)
+        return False
+
+
+class SpaceBudget(object):
+    """
+    Admission layer for the writes, which makes sure, that the filesystem of
+    `path` has enough free space and inodes, before anything is written.
+
+    Free bytes and inodes are read by ``os.statvfs()`` at most once per
+    `refresh_interval` seconds; in the meantime, they are decreased by the
+    writes. Concurrent writes reserve their space, so they can't together
+    exceed the free space.
+
+    Set it as :attr:`.BalancedDiscStorage.space_budget` to enable it.
+
+    Args:
+        path (str): Path on the watched filesystem.
+        min_free_bytes (int, default 0): Keep at least this many bytes free.
+        min_free_inodes (int, default 0): Keep at least this many inodes
+                        free.
+        refresh_interval (float, default 5.0): How often to call
+                         ``os.statvfs()``.
+    """
+    def __init__(self, path, min_free_bytes=0, min_free_inodes=0,
+                 refresh_interval=5.0):
+        self.path = path
+        self.min_free_bytes = min_free_bytes
+        self.min_free_inodes = min_free_inodes
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._reserved_bytes = 0
+        self._reserved_inodes = 0
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Read the free space and inodes of the filesystem.
+        """
+        stat = os.statvfs(self.path)
+
+        with self._lock:
+            self.block_size = stat.f_frsize or stat.f_bsize
+            self.free_bytes = stat.f_bavail * self.block_size
+            self.free_inodes = stat.f_favail
+            self._refreshed = time.time()
+
+    def _blocks(self, size):
+        """
+        Round the `size` up to the whole blocks.
+        """
+        return -(-size // self.block_size) * self.block_size
+
+    def available(self):
+        """
+        Returns:
+            tuple: ``(bytes, inodes)``, which can be still reserved.
+        """
+        if time.time() - self._refreshed >= self.refresh_interval:
+            self.refresh()
+
+        with self._lock:
+            return (
+                self.free_bytes - self._reserved_bytes - self.min_free_bytes,
+                self.free_inodes - self._reserved_inodes -
+                self.min_free_inodes,
+            )
+
+    def _check(self, size, inodes):
+        """
+        Raise ENOSPC, if `size` bytes (in whole blocks) and `inodes` don't
+        fit. Call only with :attr:`_lock` held.
+        """
+        free_bytes = self.free_bytes - self._reserved_bytes
+        if free_bytes - size < self.min_free_bytes:
+            raise IOError(
+                errno.ENOSPC,
+                "Not enough space for %d bytes in `%s` (%d free)." % (
+                    size,
+                    self.path,
+                    free_bytes
+                )
+            )
+
+        free_inodes = self.free_inodes - self._reserved_inodes
+        if free_inodes - inodes < self.min_free_inodes:
+            raise IOError(
+                errno.ENOSPC,
+                "Not enough inodes for %d files in `%s` (%d free)." % (
+                    inodes,
+                    self.path,
+                    free_inodes
+                )
+            )
+
+    def check(self, size, inodes=1):
+        """
+        Check, that `size` bytes and `inodes` inodes could be reserved,
+        without reserving them. Used to reject the write early.
+
+        Args:
+            size (int): Number of bytes.
+            inodes (int, default 1): Number of inodes (files + directories).
+
+        Raises:
+            IOError: With ``errno.ENOSPC``, if there is not enough space or \
+                     inodes.
+        """
+        if time.time() - self._refreshed >= self.refresh_interval:
+            self.refresh()
+
+        with self._lock:
+            self._check(self._blocks(size), inodes)
+
+    def reserve(self, size, inodes=1):
+        """
+        Reserve `size` bytes and `inodes` inodes.
+
+        Args:
+            size (int): Number of bytes.
+            inodes (int, default 1): Number of inodes (files + directories).
+
+        Returns:
+            obj: :class:`Reservation`.
+
+        Raises:
+            IOError: With ``errno.ENOSPC``, if there is not enough space or \
+                     inodes.
+        """
+        if time.time() - self._refreshed >= self.refresh_interval:
+            self.refresh()
+
+        with self._lock:
+            size = self._blocks(size)
+            self._check(size, inodes)
+
+            self._reserved_bytes += size
+            self._reserved_inodes += inodes
+
+        return Reservation(self, size, inodes)
+
+    def _release(self, reservation, used):
+        with self._lock:
+            self._reserved_bytes -= reservation.size
+            self._reserved_inodes -= reservation.inodes
+
+            if used:
+                self.free_bytes -= reservation.size
+                self.free_inodes -= reservation.inodes
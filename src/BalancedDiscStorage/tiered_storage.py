@@ -0,0 +1,515 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import threading
+from collections import OrderedDict
+
+from BalancedDiscStorage.path_and_hash import PathAndHash
+from BalancedDiscStorage.balanced_disc_storage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+FAST = "fast"  #: Name of the fast (SSD) tier.
+SLOW = "slow"  #: Name of the slow (capacity) tier.
+
+
+# Functions & classes =========================================================
+class TieredBalancedDiscStorage(object):
+    """
+    Read-through cache made of two storages: small `fast` (SSD) tier in front
+    of large `slow` (HDD) tier.
+
+    Lookups check the fast tier first. Files from the slow tier are promoted
+    (copied) to the fast tier, when they were accessed `admission_hits` times.
+    Least recently used files are evicted from the fast tier, so it never
+    holds more than `fast_budget` bytes.
+
+    Where the new files are written is decided by `write_tier`:
+
+    - ``"slow"``: only to the slow tier,
+    - ``"both"``: to the slow tier and the fast tier,
+    - ``"fast"``: only to the fast tier. The file is copied to the slow tier,
+      when it is evicted.
+
+    Note:
+        Only files are promoted, unpacked archives stay in the slow tier.
+        Files in the fast tier are copies - references (see
+        :class:`.RefCounter`) are counted only in the tier, to which the file
+        was added. They are moved to the slow tier with evicted file.
+
+    Args:
+        fast (obj): :class:`.BalancedDiscStorage` for the fast tier.
+        slow (obj): :class:`.BalancedDiscStorage` for the slow tier.
+        fast_budget (int): Maximal size of the files in the fast tier, in
+                    bytes.
+        admission_hits (int, default 2): Promote the file on this access.
+        write_tier (str, default "slow"): Write policy, see above.
+    """
+    def __init__(self, fast, slow, fast_budget, admission_hits=2,
+                 write_tier=SLOW):
+        if write_tier not in (SLOW, FAST, "both"):
+            raise ValueError("Unknown `write_tier` '%s'!" % write_tier)
+
+        self.fast = fast
+        self.slow = slow
+        self.fast_budget = fast_budget
+        self.admission_hits = admission_hits
+        self.write_tier = write_tier
+
+        #: How many hashes may be tracked by the admission policy.
+        self.max_tracked_hits = 100000
+
+        self._lock = threading.Lock()
+        self._fast_objects = OrderedDict()  # hash -> size, in LRU order
+        self._fast_size = 0  # including files being copied / evicted
+        self._copying = {}  # hash -> size, being copied to the fast tier
+        self._evicting = {}  # hash -> size, being evicted from the fast tier
+        self._cancelled = set()  # deleted while they were copied
+        self._hits = OrderedDict()
+
+        for path in self.fast.iter_paths():
+            if not path.endswith("/"):
+                self._remember_fast(path.hash)
+
+    @staticmethod
+    def _size(file_hash):
+        return int(file_hash.rsplit("_", 1)[1], 16)
+
+    @staticmethod
+    def _with_tier(path, tier):
+        return PathAndHash(
+            path=path.path,
+            hash=path.hash,
+            offset=path.offset,
+            length=path.length,
+            tier=tier,
+        )
+
+    def _remember_fast(self, file_hash):
+        """
+        Put `file_hash` into the LRU index of the fast tier as the most
+        recently used. Call only with :attr:`_lock` held.
+        """
+        size = self._fast_objects.pop(file_hash, None)
+        if size is None:
+            size = self._size(file_hash)
+            self._fast_size += size
+
+        self._fast_objects[file_hash] = size
+
+    def _forget_fast(self, file_hash):
+        """
+        Remove `file_hash` from the LRU index of the fast tier. Call only with
+        :attr:`_lock` held.
+        """
+        size = self._fast_objects.pop(file_hash, None)
+        if size is not None:
+            self._fast_size -= size
+
+    def _admit(self, file_hash):
+        """
+        Count the access to the file in slow tier. Call only with
+        :attr:`_lock` held.
+
+        Returns:
+            bool: True if the file should be promoted.
+        """
+        hits = self._hits.pop(file_hash, 0) + 1
+        if hits >= self.admission_hits:
+            return True
+
+        self._hits[file_hash] = hits
+        while len(self._hits) > self.max_tracked_hits:
+            self._hits.popitem(last=False)
+
+        return False
+
+    def _reserve_fast(self, file_hash):
+        """
+        Reserve space for `file_hash` in the fast tier. Least recently used
+        files are picked for eviction, so there is enough room in the
+        budget. Call only with :attr:`_lock` held.
+
+        Returns:
+            list: Hashes, which have to be evicted by :meth:`_evict`, or \
+                  None if the file is already in the fast tier, or it is \
+                  copied / evicted by other thread.
+        """
+        if file_hash in self._fast_objects or \
+           file_hash in self._copying or \
+           file_hash in self._evicting:
+            return None
+
+        size = self._size(file_hash)
+
+        victims = []
+        while self._fast_objects and \
+              self._fast_size + size > self.fast_budget:
+            victim, victim_size = self._fast_objects.popitem(last=False)
+            self._evicting[victim] = victim_size
+            victims.append(victim)
+
+        self._copying[file_hash] = size
+        self._fast_size += size
+
+        return victims
+
+    def _copy_to_slow(self, file_hash, references):
+        """
+        Copy the file `file_hash` from the fast tier to the slow tier, if it
+        is not there, and add `references` to it in the slow tier.
+        """
+        def copy():
+            try:
+                self.slow.file_path_from_hash(file_hash)
+            except (IOError, OSError):
+                with self.fast.open_by_hash(file_hash) as reader:
+                    self.slow._write_file(reader, file_hash)
+
+        if self.slow.ref_counter is None or not references:
+            return copy()
+
+        with self.slow.ref_counter.lock_for(file_hash):
+            copy()
+
+            for _ in range(references):
+                self.slow.ref_counter.increment(file_hash)
+
+    def _demote(self, file_hash):
+        """
+        Move the file `file_hash` from the fast tier to the slow tier,
+        together with its references (see :class:`.RefCounter`).
+        """
+        fast_refs = self.fast.ref_counter
+        if fast_refs is None:
+            self._copy_to_slow(file_hash, 0)
+            self.fast._delete_hash(file_hash)
+            return
+
+        # references can't be added / removed in the meantime
+        with fast_refs.lock_for(file_hash):
+            self._copy_to_slow(file_hash, fast_refs.get(file_hash))
+            self.fast._delete_hash(file_hash)
+            fast_refs.discard([file_hash])
+
+    def _evict(self, victims):
+        """
+        Move `victims` picked by :meth:`_reserve_fast` from the fast tier to
+        the slow tier. Victims, which couldn't be moved, are put back.
+        """
+        for index, file_hash in enumerate(victims):
+            try:
+                self._demote(file_hash)
+            except Exception:
+                with self._lock:
+                    for victim in victims[index:]:
+                        self._fast_objects[victim] = self._evicting.pop(victim)
+                raise
+
+            with self._lock:
+                self._fast_size -= self._evicting.pop(file_hash)
+
+    def _put_fast(self, file_obj, file_hash, add=False):
+        """
+        Store `file_obj` in the fast tier. The space is reserved under the
+        :attr:`_lock`, but the data is copied outside of it, and the file is
+        published in the LRU index, once it is completely written.
+
+        Args:
+            file_obj (obj): File-like object.
+            file_hash (str): Hash of the `file_obj`.
+            add (bool, default False): Add the file as new reference, instead
+                of storing a copy.
+
+        Returns:
+            obj: :class:`.PathAndHash` in the fast tier, or None if the copy \
+                 is already in the fast tier, it is copied by other thread, \
+                 or it is being evicted.
+        """
+        with self._lock:
+            evicting = file_hash in self._evicting
+            victims = None if evicting else self._reserve_fast(file_hash)
+
+        if victims is None:
+            if not add or evicting:
+                return None
+
+            path = self.fast._add_hashed_file(file_obj, file_hash)
+            with self._lock:
+                # also evicted in the meantime - the new reference is here
+                if file_hash not in self._copying:
+                    self._remember_fast(file_hash)
+
+            return path
+
+        try:
+            self._evict(victims)
+
+            if add:
+                path = self.fast._add_hashed_file(file_obj, file_hash)
+            else:
+                path = self.fast._write_file(file_obj, file_hash)
+        except Exception:
+            with self._lock:
+                self._fast_size -= self._copying.pop(file_hash)
+                self._cancelled.discard(file_hash)
+            raise
+
+        with self._lock:
+            size = self._copying.pop(file_hash)
+
+            if add or file_hash not in self._cancelled:
+                self._cancelled.discard(file_hash)
+                self._fast_objects[file_hash] = size
+                return path
+
+            # deleted while it was copied
+            self._cancelled.discard(file_hash)
+            self._fast_size -= size
+
+        self.fast._delete_hash(file_hash)
+
+        return None
+
+    def _route(self, file_hash):
+        """
+        Decide, which tier serves the `file_hash`. Files admitted by the
+        admission policy are promoted.
+
+        Returns:
+            tuple: ``(storage, tier)``.
+        """
+        with self._lock:
+            if file_hash in self._fast_objects:
+                self._remember_fast(file_hash)
+                return self.fast, FAST
+
+            # still there, until it is copied to the slow tier
+            if file_hash in self._evicting:
+                return self.fast, FAST
+
+            if self._size(file_hash) > self.fast_budget or \
+               not self._admit(file_hash):
+                return self.slow, SLOW
+
+        try:
+            with self.slow.open_by_hash(file_hash) as reader:
+                path = self._put_fast(reader, file_hash)
+        except (IOError, OSError):
+            return self.slow, SLOW  # not in storage, or archive
+
+        if path is None:  # promoted by other thread in the meantime
+            return self.slow, SLOW
+
+        return self.fast, FAST
+
+    def _served(self, file_hash, method):
+        """
+        Call `method(storage)` on the tier serving the `file_hash`, fall back
+        to the slow tier, if the file disappeared from the fast one.
+
+        Returns:
+            tuple: ``(result, tier)``.
+        """
+        storage, tier = self._route(file_hash)
+
+        try:
+            return method(storage), tier
+        except (IOError, OSError):
+            if tier == SLOW:
+                raise
+
+        with self._lock:
+            self._forget_fast(file_hash)
+
+        return method(self.slow), SLOW
+
+    def file_path_from_hash(self, file_hash):
+        """
+        For given `file_hash`, return path on filesystem.
+
+        Returns:
+            obj: :class:`.PathAndHash` with ``.tier`` set to the tier, which \
+                 served the file.
+
+        Raises:
+            IOError: If the file is not in storage.
+        """
+        path, tier = self._served(
+            file_hash,
+            lambda storage: storage.file_path_from_hash(file_hash)
+        )
+
+        return self._with_tier(path, tier)
+
+    def stat_by_hash(self, file_hash):
+        """
+        Return size and type of the object identified by `file_hash`. See
+        :meth:`.BalancedDiscStorage.stat_by_hash`.
+
+        Unlike the reads, this is not counted as access to the file, so it
+        doesn't promote it, nor refresh it in the fast tier.
+        """
+        try:
+            return self.fast.stat_by_hash(file_hash)
+        except (IOError, OSError):
+            return self.slow.stat_by_hash(file_hash)
+
+    def open_by_hash(self, file_hash):
+        """
+        Open file identified by `file_hash` for reading. See
+        :meth:`.BalancedDiscStorage.open_by_hash`.
+        """
+        return self._served(
+            file_hash,
+            lambda storage: storage.open_by_hash(file_hash)
+        )[0]
+
+    def read_range(self, file_hash, offset, length):
+        """
+        Read part of the file identified by `file_hash`. See
+        :meth:`.BalancedDiscStorage.read_range`.
+        """
+        return self._served(
+            file_hash,
+            lambda storage: storage.read_range(file_hash, offset, length)
+        )[0]
+
+    def send_to_socket(self, file_hash, sock, offset=0, length=None):
+        """
+        Send the file identified by `file_hash` to the `sock`. See
+        :meth:`.BalancedDiscStorage.send_to_socket`.
+        """
+        return self._served(
+            file_hash,
+            lambda storage: storage.send_to_socket(
+                file_hash,
+                sock,
+                offset,
+                length
+            )
+        )[0]
+
+    def add_file(self, file_obj):
+        """
+        Add new file into the storage, according to the :attr:`write_tier`.
+
+        Args:
+            file_obj (file): Opened file-like object.
+
+        Returns:
+            obj: :class:`.PathAndHash` with ``.tier`` set to the tier, where \
+                 the file was added.
+        """
+        BalancedDiscStorage._check_interface(file_obj)
+
+        file_hash = self.slow._get_hash(file_obj)
+
+        if self.write_tier == FAST:
+            path = self._put_fast(file_obj, file_hash, add=True)
+
+            # None, if the file is just being evicted with its references
+            if path is not None:
+                return self._with_tier(path, FAST)
+
+        path = self.slow._add_hashed_file(file_obj, file_hash)
+
+        if self.write_tier == "both":
+            self._put_fast(file_obj, file_hash)
+
+        return self._with_tier(path, SLOW)
+
+    def delete_by_file(self, file_obj):
+        """
+        Remove file from both tiers. File is identified by opened `file_obj`.
+        """
+        BalancedDiscStorage._check_interface(file_obj)
+
+        return self.delete_by_hash(self.slow._get_hash(file_obj))
+
+    def delete_by_hash(self, file_hash):
+        """
+        Remove one reference of the `file_hash` (see :class:`.RefCounter`)
+        from the tier, which holds it. The file is removed from both tiers
+        with the last reference.
+
+        Raises:
+            IOError: If the file was not found in any of the tiers.
+        """
+        with self._lock:
+            self._hits.pop(file_hash, None)
+            in_fast = file_hash in self._fast_objects
+
+        # file added to the fast tier, which has its references there
+        fast_refs = self.fast.ref_counter
+        if in_fast and fast_refs is not None and fast_refs.get(file_hash):
+            self.fast.delete_by_hash(file_hash)
+
+            if not self._stored_in(self.fast, file_hash):
+                self._forget_deleted(file_hash)
+
+            return
+
+        try:
+            self.slow.delete_by_hash(file_hash)
+        except (IOError, OSError):
+            if not in_fast:
+                raise
+        else:
+            if self._stored_in(self.slow, file_hash):
+                return  # other references are left
+
+        if in_fast:
+            try:
+                self.fast._delete_hash(file_hash)
+            except (IOError, OSError):
+                pass
+
+        self._forget_deleted(file_hash)
+
+    @staticmethod
+    def _stored_in(storage, file_hash):
+        try:
+            storage.file_path_from_hash(file_hash)
+        except (IOError, OSError):
+            return False
+
+        return True
+
+    def _forget_deleted(self, file_hash):
+        """
+        Remove deleted `file_hash` from the LRU index, cancel its promotion.
+        """
+        with self._lock:
+            self._forget_fast(file_hash)
+
+            if file_hash in self._copying:
+                self._cancelled.add(file_hash)
+
+    def iter_paths(self):
+        """
+        Iterate over all objects in the slow tier and the files, which are
+        only in the fast tier.
+
+        Yields:
+            obj: :class:`.PathAndHash` with ``.tier`` of each object.
+        """
+        seen = set()
+        for path in self.slow.iter_paths():
+            seen.add(path.hash)
+            yield self._with_tier(path, SLOW)
+
+        for path in self.fast.iter_paths():
+            if path.hash not in seen:
+                yield self._with_tier(path, FAST)
+
+    def __repr__(self):
+        return "%s(fast=%r, slow=%r, fast_budget=%d)" % (
+            self.__class__.__name__,
+            self.fast,
+            self.slow,
+            self.fast_budget
+        )
@@ -6,8 +6,10 @@
 # Imports =====================================================================
 import os
 import shutil
+import socket
 import os.path
 import tempfile
+from io import BytesIO
 
 from os.path import join
 
@@ -70,15 +72,13 @@ def aa_file_hash():
 
 
 @pytest.fixture
-def b_file_path():
-    return join(TEMP_DIR, "b", b_file_hash())
+def b_file_path(b_file_hash):
+    return join(TEMP_DIR, "b", b_file_hash)
 
 
 @pytest.fixture
-def aa_file_path():
-    file_hash = aa_file_hash()
-
-    return join(TEMP_DIR, file_hash[0], file_hash[1], aa_file_hash())
+def aa_file_path(aa_file_hash):
+    return join(TEMP_DIR, aa_file_hash[0], aa_file_hash[1], aa_file_hash)
 
 
 # Setup =======================================================================
@@ -116,6 +116,10 @@ def test_init_is_directory():
     os.unlink(fn_path)
 
 
+@pytest.mark.skipif(
+    hasattr(os, "geteuid") and os.geteuid() == 0,
+    reason="root ignores the permissions"
+)
 def test_rw_check():
     non_writeable = join(TEMP_DIR, "non_writeable")
     os.mkdir(non_writeable)
@@ -190,12 +194,50 @@ def test_file_path_from_hash_subdirectory(bds, aa_file_hash, aa_file_path):
     assert bds.file_path_from_hash(aa_file_hash) == aa_file_path
 
 
-def test_delete_by_file(bds, b_file, b_file_path):
+def test_iter_paths(bds, a_file_hash, b_file_hash, aa_file_hash,
+                    aa_file_path):
+    paths = list(bds.iter_paths())
+
+    assert sorted(path.hash for path in paths) == sorted([
+        a_file_hash,
+        b_file_hash,
+        aa_file_hash,
+    ])
+    assert aa_file_path in paths
+
+
+def test_open_by_hash(bds, aa_file_hash):
+    with bds.open_by_hash(aa_file_hash) as reader:
+        assert reader.read() == b"318"
+
+    assert bds.read_range(aa_file_hash, 1, 5) == b"18"
+
+    with pytest.raises(IOError):
+        bds.open_by_hash("azgabash")
+
+
+def test_send_to_socket(bds, aa_file_hash):
+    sender, receiver = socket.socketpair()
+
+    try:
+        assert bds.send_to_socket(aa_file_hash, sender, offset=1) == 2
+        assert receiver.recv(10) == b"18"
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_delete_by_file(bds, b_file, b_file_hash, b_file_path):
     assert os.path.exists(b_file_path)
     assert os.path.isfile(b_file_path)
 
+    bds.read_range(b_file_hash, 0, 1)
+    assert len(bds.fd_cache) == 1
+
     bds.delete_by_file(b_file)
 
+    assert len(bds.fd_cache) == 0
+
     assert not os.path.exists(b_file_path)
     assert not os.path.isfile(b_file_path)
 
@@ -208,3 +250,55 @@ def test_delete_unknown_path(bds):
 def test_delete_unknown_existing_path(bds):
     with pytest.raises(IOError):
         bds.delete_by_path("/tmp")
+
+
+def test_delete_many(bds):
+    bds.dir_limit = 2
+    paths = [
+        bds.add_file(BytesIO(("file %d" % i).encode("ascii")))
+        for i in range(20)
+    ]
+
+    assert bds.delete_many([path.hash for path in paths[:10]]) == 10
+    assert bds.delete_many([paths[0].hash, "azgabash"]) == 0
+
+    for path in paths[:10]:
+        assert not os.path.exists(path)
+
+    for path in paths[10:]:
+        assert os.path.isfile(path)
+
+
+def test_delete_many_duplicates(bds):
+    bds.dir_limit = 2
+    hashes = [
+        bds.add_file(BytesIO(("duplicate %d" % i).encode("ascii"))).hash
+        for i in range(10)
+    ]
+
+    assert bds.delete_many(hashes[:5] + hashes[:5], processes=8) == 5
+
+    # removed by somebody else in the meantime
+    remove_object = bds._remove_object
+
+    def concurrently_removed(path):
+        os.unlink(path)
+        return remove_object(path)
+
+    bds._remove_object = concurrently_removed
+    assert bds.delete_many(hashes[5:]) == 0
+
+    del bds._remove_object
+    assert not [
+        path for path in bds.iter_paths() if path.hash in hashes
+    ]
+
+
+def test_gc(bds, a_file_hash):
+    assert bds.gc(keep_set=set([a_file_hash])) > 0
+    assert [path.hash for path in bds.iter_paths()] == [a_file_hash]
+
+    bds.gc(keep_set=set())
+
+    # blank directories are removed too
+    assert os.listdir(TEMP_DIR) == []
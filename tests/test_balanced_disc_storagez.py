@@ -7,7 +7,10 @@
 import os
 import shutil
 import os.path
+import zipfile
 import tempfile
+import threading
+from io import BytesIO
 
 from os.path import join
 
@@ -39,16 +42,14 @@ def archive_file_hash():
 
 
 @pytest.fixture
-def archive_file_path():
-    file_hash = archive_file_hash()
-
-    return join(TEMP_DIR, file_hash[0], file_hash) + "/"
+def archive_file_path(archive_file_hash):
+    return join(TEMP_DIR, archive_file_hash[0], archive_file_hash) + "/"
 
 
 @pytest.fixture
-def archive_filenames():
+def archive_filenames(archive_file_path):
     return [
-        join(archive_file_path(), fn)
+        join(archive_file_path, fn)
         for fn in ["metadata.xml", "some.pdf"]
     ]
 
@@ -100,10 +101,105 @@ def test_add_archie_twice(bdsz, archive_file, archive_file_hash,
         assert os.path.isfile(filename)
 
 
+def test_add_archive_again_skips_intact_members(bdsz, archive_file,
+                                                archive_filenames):
+    intact, removed = archive_filenames
+    os.utime(intact, (0, 0))
+    os.unlink(removed)
+
+    bdsz.add_archive_as_dir(archive_file)
+
+    assert os.path.isfile(removed)
+    assert os.path.getmtime(intact) == 0
+
+
+def test_repair_archive(bdsz, archive_file, archive_filenames):
+    damaged = archive_filenames[0]
+    with open(damaged, "rb") as f:
+        original = f.read()
+
+    with open(damaged, "wb") as f:
+        f.write(b"x" * len(original))
+
+    # same size, so only the CRC check detects the change
+    bdsz.add_archive_as_dir(archive_file)
+    with open(damaged, "rb") as f:
+        assert f.read() != original
+
+    bdsz.repair_archive(archive_file)
+    with open(damaged, "rb") as f:
+        assert f.read() == original
+
+
+def test_concurrent_adds_of_same_archive(bdsz, archive_file_hash):
+    errors = []
+
+    def add():
+        try:
+            with data_file_context("archive.zip") as archive_file:
+                bdsz.add_archive_as_dir(archive_file)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert bdsz.is_archive_complete(archive_file_hash)
+
+
+def test_failed_repair_keeps_archive(bdsz, archive_file, archive_file_hash,
+                                     archive_filenames, monkeypatch):
+    intact, removed = archive_filenames
+    os.unlink(removed)
+
+    def extract(*args, **kwargs):
+        raise IOError("No space left on device.")
+
+    monkeypatch.setattr("zipfile.ZipFile.extract", extract)
+    with pytest.raises(IOError):
+        bdsz.repair_archive(archive_file)
+
+    assert os.path.isfile(intact)
+    assert not bdsz.is_archive_complete(archive_file_hash)
+
+    monkeypatch.undo()
+    bdsz.repair_archive(archive_file)
+    assert os.path.isfile(removed)
+
+
 def test_path_from_hash_for_zip(bdsz, archive_file_path, archive_file_hash):
     assert bdsz.file_path_from_hash(archive_file_hash) == archive_file_path
 
 
+def test_manifest(bdsz, archive_file_hash, archive_file_path):
+    assert os.path.isfile(archive_file_path.rstrip("/") + ".manifest")
+
+    manifest = bdsz.read_manifest(archive_file_hash)
+    assert manifest["hash"] == archive_file_hash
+    assert manifest["complete"]
+
+    assert sorted(bdsz.list_archive(archive_file_hash)) == [
+        "metadata.xml",
+        "some.pdf",
+    ]
+    assert bdsz.is_archive_complete(archive_file_hash)
+
+
+def test_verify_archive(bdsz, archive_file, archive_file_hash,
+                        archive_filenames):
+    assert bdsz.verify_archive(archive_file_hash, check_crc=True) == []
+
+    os.unlink(archive_filenames[1])
+    assert bdsz.verify_archive(archive_file_hash) == ["some.pdf"]
+
+    bdsz.add_archive_as_dir(archive_file)
+    assert bdsz.verify_archive(archive_file_hash) == []
+
+
 def test_delete_by_file_zip(bdsz, archive_file, archive_file_path):
     assert os.path.exists(archive_file_path)
     assert os.path.isdir(archive_file_path)
@@ -122,3 +218,107 @@ def test_too_many_zip_files(bdsz, archive_file):
 
     with pytest.raises(ValueError):
         bdsz.add_archive_as_dir(archive_file)
+
+
+def test_dedup_members(bdsz, archive_file, archive_filenames):
+    bdsz.dedup_members = True
+
+    path = bdsz.add_archive_as_dir(archive_file)
+
+    for filename in archive_filenames:
+        with open(filename, "rb") as member_file:
+            blob_path = bdsz.file_path_from_hash(bdsz._get_hash(member_file))
+
+        assert os.path.isfile(blob_path)
+        assert os.path.samefile(filename, blob_path)
+
+    # second unpacking reuses the blobs
+    bdsz.add_archive_as_dir(archive_file)
+
+    for filename in archive_filenames:
+        assert os.stat(filename).st_nlink == 2
+
+    bdsz.delete_by_path(path)
+
+
+def test_add_file_doesnt_write_through_blob(bdsz, archive_file,
+                                            archive_filenames):
+    class BrokenFile(BytesIO):
+        def read(self, *args):
+            raise IOError("Broken disc.")
+
+    bdsz.dedup_members = True
+    path = bdsz.add_archive_as_dir(archive_file)
+
+    member_path = archive_filenames[1]
+    with open(member_path, "rb") as member_file:
+        content = member_file.read()
+        blob_hash = bdsz._get_hash(member_file)
+
+    with pytest.raises(IOError):
+        bdsz._write_file(BrokenFile(content), blob_hash)
+
+    blob_path = bdsz.file_path_from_hash(blob_hash)
+    assert os.path.samefile(member_path, blob_path)
+    with open(member_path, "rb") as member_file:
+        assert member_file.read() == content
+
+    # successful add replaces the blob, instead of rewriting it
+    bdsz.add_file(BytesIO(content))
+    with open(member_path, "rb") as member_file:
+        assert member_file.read() == content
+
+    assert not [
+        name for name in os.listdir(os.path.dirname(blob_path))
+        if name.endswith(".bds_tmp")
+    ]
+
+    bdsz.delete_by_path(path)
+    bdsz.delete_by_hash(blob_hash)
+
+
+def test_orphaned_blobs_are_removed(bdsz, archive_file, archive_filenames):
+    bdsz.dedup_members = True
+
+    path = bdsz.add_archive_as_dir(archive_file)
+    blob_hashes = sorted(bdsz.read_manifest(path.hash)["blobs"].values())
+    assert len(blob_hashes) == 2
+
+    # file added by producer is not linked and survives the archive
+    with open(archive_filenames[0], "rb") as member_file:
+        kept_path = bdsz.add_file(member_file)
+
+    bdsz.delete_by_path(path)
+
+    assert [p.hash for p in bdsz.iter_paths()] == [kept_path.hash]
+    bdsz.delete_by_path(kept_path)
+
+
+def test_dedup_members_with_compressed_blob(bdsz):
+    bdsz.compression = "gzip"
+    bdsz.dedup_members = True
+
+    content = b"compressible member " * 256
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr("member.txt", content)
+    archive.seek(0)
+
+    blob_path = bdsz.add_file(BytesIO(content))
+    assert blob_path.endswith(".gz")
+
+    path = bdsz.add_archive_as_dir(archive)
+    assert bdsz.read_manifest(path.hash)["blobs"] == {}
+
+    # no uncompressed copy next to the compressed one
+    dir_path = os.path.dirname(blob_path)
+    assert os.listdir(dir_path) == [os.path.basename(blob_path)]
+
+    # copies stored in other formats are deleted with the file
+    shutil.copy(join(path, "member.txt"), blob_path[:-len(".gz")])
+    bdsz.delete_by_hash(blob_path.hash)
+
+    with pytest.raises(IOError):
+        bdsz.file_path_from_hash(blob_path.hash)
+
+    bdsz.delete_by_path(path)
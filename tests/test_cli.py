@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import sys
+import shutil
+import os.path
+import tempfile
+from io import StringIO
+
+import pytest
+
+from BalancedDiscStorage.cli import main
+
+from test_balanced_disc_storage import data_dir_context
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def root():
+    return tempfile.mkdtemp(dir=TEMP_DIR)
+
+
+def bds(root, *args):
+    return main(["-r", root] + list(args))
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_add_ls_get_cat(root, capsys):
+    files_dir = data_dir_context("")
+
+    assert bds(root, "add", "-j", "3", "-z", files_dir) == 0
+    added = dict(
+        line.split("\t")[::-1]
+        for line in capsys.readouterr().out.splitlines()
+    )
+    assert len(added) == len(os.listdir(files_dir))
+
+    assert bds(root, "ls") == 0
+    listed = capsys.readouterr().out.splitlines()
+    assert sorted(line.split("\t")[0] for line in listed) == \
+        sorted(added.values())
+
+    a_hash = added[os.path.join(files_dir, "a_file")]
+    assert bds(root, "get", a_hash) == 0
+    assert capsys.readouterr().out.strip().endswith(a_hash)
+
+    assert bds(root, "cat", a_hash) == 0
+    with open(os.path.join(files_dir, "a_file")) as a_file:
+        assert capsys.readouterr().out == a_file.read()
+
+    assert bds(root, "verify") == 0
+    assert bds(root, "stats") == 0
+    assert "archives: 1" in capsys.readouterr().out
+
+
+def test_hashes_from_stdin(root, capsys, monkeypatch):
+    assert bds(root, "add", data_dir_context("a_file")) == 0
+    a_hash = capsys.readouterr().out.split("\t")[0]
+
+    monkeypatch.setattr(sys, "stdin", StringIO(u"%s\n" % a_hash))
+    assert bds(root, "rm", "-") == 0
+    assert os.listdir(root) == []
+
+    assert bds(root, "get", a_hash) == 1
+
+
+def test_verify_detects_damage(root, capsys):
+    assert bds(root, "add", data_dir_context("a_file")) == 0
+    a_hash = capsys.readouterr().out.split("\t")[0]
+
+    bds(root, "get", a_hash)
+    with open(capsys.readouterr().out.strip(), "w") as stored_file:
+        stored_file.write("damaged")
+
+    assert bds(root, "verify", a_hash) == 1
+    assert capsys.readouterr().out.startswith(a_hash)
+
+
+def test_missing_root(capsys):
+    assert bds("/nonexistent/path", "ls") == 2
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import BalancedDiscStorage
+from BalancedDiscStorage.compression import CODECS
+from BalancedDiscStorage.compression import get_codec
+from BalancedDiscStorage.compression import DecompressingReader
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def bds():
+    bds = BalancedDiscStorage(TEMP_DIR)
+    bds.compression = "gzip"
+
+    return bds
+
+
+@pytest.fixture
+def text():
+    return b"".join(b"line %d of the text\n" % i for i in range(5000))
+
+
+@pytest.fixture
+def random_data():
+    return os.urandom(4096)
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_decompressing_reader(name, text):
+    codec = get_codec(name)
+    reader = DecompressingReader(BytesIO(codec.compress(text)), codec, 100)
+
+    assert reader.read(10) == text[:10]
+
+    reader.seek(1000)
+    assert reader.read(10) == text[1000:1010]
+
+    reader.seek(5)
+    assert reader.read() == text[5:]
+
+
+def test_get_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("azgabash")
+
+
+def test_add_compressed_file(bds, text):
+    path = bds.add_file(BytesIO(text))
+
+    assert path.endswith(".gz")
+    assert os.path.getsize(path) < len(text)
+    assert path.hash == bds._get_hash(BytesIO(text))
+
+    assert bds.file_path_from_hash(path.hash) == path
+    assert [p.hash for p in bds.iter_paths()] == [path.hash]
+
+    with bds.open_by_hash(path.hash) as reader:
+        assert reader.read() == text
+
+    assert bds.read_range(path.hash, 100, 20) == text[100:120]
+
+    bds.delete_by_hash(path.hash)
+    assert not os.path.exists(path)
+
+
+def test_incompressible_file_is_stored_plain(bds, random_data):
+    path = bds.add_file(BytesIO(random_data))
+
+    assert path.hash == os.path.basename(path)
+
+    bds.delete_by_hash(path.hash)
+
+
+def test_add_plain_file_again_compressed(bds, text):
+    bds.compression = None
+    plain_path = bds.add_file(BytesIO(text))
+
+    bds.compression = "gzip"
+    path = bds.add_file(BytesIO(text))
+
+    assert not os.path.exists(plain_path)
+    assert bds.read_range(path.hash, 0, 10) == text[:10]
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import os.path
+
+import pytest
+
+from BalancedDiscStorage import FDCache
+
+from test_balanced_disc_storage import data_dir_context
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def opener():
+    def open_data_file(filename):
+        return os.open(data_dir_context(filename), os.O_RDONLY), filename
+
+    return open_data_file
+
+
+# Tests =======================================================================
+def test_acquire_caches(opener):
+    fd_cache = FDCache(max_fds=2)
+
+    entry = fd_cache.acquire("a_file", opener)
+    fd_cache.release(entry)
+
+    assert fd_cache.acquire("a_file", opener) is entry
+    assert entry.size == 2
+    assert entry.info == "a_file"
+    fd_cache.release(entry)
+
+    fd_cache.close()
+
+
+def test_eviction(opener):
+    fd_cache = FDCache(max_fds=1)
+
+    used = fd_cache.acquire("a_file", opener)
+    other = fd_cache.acquire("b_file", opener)
+    fd_cache.release(other)
+
+    assert len(fd_cache) == 1
+    assert used.evicted
+
+    # evicted descriptor is still usable until released
+    assert os.fstat(used.fd)
+    fd_cache.release(used)
+
+    with pytest.raises(OSError):
+        os.fstat(used.fd)
+
+    fd_cache.close()
+
+
+def test_invalidate(opener):
+    fd_cache = FDCache()
+
+    entry = fd_cache.acquire("a_file", opener)
+    fd_cache.invalidate("a_file")
+
+    assert len(fd_cache) == 0
+
+    new_entry = fd_cache.acquire("a_file", opener)
+    assert new_entry is not entry
+
+    fd_cache.release(entry)
+    fd_cache.release(new_entry)
+    fd_cache.close()
@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import errno
+import shutil
+import os.path
+import tempfile
+import threading
+from io import BytesIO
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+import pytest
+
+from BalancedDiscStorage import SpaceBudget
+from BalancedDiscStorage import BlobHTTPServer
+from BalancedDiscStorage import BalancedDiscStorage
+from BalancedDiscStorage import TieredBalancedDiscStorage
+from BalancedDiscStorage.http_server import parse_range
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+def serve(storage):
+    server = BlobHTTPServer(storage, ("127.0.0.1", 0))
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+@pytest.fixture
+def server():
+    server = serve(BalancedDiscStorage(tempfile.mkdtemp(dir=TEMP_DIR)))
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connection(server):
+    connection = HTTPConnection(*server.server_address)
+    yield connection
+    connection.close()
+
+
+def request(connection, method, path, body=None, headers={}):
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+
+    return response, response.read()
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 10)
+    assert parse_range("bytes=90-", 100) == (90, 10)
+    assert parse_range("bytes=-10", 100) == (90, 10)
+    assert parse_range("bytes=95-200", 100) == (95, 5)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_put_get_delete(server, connection):
+    # all requests go over the same keep-alive connection
+    response, body = request(connection, "PUT", "/", b"some data")
+    assert response.status == 201
+
+    file_hash = body.decode("ascii").strip()
+    assert response.getheader("Location") == "/" + file_hash
+    assert os.path.isfile(server.storage.file_path_from_hash(file_hash))
+
+    response, body = request(connection, "GET", "/" + file_hash)
+    assert response.status == 200
+    assert body == b"some data"
+    assert response.getheader("ETag") == '"%s"' % file_hash
+    assert "immutable" in response.getheader("Cache-Control")
+
+    response, body = request(connection, "HEAD", "/" + file_hash)
+    assert response.status == 200
+    assert response.getheader("Content-Length") == "9"
+    assert body == b""
+
+    response, body = request(connection, "DELETE", "/" + file_hash)
+    assert response.status == 204
+
+    response, body = request(connection, "GET", "/" + file_hash)
+    assert response.status == 404
+
+
+def test_range_and_conditional(server, connection):
+    file_hash = request(connection, "PUT", "/", b"0123456789")[1]
+    path = "/" + file_hash.decode("ascii").strip()
+
+    response, body = request(connection, "GET", path, headers={
+        "Range": "bytes=2-4",
+    })
+    assert response.status == 206
+    assert body == b"234"
+    assert response.getheader("Content-Range") == "bytes 2-4/10"
+
+    response, body = request(connection, "GET", path, headers={
+        "Range": "bytes=20-",
+    })
+    assert response.status == 416
+    assert response.getheader("Content-Range") == "bytes */10"
+
+    etag = response.getheader("ETag")
+    response, body = request(connection, "GET", path, headers={
+        "If-None-Match": etag,
+    })
+    assert response.status == 304
+    assert body == b""
+
+    # If-Range with different ETag sends the whole file
+    response, body = request(connection, "GET", path, headers={
+        "Range": "bytes=2-4",
+        "If-Range": '"other"',
+    })
+    assert response.status == 200
+    assert body == b"0123456789"
+
+
+def test_unknown_paths(connection):
+    assert request(connection, "GET", "/xex")[0].status == 404
+    assert request(connection, "GET", "/0_1")[0].status == 404
+    assert request(connection, "DELETE", "/0_1")[0].status == 404
+    assert request(connection, "PUT", "/0_1", b"x")[0].status == 405
+
+
+def test_put_without_space(server, connection):
+    budget = SpaceBudget(server.storage.path, refresh_interval=3600)
+    budget.min_free_bytes = budget.free_bytes - 1000
+    server.storage.space_budget = budget
+
+    response, body = request(connection, "PUT", "/", b"x" * 2000)
+    assert response.status == 507
+    assert list(server.storage.iter_paths()) == []
+
+    # passes the check of Content-Length, but the write fails
+    def add_file(file_obj):
+        raise IOError(errno.ENOSPC, "No space left on device.")
+
+    server.storage.add_file = add_file
+
+    connection = HTTPConnection(*server.server_address)
+    response, body = request(connection, "PUT", "/", b"small")
+    assert response.status == 507
+    connection.close()
+
+
+def test_get_is_single_access():
+    tiered = TieredBalancedDiscStorage(
+        fast=BalancedDiscStorage(tempfile.mkdtemp(dir=TEMP_DIR)),
+        slow=BalancedDiscStorage(tempfile.mkdtemp(dir=TEMP_DIR)),
+        fast_budget=100,
+        admission_hits=2,
+    )
+    file_hash = tiered.add_file(BytesIO(b"tiered data")).hash
+
+    server = serve(tiered)
+    connection = HTTPConnection(*server.server_address)
+    try:
+        response, body = request(connection, "GET", "/" + file_hash)
+        assert body == b"tiered data"
+        assert file_hash not in tiered._fast_objects
+
+        response, body = request(connection, "GET", "/" + file_hash)
+        assert body == b"tiered data"
+        assert file_hash in tiered._fast_objects
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()
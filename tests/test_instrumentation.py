@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import shutil
+import socket
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import StatsdExporter
+from BalancedDiscStorage import Instrumentation
+from BalancedDiscStorage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def bds():
+    bds = BalancedDiscStorage(TEMP_DIR)
+    bds.instrumentation = Instrumentation()
+
+    return bds
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_storage_is_measured(bds):
+    events = []
+    bds.instrumentation.callbacks.append(
+        lambda kind, name, value: events.append((kind, name))
+    )
+
+    path = bds.add_file(BytesIO(b"measured"))
+    bds.delete_by_hash(path.hash)
+
+    instrumentation = bds.instrumentation
+    for name in ["get_hash", "create_dir_path", "copy", "delete"]:
+        assert instrumentation.calls[name] >= 1
+
+    assert instrumentation.counters["bytes_hashed"] == 8
+    assert instrumentation.counters["bytes_written"] == 8
+    assert instrumentation.counters["listdir_calls"] >= 1
+
+    assert ("timing", "copy") in events
+    assert ("count", "bytes_written") in events
+
+
+def test_to_prometheus():
+    instrumentation = Instrumentation()
+    instrumentation.record("copy", 0.5)
+    instrumentation.count("bytes_written", 10)
+
+    text = instrumentation.to_prometheus()
+
+    assert 'bds_calls_total{op="copy"} 1' in text
+    assert 'bds_call_seconds_total{op="copy"} 0.5' in text
+    assert "bds_bytes_written_total 10" in text
+
+
+def test_statsd_exporter():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+
+    exporter = StatsdExporter(*receiver.getsockname())
+    try:
+        exporter("timing", "copy", 0.25)
+        assert receiver.recv(100) == b"bds.copy:250|ms"
+
+        exporter("count", "bytes_written", 10)
+        assert receiver.recv(100) == b"bds.bytes_written:10|c"
+    finally:
+        exporter.close()
+        receiver.close()
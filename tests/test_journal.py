@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import ChangeJournal
+from BalancedDiscStorage import JournalReader
+from BalancedDiscStorage import BalancedDiscStorageZ
+from BalancedDiscStorage import PackedBalancedDiscStorage
+from BalancedDiscStorage import ShardedBalancedDiscStorage
+
+from test_balanced_disc_storage import data_file_context
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def journal_path():
+    return os.path.join(tempfile.mkdtemp(dir=TEMP_DIR), "journal.log")
+
+
+@pytest.fixture
+def storage(journal_path):
+    storage_path = os.path.join(os.path.dirname(journal_path), "storage")
+    os.mkdir(storage_path)
+
+    storage = BalancedDiscStorageZ(storage_path)
+    storage.journal = ChangeJournal(journal_path)
+
+    return storage
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_storage_records_changes(storage):
+    path = storage.add_file(BytesIO(b"data"))
+    archive_path = storage.add_archive_as_dir(data_file_context("archive.zip"))
+    storage.delete_by_path(path)
+
+    records, cursor = storage.journal.read()
+    assert [(r.op, r.hash, r.size) for r in records] == [
+        ("add", path.hash, 4),
+        ("add", archive_path.hash, 0x12d),
+        ("del", path.hash, 4),
+    ]
+    assert records[0].path == os.path.relpath(path, storage.path)
+    assert records[1].path == os.path.relpath(archive_path, storage.path)
+
+    assert cursor == storage.journal.end()
+    assert storage.journal.read(cursor) == ([], cursor)
+
+
+def test_sharded_storage_records_changes(journal_path):
+    root = os.path.dirname(journal_path)
+    paths = [os.path.join(root, "disc_%d" % i) for i in range(3)]
+    for path in paths:
+        os.mkdir(path)
+
+    sharded = ShardedBalancedDiscStorage(paths[:2])
+    for i, shard in enumerate(sharded.shards):
+        shard.journal = ChangeJournal(journal_path + ".%d" % i, fsync=False)
+
+    added = [sharded.add_file(BytesIO(b"sharded"))]
+    added += sharded.add_files([
+        BytesIO(("sharded %d" % i).encode("ascii")) for i in range(10)
+    ])
+
+    def journaled(shard):
+        return [(r.op, r.hash) for r in shard.journal.read()[0]]
+
+    for path in added:
+        shard = sharded.shard_for_hash(path.hash)
+        assert ("add", path.hash) in journaled(shard)
+
+    # moved objects are recorded in both shards
+    new_shard = sharded._add_shard(paths[2])
+    new_shard.journal = ChangeJournal(journal_path + ".2", fsync=False)
+    moved = 0
+    for shard in sharded.shards[:2]:
+        for path in list(shard.iter_paths()):
+            if sharded.shard_for_hash(path.hash) is new_shard:
+                sharded._move_object(path, shard, new_shard)
+                assert journaled(shard)[-1] == ("del", path.hash)
+                assert journaled(new_shard)[-1] == ("add", path.hash)
+                moved += 1
+
+    assert moved
+
+
+def test_packed_files_are_recorded_by_hash(journal_path):
+    storage_path = os.path.join(os.path.dirname(journal_path), "packed")
+    os.mkdir(storage_path)
+
+    storage = PackedBalancedDiscStorage(storage_path)
+    storage.journal = ChangeJournal(journal_path, fsync=False)
+
+    packed = storage.add_file(BytesIO(b"packed"))
+    other = storage.add_file(BytesIO(b"other"))
+    large = storage.add_file(BytesIO(b"x" * storage.pack_threshold))
+    storage.delete_by_hash(packed.hash)
+    storage.delete_many([other.hash])
+
+    records, _ = storage.journal.read()
+    assert [(r.op, r.hash, r.path) for r in records] == [
+        ("add", packed.hash, os.path.join("packs", packed.hash)),
+        ("add", other.hash, os.path.join("packs", other.hash)),
+        ("add", large.hash, os.path.relpath(large, storage_path)),
+        ("del", packed.hash, os.path.join("packs", packed.hash)),
+        ("del", other.hash, os.path.join("packs", other.hash)),
+    ]
+    assert records[0].size == len(b"packed")
+
+
+def test_rotation_and_purge(journal_path):
+    journal = ChangeJournal(journal_path, fsync=False, max_segment_size=1)
+
+    for i in range(3):
+        journal.append("add", "%x_1" % i, "path")
+
+    assert journal.segments() == [1, 2, 3]
+
+    records, cursor = journal.read(limit=2)
+    assert [r.hash for r in records] == ["0_1", "1_1"]
+
+    records, cursor = journal.read(cursor)
+    assert [r.hash for r in records] == ["2_1"]
+
+    assert journal.purge(cursor) == 2
+    assert journal.segments() == [3]
+
+    # purged segments are skipped
+    records, _ = journal.read(journal.start())
+    assert [r.hash for r in records] == ["2_1"]
+
+
+def test_torn_write_is_cut_on_open(journal_path):
+    journal = ChangeJournal(journal_path, fsync=False)
+    journal.append("add", "a_1", "a")
+    journal.close()
+
+    with open(journal_path + ".000001", "ab") as segment_file:
+        segment_file.write(b"add b_1 1 ")  # crash in the middle of append
+
+    journal = ChangeJournal(journal_path, fsync=False)
+    journal.append("add", "c_1", "c")
+
+    records, _ = journal.read()
+    assert [(r.hash, r.path) for r in records] == [("a_1", "a"), ("c_1", "c")]
+
+
+def test_malformed_records_are_skipped(journal_path):
+    journal = ChangeJournal(journal_path, fsync=False)
+    journal.append("add", "a_1", "a")
+    journal._file.write(b"add b_1 x b\n\xff\xfe\n")
+    journal.append("add", "c_1", "c")
+
+    records, cursor = journal.read()
+    assert [r.hash for r in records] == ["a_1", "c_1"]
+    assert cursor == journal.end()
+
+
+def test_reader(journal_path):
+    journal = ChangeJournal(journal_path, fsync=False)
+    journal.append("add", "a_1", "a")
+    journal.append("add", "b_1", "b")
+
+    cursor_path = journal_path + ".reader"
+    reader = JournalReader(journal, cursor_path)
+    assert [r.hash for r in reader.read(1)] == ["a_1"]
+
+    # not committed, so read again
+    assert [r.hash for r in JournalReader(journal, cursor_path).read()] == [
+        "a_1",
+        "b_1",
+    ]
+
+    reader.commit()
+    assert [r.hash for r in reader.read()] == ["b_1"]
+    reader.rewind()
+    assert [r.hash for r in reader.read()] == ["b_1"]
+    assert reader.read() == []
+
+    reader.commit()
+    journal.append("del", "a_1", "a")
+    assert [r.op for r in JournalReader(journal, cursor_path).read()] == [
+        "del",
+    ]
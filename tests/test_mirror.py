@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import time
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import Mirror
+from BalancedDiscStorage import ChangeJournal
+from BalancedDiscStorage import BalancedDiscStorageZ
+from BalancedDiscStorage import PackedBalancedDiscStorage
+
+from test_balanced_disc_storage import data_file_context
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def mirrored():
+    root = tempfile.mkdtemp(dir=TEMP_DIR)
+    storage_path = os.path.join(root, "storage")
+    os.mkdir(storage_path)
+
+    storage = BalancedDiscStorageZ(storage_path)
+    storage.journal = ChangeJournal(os.path.join(root, "journal.log"))
+
+    return storage, Mirror(storage, os.path.join(root, "mirror"))
+
+
+def mirror_path(mirror, path):
+    return os.path.join(
+        mirror.target,
+        os.path.relpath(path, mirror.storage.path)
+    )
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_sync(mirrored):
+    storage, mirror = mirrored
+
+    path = storage.add_file(BytesIO(b"data"))
+    removed = storage.add_file(BytesIO(b"removed"))
+    archive_path = storage.add_archive_as_dir(data_file_context("archive.zip"))
+    storage.delete_by_hash(removed.hash)
+
+    assert mirror.sync() == 4
+    assert mirror.sync() == 0
+
+    with open(mirror_path(mirror, path), "rb") as mirrored_file:
+        assert mirrored_file.read() == b"data"
+
+    assert not os.path.exists(mirror_path(mirror, removed))
+    assert sorted(os.listdir(mirror_path(mirror, archive_path))) == [
+        "metadata.xml",
+        "some.pdf",
+    ]
+    assert os.path.exists(mirror_path(mirror, archive_path) + ".manifest")
+
+    # position in the journal is persisted
+    assert Mirror(storage, mirror.target).sync() == 0
+
+
+def test_background_sync(mirrored):
+    storage, mirror = mirrored
+
+    with mirror:
+        path = storage.add_file(BytesIO(b"background"))
+
+    assert os.path.isfile(mirror_path(mirror, path))
+
+
+def test_background_sync_survives_errors(mirrored):
+    storage, mirror = mirrored
+    mirror.interval = 0.01
+
+    apply = mirror._apply
+    failures = []
+
+    def failing_apply(rel_path, op):
+        if not failures:
+            failures.append(rel_path)
+            raise IOError("Target is not mounted.")
+
+        return apply(rel_path, op)
+
+    mirror._apply = failing_apply
+    path = storage.add_file(BytesIO(b"retried"))
+
+    mirror.start()
+    try:
+        for _ in range(500):
+            if os.path.isfile(mirror_path(mirror, path)):
+                break
+            time.sleep(0.01)
+    finally:
+        mirror.stop()
+
+    assert failures
+    assert mirror.last_error is None
+    assert os.path.isfile(mirror_path(mirror, path))
+
+
+def test_catch_up(mirrored):
+    storage, mirror = mirrored
+
+    path = storage.add_file(BytesIO(b"data"))
+    mirror.sync()
+
+    with open(mirror_path(mirror, path), "wb") as mirrored_file:
+        mirrored_file.write(b"date")
+
+    stray_path = os.path.join(mirror.target, "0", "0_1")
+    os.mkdir(os.path.dirname(stray_path))
+    with open(stray_path, "wb") as stray_file:
+        stray_file.write(b"x")
+
+    assert mirror.catch_up() == 1
+    assert not os.path.exists(stray_path)
+    assert mirror.catch_up(checksum=True) == 1
+
+    with open(mirror_path(mirror, path), "rb") as mirrored_file:
+        assert mirrored_file.read() == b"data"
+
+    assert mirror.catch_up(checksum=True) == 0
+
+
+def test_packed_files():
+    root = tempfile.mkdtemp(dir=TEMP_DIR)
+    storage_path = os.path.join(root, "packed")
+    os.mkdir(storage_path)
+
+    storage = PackedBalancedDiscStorage(storage_path)
+    storage.journal = ChangeJournal(os.path.join(root, "packed.log"))
+    mirror = Mirror(storage, os.path.join(root, "packed_mirror"))
+
+    packed = storage.add_file(BytesIO(b"packed"))
+    removed = storage.add_file(BytesIO(b"removed"))
+    storage.delete_by_hash(removed.hash)
+
+    assert mirror.sync() == 3
+
+    # stored as ordinary file in the target
+    mirrored_path = mirror.target_storage.file_path_from_hash(packed.hash)
+    with open(mirrored_path, "rb") as mirrored_file:
+        assert mirrored_file.read() == b"packed"
+
+    with pytest.raises(IOError):
+        mirror.target_storage.file_path_from_hash(removed.hash)
+
+    assert mirror.catch_up(checksum=True) == 0
+
+    # missing copy is restored, stale copy is removed
+    mirror.target_storage.delete_by_hash(packed.hash)
+    mirror.target_storage.add_file(BytesIO(b"stale"))
+    assert mirror.catch_up() == 2
+    assert [p.hash for p in mirror.target_storage.iter_paths()] == [
+        packed.hash
+    ]
@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+
+import pytest
+
+from BalancedDiscStorage import ObjectReader
+
+from test_balanced_disc_storage import data_dir_context
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def fd():
+    fd = os.open(data_dir_context("sum_founder.py"), os.O_RDONLY)
+    yield fd
+    os.close(fd)
+
+
+# Tests =======================================================================
+def test_read(fd):
+    with open(data_dir_context("sum_founder.py"), "rb") as f:
+        data = f.read()
+
+    reader = ObjectReader(fd, 10, 20)
+
+    assert reader.read(5) == data[10:15]
+    assert reader.tell() == 5
+    assert reader.read() == data[15:30]
+    assert reader.read() == b""
+
+    reader.seek(-3, os.SEEK_END)
+    assert reader.read() == data[27:30]
+
+
+def test_close(fd):
+    closed = []
+    reader = ObjectReader(fd, 0, 10, on_close=lambda: closed.append(True))
+
+    with reader:
+        pass
+
+    reader.close()
+    assert closed == [True]
+
+    with pytest.raises(ValueError):
+        reader.read()
@@ -0,0 +1,136 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import socket
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import PackedBalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def pbds():
+    pbds = PackedBalancedDiscStorage(TEMP_DIR)
+    pbds.segment_size = 100
+
+    return pbds
+
+
+@pytest.fixture
+def contents():
+    return [("small %d" % i).encode("ascii") for i in range(30)]
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_add_small_files(pbds, contents):
+    for content in contents:
+        path = pbds.add_file(BytesIO(content))
+
+        assert path.startswith(pbds.pack_path)
+        assert path.length == len(content)
+
+    # packed files are not in the tree
+    assert sorted(os.listdir(TEMP_DIR)) == ["packs"]
+    assert len(os.listdir(pbds.pack_path)) > 2
+
+
+def test_read_packed_files(pbds, contents):
+    for content in contents:
+        file_hash = pbds._get_hash(BytesIO(content))
+
+        with pbds.open_by_hash(file_hash) as reader:
+            assert reader.read() == content
+
+        assert pbds.read_range(file_hash, 2, 3) == content[2:5]
+
+
+def test_send_packed_file(pbds, contents):
+    file_hash = pbds._get_hash(BytesIO(contents[0]))
+    sender, receiver = socket.socketpair()
+
+    try:
+        assert pbds.send_to_socket(file_hash, sender) == len(contents[0])
+        assert receiver.recv(100) == contents[0]
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_large_file_is_not_packed(pbds):
+    path = pbds.add_file(BytesIO(b"x" * pbds.pack_threshold))
+
+    assert path.offset is None
+    assert os.path.isfile(path)
+
+    pbds.delete_by_hash(path.hash)
+
+
+def test_index_is_persistent(pbds, contents):
+    assert len(list(pbds.iter_paths())) == len(contents)
+
+
+def test_delete_and_compact(pbds, contents):
+    hashes = [pbds._get_hash(BytesIO(content)) for content in contents]
+
+    for file_hash in hashes[:20]:
+        pbds.delete_by_hash(file_hash)
+
+    with pytest.raises(IOError):
+        pbds.file_path_from_hash(hashes[0])
+
+    assert pbds.compact() > 0
+
+    reopened = PackedBalancedDiscStorage(TEMP_DIR)
+    for file_hash, content in zip(hashes[20:], contents[20:]):
+        assert reopened.read_range(file_hash, 0, 100) == content
+
+    assert len(list(reopened.iter_paths())) == 10
+
+
+def test_dead_space_survives_reopen(pbds, contents):
+    def dead_space(storage):
+        return dict((id, seg.dead) for id, seg in storage._segments.items())
+
+    dead_before = sum(dead_space(pbds).values())
+    for content in contents[:20]:
+        pbds.delete_by_hash(pbds.add_file(BytesIO(content)).hash)
+
+    pbds.compact(min_dead_ratio=2)  # only rewrites the index
+
+    dead = dead_space(pbds)
+    assert sum(dead.values()) - dead_before == len(b"".join(contents[:20]))
+    assert dead_space(PackedBalancedDiscStorage(TEMP_DIR)) == dead
+
+
+def test_delete_many(pbds, contents):
+    hashes = [pbds._get_hash(BytesIO(content)) for content in contents[20:]]
+
+    large = pbds.add_file(BytesIO(b"x" * pbds.pack_threshold))
+
+    assert pbds.delete_many(hashes + [large.hash]) == len(hashes) + 1
+    assert list(pbds.iter_paths()) == []
+    assert sorted(os.listdir(TEMP_DIR)) == ["packs"]
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import Rebalancer
+from BalancedDiscStorage import ChangeJournal
+from BalancedDiscStorage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def bds():
+    return BalancedDiscStorage(TEMP_DIR)
+
+
+@pytest.fixture
+def contents():
+    return [("content %d" % i).encode("ascii") for i in range(100)]
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_rebalance(bds, contents):
+    hashes = [bds.add_file(BytesIO(content)).hash for content in contents]
+
+    bds.dir_limit = 3
+    moved = Rebalancer(bds, max_moves_per_second=10000).run()
+    assert moved > 0
+
+    # subdirectories may overflow the limit, files not
+    for dir_path, dir_names, file_names in os.walk(TEMP_DIR):
+        assert len(file_names) <= bds.dir_limit
+
+    for file_hash, content in zip(hashes, contents):
+        with open(bds.file_path_from_hash(file_hash), "rb") as f:
+            assert f.read() == content
+
+
+def test_rebalance_balanced_storage(bds):
+    assert Rebalancer(bds).run() == 0
+
+
+def test_moves_are_journaled(contents):
+    storage_path = tempfile.mkdtemp(dir=TEMP_DIR)
+    bds = BalancedDiscStorage(storage_path)
+    paths = [bds.add_file(BytesIO(content)) for content in contents]
+
+    bds.journal = ChangeJournal(os.path.join(TEMP_DIR, "journal.log"))
+    bds.dir_limit = 3
+    assert Rebalancer(bds, processes=1).run() > 0
+
+    records, _ = bds.journal.read()
+    for added, deleted in zip(records[::2], records[1::2]):
+        assert (added.op, deleted.op) == ("add", "del")
+        assert added.hash == deleted.hash
+
+    added_paths = set(r.path for r in records if r.op == "add")
+    for path in paths:
+        new_path = bds.file_path_from_hash(path.hash)
+        if new_path != path:
+            assert os.path.relpath(new_path, storage_path) in added_paths
@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import RefCounter
+from BalancedDiscStorage import BalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def counts_path():
+    return os.path.join(TEMP_DIR, "refcounts.json")
+
+
+@pytest.fixture
+def bds(counts_path):
+    storage_path = os.path.join(TEMP_DIR, "storage")
+    if not os.path.exists(storage_path):
+        os.mkdir(storage_path)
+
+    bds = BalancedDiscStorage(storage_path)
+    bds.ref_counter = RefCounter(counts_path)
+
+    return bds
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_counts(counts_path):
+    ref_counter = RefCounter(counts_path, flush_every=2)
+
+    assert ref_counter.increment("a") == 1
+    assert ref_counter.increment("a") == 2
+    assert os.path.exists(counts_path)
+
+    assert ref_counter.decrement("a") == 1
+    assert ref_counter.release_many(["a", "b"]) == ["a", "b"]
+    assert ref_counter.get("a") == 0
+
+    ref_counter.increment("c")
+    ref_counter.close()
+
+    assert RefCounter(counts_path).get("c") == 1
+
+    ref_counter.discard(["c"])
+    ref_counter.close()
+    assert RefCounter(counts_path).get("c") == 0
+
+
+def test_delta_log(counts_path):
+    counts_path += ".delta"
+    ref_counter = RefCounter(counts_path, flush_every=3)
+
+    for file_hash in "abcdef":
+        ref_counter.increment(file_hash)
+
+    ref_counter.increment("b")
+    ref_counter.close()
+
+    log_paths = [
+        fn for fn in os.listdir(TEMP_DIR)
+        if fn.startswith(os.path.basename(counts_path) + ".log.")
+    ]
+    assert len(log_paths) == 1
+
+    # torn write of the last record
+    with open(os.path.join(TEMP_DIR, log_paths[0]), "a") as log_file:
+        log_file.write("f")
+
+    reopened = RefCounter(counts_path)
+    assert reopened.get("a") == 1
+    assert reopened.get("b") == 2
+    assert reopened.get("f") == 1
+    assert reopened._counts == ref_counter._counts
+
+
+def test_delete_removes_last_reference(bds):
+    path = bds.add_file(BytesIO(b"shared"))
+    bds.add_file(BytesIO(b"shared"))
+
+    bds.delete_by_hash(path.hash)
+    assert os.path.isfile(path)
+
+    bds.delete_by_hash(path.hash)
+    assert not os.path.exists(path)
+
+
+def test_delete_many(bds):
+    shared = bds.add_file(BytesIO(b"shared"))
+    bds.add_file(BytesIO(b"shared"))
+    single = bds.add_file(BytesIO(b"single"))
+
+    assert bds.delete_many([shared.hash, single.hash]) == 1
+    assert os.path.isfile(shared)
+    assert not os.path.exists(single)
+
+    # gc ignores the references
+    assert bds.gc(keep_set=set()) == 1
+    assert bds.ref_counter.get(shared.hash) == 0
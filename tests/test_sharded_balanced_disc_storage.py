@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import ShardedBalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def roots():
+    return [os.path.join(TEMP_DIR, "disc_%d" % i) for i in range(5)]
+
+
+@pytest.fixture
+def sbds(roots):
+    return ShardedBalancedDiscStorage(roots[:2])
+
+
+@pytest.fixture
+def contents():
+    return [("content %d" % i).encode("ascii") for i in range(40)]
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+    for i in range(5):
+        os.mkdir(os.path.join(TEMP_DIR, "disc_%d" % i))
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_init():
+    with pytest.raises(ValueError):
+        ShardedBalancedDiscStorage([])
+
+
+def test_add_file(sbds):
+    path = sbds.add_file(BytesIO(b"hello"))
+
+    owner = sbds.shard_for_hash(path.hash)
+    assert path.startswith(owner.path)
+    assert os.path.isfile(path)
+
+    assert sbds.file_path_from_hash(path.hash) == path
+
+    sbds.delete_by_hash(path.hash)
+    assert not os.path.exists(path)
+
+    with pytest.raises(IOError):
+        sbds.file_path_from_hash(path.hash)
+
+
+def test_add_files(sbds, contents):
+    paths = sbds.add_files([BytesIO(content) for content in contents])
+
+    for content, path in zip(contents, paths):
+        with open(path, "rb") as f:
+            assert f.read() == content
+
+    # both shards are used
+    used = set(sbds.shard_for_hash(path.hash).path for path in paths)
+    assert len(used) == 2
+
+
+def test_add_root(sbds, roots, contents):
+    hashes = set(path.hash for path in sbds.iter_paths())
+    assert len(hashes) == len(contents)
+
+    moved = sbds.add_root(roots[2])
+
+    assert 0 < moved < len(contents)
+    assert set(path.hash for path in sbds.iter_paths()) == hashes
+
+    for file_hash in hashes:
+        owner = sbds.shard_for_hash(file_hash)
+        assert sbds.file_path_from_hash(file_hash).startswith(owner.path)
+
+
+def test_add_root_moves_complete_copies(roots):
+    sbds = ShardedBalancedDiscStorage(roots[3:4])
+    hashes = [
+        sbds.add_file(BytesIO(("moved %d" % i).encode("ascii"))).hash
+        for i in range(20)
+    ]
+    for file_hash in hashes:
+        sbds.shards[0].read_range(file_hash, 0, 1)  # fill the fd cache
+
+    sbds.add_root(roots[4])
+
+    for i, file_hash in enumerate(hashes):
+        with open(sbds.file_path_from_hash(file_hash), "rb") as f:
+            assert f.read() == ("moved %d" % i).encode("ascii")
+
+    assert len(sbds.shards[0].fd_cache) == len([
+        file_hash for file_hash in hashes
+        if sbds.shard_for_hash(file_hash) is sbds.shards[0]
+    ])
+
+    for root in roots[3:5]:
+        for dir_path, dir_names, file_names in os.walk(root):
+            assert not [fn for fn in file_names if fn.endswith(".bds_tmp")]
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import errno
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+from collections import namedtuple
+
+import pytest
+
+from BalancedDiscStorage import SpaceBudget
+from BalancedDiscStorage import BalancedDiscStorage
+from BalancedDiscStorage import BalancedDiscStorageZ
+from BalancedDiscStorage import TieredBalancedDiscStorage
+from BalancedDiscStorage import ShardedBalancedDiscStorage
+
+from test_balanced_disc_storage import data_file_context
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+StatVFS = namedtuple("StatVFS", "f_frsize f_bsize f_bavail f_favail")
+
+
+# Fixtures ====================================================================
+@pytest.fixture
+def fake_statvfs(monkeypatch):
+    stat = {"blocks": 10, "inodes": 10}
+
+    monkeypatch.setattr(
+        os,
+        "statvfs",
+        lambda path: StatVFS(100, 100, stat["blocks"], stat["inodes"])
+    )
+
+    return stat
+
+
+@pytest.fixture
+def bdsz():
+    return BalancedDiscStorageZ(tempfile.mkdtemp(dir=TEMP_DIR))
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_reserve(fake_statvfs):
+    budget = SpaceBudget(TEMP_DIR, min_free_bytes=100, refresh_interval=60)
+    assert budget.available() == (900, 10)
+
+    with budget.reserve(150, 2) as reservation:
+        assert reservation.size == 200  # whole blocks
+        assert budget.available() == (700, 8)
+
+        with pytest.raises(IOError) as exc_info:
+            budget.reserve(701)
+
+        assert exc_info.value.errno == errno.ENOSPC
+
+    # used space is counted until the refresh
+    assert budget.available() == (700, 8)
+
+    fake_statvfs["blocks"] = 5
+    budget.refresh()
+    assert budget.available() == (400, 10)
+
+    with pytest.raises(IOError):
+        budget.reserve(1, 11)
+
+
+def test_failed_write_returns_space(fake_statvfs):
+    budget = SpaceBudget(TEMP_DIR)
+
+    with pytest.raises(ValueError):
+        with budget.reserve(500):
+            raise ValueError("write failed")
+
+    assert budget.available() == (1000, 10)
+
+
+def test_storage_rejects_before_hashing(fake_statvfs, bdsz):
+    bdsz.space_budget = SpaceBudget(bdsz.path)
+
+    path = bdsz.add_file(BytesIO(b"fits"))
+    assert os.path.isfile(path)
+
+    def get_hash(file_obj):
+        raise AssertionError("File shouldn't be hashed.")
+
+    bdsz._get_hash = get_hash
+
+    with pytest.raises(IOError) as exc_info:
+        bdsz.add_file(BytesIO(b"x" * 2000))
+
+    assert exc_info.value.errno == errno.ENOSPC
+
+
+def test_archive_needs_inodes(fake_statvfs, bdsz):
+    bdsz.space_budget = SpaceBudget(bdsz.path)
+
+    fake_statvfs["inodes"] = 3
+    bdsz.space_budget.refresh()
+
+    with pytest.raises(IOError):
+        bdsz.add_archive_as_dir(data_file_context("archive.zip"))
+
+    assert os.listdir(bdsz.path) == []
+
+    fake_statvfs["inodes"] = 10
+    fake_statvfs["blocks"] = 1000
+    bdsz.space_budget.refresh()
+
+    assert os.path.isdir(
+        bdsz.add_archive_as_dir(data_file_context("archive.zip"))
+    )
+
+
+def test_wrappers_reserve_space(fake_statvfs):
+    sharded = ShardedBalancedDiscStorage([
+        tempfile.mkdtemp(dir=TEMP_DIR) for _ in range(2)
+    ])
+    for shard in sharded.shards:
+        shard.space_budget = SpaceBudget(shard.path)
+
+    with pytest.raises(IOError) as exc_info:
+        sharded.add_files([BytesIO(b"x" * 2000)])
+
+    assert exc_info.value.errno == errno.ENOSPC
+    assert list(sharded.iter_paths()) == []
+
+    tiered = TieredBalancedDiscStorage(
+        fast=BalancedDiscStorage(tempfile.mkdtemp(dir=TEMP_DIR)),
+        slow=BalancedDiscStorage(tempfile.mkdtemp(dir=TEMP_DIR)),
+        fast_budget=10000,
+        admission_hits=1,
+    )
+    tiered.fast.space_budget = SpaceBudget(tiered.fast.path)
+
+    # promotion doesn't fit, file is served from the slow tier
+    path = tiered.add_file(BytesIO(b"x" * 2000))
+    assert tiered.file_path_from_hash(path.hash).tier == "slow"
+    assert list(tiered.fast.iter_paths()) == []
@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interpreter version: python 2.7
+#
+# Imports =====================================================================
+import os
+import shutil
+import os.path
+import tempfile
+from io import BytesIO
+
+import pytest
+
+from BalancedDiscStorage import RefCounter
+from BalancedDiscStorage import BalancedDiscStorage
+from BalancedDiscStorage import TieredBalancedDiscStorage
+
+
+# Variables ===================================================================
+TEMP_DIR = None
+
+
+# Fixtures ====================================================================
+def make_tiered(name, fast_budget=100, **kwargs):
+    paths = []
+    for tier in ("fast", "slow"):
+        path = os.path.join(TEMP_DIR, name, tier)
+        os.makedirs(path)
+        paths.append(path)
+
+    return TieredBalancedDiscStorage(
+        fast=BalancedDiscStorage(paths[0]),
+        slow=BalancedDiscStorage(paths[1]),
+        fast_budget=fast_budget,
+        **kwargs
+    )
+
+
+# Setup =======================================================================
+def setup_module():
+    global TEMP_DIR
+
+    TEMP_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(TEMP_DIR)
+
+
+# Tests =======================================================================
+def test_promotion():
+    tiered = make_tiered("promotion")
+
+    path = tiered.add_file(BytesIO(b"data"))
+    assert path.tier == "slow"
+
+    assert tiered.file_path_from_hash(path.hash).tier == "slow"
+
+    fast_path = tiered.file_path_from_hash(path.hash)
+    assert fast_path.tier == "fast"
+    assert fast_path.startswith(tiered.fast.path)
+    assert tiered.read_range(path.hash, 1, 2) == b"at"
+
+    with tiered.open_by_hash(path.hash) as reader:
+        assert reader.read() == b"data"
+
+
+def test_eviction_keeps_budget():
+    tiered = make_tiered("eviction", fast_budget=10, write_tier="fast")
+
+    first = tiered.add_file(BytesIO(b"123456"))
+    assert first.tier == "fast"
+
+    second = tiered.add_file(BytesIO(b"abcdef"))
+
+    # first file was demoted to the slow tier
+    assert tiered.fast.file_path_from_hash(second.hash)
+    with pytest.raises(IOError):
+        tiered.fast.file_path_from_hash(first.hash)
+
+    assert tiered.slow.read_range(first.hash, 0, 6) == b"123456"
+    assert tiered.read_range(first.hash, 0, 6) == b"123456"
+
+
+def test_copies_are_made_outside_of_lock():
+    tiered = make_tiered("unlocked", fast_budget=10, write_tier="fast")
+    copied = []
+
+    def checked(write_file):
+        def write(file_obj, file_hash):
+            assert tiered._lock.acquire(False)
+            tiered._lock.release()
+            copied.append(file_hash)
+
+            return write_file(file_obj, file_hash)
+
+        return write
+
+    tiered.fast._write_file = checked(tiered.fast._write_file)
+    tiered.slow._write_file = checked(tiered.slow._write_file)
+
+    first = tiered.add_file(BytesIO(b"123456"))
+    second = tiered.add_file(BytesIO(b"abcdef"))  # demotes the first
+
+    assert copied == [first.hash, first.hash, second.hash]
+    assert tiered._fast_size == 6
+    assert not tiered._copying and not tiered._evicting
+
+
+def test_write_both_and_delete():
+    tiered = make_tiered("both", write_tier="both")
+
+    path = tiered.add_file(BytesIO(b"both"))
+    assert tiered.file_path_from_hash(path.hash).tier == "fast"
+    assert tiered.slow.file_path_from_hash(path.hash)
+
+    tiered.delete_by_hash(path.hash)
+
+    with pytest.raises(IOError):
+        tiered.file_path_from_hash(path.hash)
+
+    with pytest.raises(IOError):
+        tiered.delete_by_hash(path.hash)
+
+
+def test_references_follow_the_file():
+    tiered = make_tiered("references", fast_budget=10, write_tier="fast")
+    for tier in (tiered.fast, tiered.slow):
+        tier.ref_counter = RefCounter(tier.path + ".refs")
+
+    # still in the fast tier
+    shared = tiered.add_file(BytesIO(b"shared"))
+    tiered.add_file(BytesIO(b"shared"))
+
+    tiered.delete_by_hash(shared.hash)
+    assert tiered.file_path_from_hash(shared.hash).tier == "fast"
+
+    tiered.delete_by_hash(shared.hash)
+    with pytest.raises(IOError):
+        tiered.file_path_from_hash(shared.hash)
+
+    # evicted to the slow tier together with the references
+    evicted = tiered.add_file(BytesIO(b"evicted"))
+    tiered.add_file(BytesIO(b"evicted"))
+    tiered.add_file(BytesIO(b"other"))
+
+    assert tiered.slow.ref_counter.get(evicted.hash) == 2
+    assert tiered.fast.ref_counter.get(evicted.hash) == 0
+
+    tiered.delete_by_hash(evicted.hash)
+    assert tiered.read_range(evicted.hash, 0, 7) == b"evicted"
+
+    tiered.delete_by_hash(evicted.hash)
+    with pytest.raises(IOError):
+        tiered.file_path_from_hash(evicted.hash)
+
+
+def test_index_is_loaded_from_fast_tier():
+    tiered = make_tiered("reload", write_tier="fast")
+    path = tiered.add_file(BytesIO(b"reload"))
+
+    reopened = TieredBalancedDiscStorage(tiered.fast, tiered.slow, 100)
+    assert reopened.file_path_from_hash(path.hash).tier == "fast"
+    assert [p.hash for p in reopened.iter_paths()] == [path.hash]